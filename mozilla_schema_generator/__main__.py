@@ -4,26 +4,36 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import cProfile
 import json
+import logging
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
+from typing import Dict, List
 
 import click
 import yaml
 
-from . import subset_pings
+from . import counters, output, pipeline, profiling, subset_pings
 from .bhr_ping import BhrPing
 from .common_ping import CommonPing
 from .config import Config
 from .glean_ping import GleanPing
+from .incremental import IncrementalGleanPing
 from .main_ping import MainPing
-from .schema import SchemaEncoder
+from .manifest import InputManifest, fingerprint
+from .output import SchemaWriter, write_changed_files
+from .schema import Schema, SchemaEncoder, SchemaException, json_dump_args
 
 ROOT_DIR = Path(__file__).parent
 CONFIGS_DIR = ROOT_DIR / "configs"
 SCHEMA_NAME_RE = re.compile(r".+/([a-zA-Z0-9_-]+)\.([0-9]+)\.schema\.json")
 
+logger = logging.getLogger(__name__)
+
 
 def _apply_options(func, options):
     """Apply options to a command."""
@@ -69,6 +79,61 @@ def common_options(func):
     )
 
 
+def manifest_option(func):
+    """Option for skipping schemas whose inputs are unchanged."""
+    return click.option(
+        "--manifest",
+        help=(
+            "If specified, a manifest of the fingerprints of the inputs of "
+            "every generated schema. Schemas whose inputs did not change "
+            "since the previous run are not generated again. "
+            "Only used together with --out-dir."
+        ),
+        type=click.Path(dir_okay=False, file_okay=True, writable=True),
+        required=False,
+    )(func)
+
+
+def changed_files_option(func):
+    """Option for reporting the files that changed."""
+    return click.option(
+        "--changed-files",
+        help=(
+            "If specified, a file to write the paths of the files that changed "
+            "to, one per line. Files whose content is unchanged are not written."
+        ),
+        type=click.Path(dir_okay=False, file_okay=True, writable=True),
+        required=False,
+    )(func)
+
+
+def ndjson_option(func):
+    """Option for streaming the schemas to stdout one at a time."""
+    return click.option(
+        "--ndjson",
+        is_flag=True,
+        help=(
+            "If specified without --out-dir, writes one "
+            '{"app", "ping", "version", "schema"} record per line to stdout '
+            "as soon as each schema is generated, instead of a single JSON "
+            "document at the end."
+        ),
+    )(func)
+
+
+def _check_ndjson(ndjson, out_dir, pretty):
+    if ndjson and out_dir:
+        raise click.UsageError("--ndjson can not be used together with --out-dir.")
+    if ndjson and pretty:
+        raise click.UsageError("--ndjson can not be used together with --pretty.")
+
+
+def _load_manifest(manifest, out_dir):
+    if manifest is None or not out_dir:
+        return None
+    return InputManifest(manifest)
+
+
 @click.command()
 @click.argument(
     "config",
@@ -76,30 +141,80 @@ def common_options(func):
     default=CONFIGS_DIR / "main.yaml",
 )
 @common_options
-def generate_main_ping(config, out_dir, pretty, mps_branch):
+@manifest_option
+@changed_files_option
+@ndjson_option
+def generate_main_ping(
+    config, out_dir, pretty, mps_branch, manifest, changed_files, ndjson
+):
+    _check_ndjson(ndjson, out_dir, pretty)
     schema_generator = MainPing(mps_branch=mps_branch)
     if out_dir:
         out_dir = Path(out_dir)
+    manifest = _load_manifest(manifest, out_dir)
+
+    if manifest is not None:
+        key = "main.4"
+        input_fingerprint = fingerprint(
+            urls=schema_generator.get_input_urls(), files=[config], values=[pretty]
+        )
+        if manifest.is_current(key, input_fingerprint):
+            logger.info("Inputs of the main ping are unchanged, skipping")
+            return
 
     with open(config, "r") as f:
         config_data = yaml.safe_load(f)
 
-    config = Config("main", config_data)
-    schemas = schema_generator.generate_schema(config)
-    # schemas introduces an extra layer to the actual schema
-    dump_schema(schemas, out_dir, pretty, version=4)
+    schemas = _generate_main_ping(config_data, mps_branch)
+    with SchemaWriter(json_dump_args(pretty)) as writer:
+        # schemas introduces an extra layer to the actual schema
+        written = dump_schema(
+            schemas,
+            out_dir,
+            pretty,
+            version=4,
+            writer=writer,
+            ndjson=ndjson,
+            app="telemetry",
+        )
+    write_changed_files(changed_files, writer.changed)
+
+    if manifest is not None:
+        manifest.update(key, input_fingerprint, written)
+        manifest.save()
 
 
 @click.command()
 @common_options
-def generate_bhr_ping(out_dir, pretty, mps_branch):
-    schema_generator = BhrPing(mps_branch=mps_branch)
+@changed_files_option
+@ndjson_option
+def generate_bhr_ping(out_dir, pretty, mps_branch, changed_files, ndjson):
+    _check_ndjson(ndjson, out_dir, pretty)
     if out_dir:
         out_dir = Path(out_dir)
 
-    config = Config("bhr", {})
-    schemas = schema_generator.generate_schema(config)
-    dump_schema(schemas, out_dir, pretty, version=4)
+    schemas = _generate_bhr_ping(mps_branch)
+    with SchemaWriter(json_dump_args(pretty)) as writer:
+        dump_schema(
+            schemas,
+            out_dir,
+            pretty,
+            version=4,
+            writer=writer,
+            ndjson=ndjson,
+            app="telemetry",
+        )
+    write_changed_files(changed_files, writer.changed)
+
+
+def _generate_main_ping(config_data, mps_branch):
+    schema_generator = MainPing(mps_branch=mps_branch)
+    return schema_generator.generate_schema(Config("main", config_data))
+
+
+def _generate_bhr_ping(mps_branch):
+    schema_generator = BhrPing(mps_branch=mps_branch)
+    return schema_generator.generate_schema(Config("bhr", {}))
 
 
 @click.command()
@@ -117,32 +232,165 @@ def generate_bhr_ping(out_dir, pretty, mps_branch):
         "of pings in the common ping format."
     ),
 )
-def generate_common_pings(config_dir, out_dir, pretty, mps_branch, common_pings_config):
+@manifest_option
+@click.option(
+    "--workers",
+    help=(
+        "The number of worker processes to generate the common pings on. "
+        "By default, pings are generated in the main process."
+    ),
+    type=click.IntRange(min=1),
+    required=False,
+)
+@changed_files_option
+@ndjson_option
+def generate_common_pings(
+    config_dir,
+    out_dir,
+    pretty,
+    mps_branch,
+    common_pings_config,
+    manifest,
+    workers,
+    changed_files,
+    ndjson,
+):
+    _check_ndjson(ndjson, out_dir, pretty)
     if out_dir:
         out_dir = Path(out_dir)
+    manifest = _load_manifest(manifest, out_dir)
+
+    units = []
+    for schema_url, name, version, config_data, config_files in _load_common_pings(
+        common_pings_config, config_dir
+    ):
+        schema_generator = CommonPing(schema_url, mps_branch=mps_branch)
+
+        key = f"{name}.{version}"
+        input_fingerprint = None
+        if manifest is not None:
+            input_fingerprint = fingerprint(
+                urls=schema_generator.get_input_urls(Config(name, config_data)),
+                files=config_files,
+                values=[pretty],
+            )
+            if manifest.is_current(key, input_fingerprint):
+                logger.info(f"Inputs of {key} are unchanged, skipping")
+                continue
+
+        units.append(
+            (
+                schema_url,
+                name,
+                version,
+                config_data,
+                key,
+                input_fingerprint,
+            )
+        )
+
+    def write(unit, schemas):
+        _, _, version, _, key, input_fingerprint = unit
+        written = dump_schema(
+            schemas,
+            out_dir,
+            pretty,
+            version=int(version),
+            writer=writer,
+            ndjson=ndjson,
+            app="telemetry",
+        )
 
-    common_pings = []
+        if manifest is not None:
+            manifest.update(key, input_fingerprint, written)
+
+    with SchemaWriter(json_dump_args(pretty)) as writer:
+        if workers is not None and workers > 1 and len(units) > 1:
+            shared_inputs = _preload_common_pings(
+                [(schema_url, name, data) for schema_url, name, _, data, _, _ in units],
+                mps_branch,
+            )
 
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(units)),
+                initializer=CommonPing.set_shared_inputs,
+                initargs=shared_inputs,
+            ) as executor:
+                futures = {}
+                for unit in units:
+                    schema_url, name, _, config_data, _, _ = unit
+                    future = executor.submit(
+                        profiling.wrap(_generate_common_ping),
+                        schema_url,
+                        name,
+                        config_data,
+                        mps_branch,
+                    )
+                    futures[future] = unit
+
+                # Write each ping as soon as it is generated
+                for future in as_completed(futures):
+                    write(futures[future], profiling.unwrap(future.result()))
+        else:
+            for unit in units:
+                schema_url, name, _, config_data, _, _ = unit
+                write(
+                    unit,
+                    _generate_common_ping(schema_url, name, config_data, mps_branch),
+                )
+
+    write_changed_files(changed_files, writer.changed)
+    if manifest is not None:
+        manifest.save()
+
+
+def _load_common_pings(common_pings_config, config_dir):
+    """Read the common pings config.
+
+    Returns the schema url, name, version, config and config files of each ping.
+    """
     with open(common_pings_config, "r") as f:
         common_pings = json.load(f)
 
+    result = []
     for common_ping in common_pings:
-        schema_generator = CommonPing(common_ping["schema_url"], mps_branch=mps_branch)
-
         config_data = {}
-
+        config_files = []
         if "config" in common_ping:
-            with open(config_dir / common_ping["config"], "r") as f:
-                config_data = yaml.safe_load(f)
+            config_files.append(Path(config_dir) / common_ping["config"])
 
-        m = re.match(SCHEMA_NAME_RE, common_ping["schema_url"])
+        schema_url = CommonPing.with_schemas_base_url(common_ping["schema_url"])
+        m = re.match(SCHEMA_NAME_RE, schema_url)
         name = m.group(1)
         version = m.group(2)
-        config = Config(name, config_data)
 
-        schemas = schema_generator.generate_schema(config)
+        for config_file in config_files:
+            with open(config_file, "r") as f:
+                config_data = yaml.safe_load(f)
+
+        result.append((schema_url, name, version, config_data, config_files))
+    return result
+
+
+def _preload_common_pings(pings, mps_branch):
+    """Load the inputs shared by all common pings once, to hand them to every
+    worker instead of loading them in each. Returns the arguments of
+    `CommonPing.set_shared_inputs`.
 
-        dump_schema(schemas, out_dir, pretty, version=int(version))
+    The probes are only needed by pings with matchers.
+    """
+    if not pings:
+        return CommonPing.get_shared_inputs()
+    schema_generator = CommonPing(pings[0][0], mps_branch=mps_branch)
+    schema_generator.get_env()
+    if any(Config(name, data).matchers for _, name, data in pings):
+        schema_generator.get_probes()
+    return CommonPing.get_shared_inputs()
+
+
+def _generate_common_ping(schema_url, name, config_data, mps_branch):
+    schema_generator = CommonPing(schema_url, mps_branch=mps_branch)
+    return schema_generator.generate_schema(Config(name, config_data))
 
 
 @click.command()
@@ -171,53 +419,81 @@ def generate_common_pings(config_dir, out_dir, pretty, mps_branch, common_pings_
         "every application's glean pings."
     ),
 )
-def generate_glean_pings(config, out_dir, pretty, mps_branch, repo, generic_schema):
+@manifest_option
+@click.option(
+    "--incremental-state",
+    help=(
+        "If specified, a directory with the state of the previous generation "
+        "of each app. Only the metrics that changed since are matched, and "
+        "patched into the previously generated schemas."
+    ),
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    required=False,
+)
+@click.option(
+    "--ping-workers",
+    help=(
+        "The number of worker processes to generate the pings of each app on. "
+        "By default, pings are generated in the main process."
+    ),
+    type=click.IntRange(min=1),
+    required=False,
+)
+@changed_files_option
+@ndjson_option
+def generate_glean_pings(
+    config,
+    out_dir,
+    pretty,
+    mps_branch,
+    repo,
+    generic_schema,
+    manifest,
+    incremental_state,
+    ping_workers,
+    changed_files,
+    ndjson,
+):
+    _check_ndjson(ndjson, out_dir, pretty)
     if out_dir:
         out_dir = Path(out_dir)
-
-    repos = GleanPing.get_repos()
+    manifest = _load_manifest(manifest, out_dir)
 
     if repo is not None:
-        repos = [r for r in repos if r["app_id"] == repo]
+        repo = GleanPing.get_repository_catalog().get_repo(repo)
+        repos = [repo] if repo is not None else []
+    else:
+        repos = GleanPing.get_repos()
 
     with open(config, "r") as f:
         config_data = yaml.safe_load(f)
     glean_config = Config("glean", config_data)
 
-    with open(CONFIGS_DIR / "glean_v2_allowlist.yaml", "r") as f:
-        v2_allowlist = yaml.safe_load(f)
+    v2_allowlist, v1_overwrite_allowlist = _load_glean_allowlists()
+    _check_glean_config(repos[0], config_data, config, mps_branch)
 
-    with open(CONFIGS_DIR / "glean_v1_overwrite_allowlist.yaml", "r") as f:
-        v1_overwrite_allowlist = yaml.safe_load(f) or []
-
-    # validate that the config has mappings for every single metric type specified in the
-    # Glean schema (see: https://bugzilla.mozilla.org/show_bug.cgi?id=1739239)
-    glean_schema = GleanPing(repos[0], mps_branch=mps_branch).get_schema()
-    glean_matched_metrics_in_config = set(config_data["metrics"].keys())
-    glean_metrics_in_schema = set(
-        glean_schema.get(["properties", "metrics", "properties"]).keys()
-    )
-    new_unmatched_glean_types = (
-        glean_metrics_in_schema - glean_matched_metrics_in_config
-    )
-    if new_unmatched_glean_types:
-        raise click.ClickException(
-            "Unknown metric types in Glean Schema: {}. Please add them to {}".format(
-                ", ".join(sorted(new_unmatched_glean_types)), config
+    with SchemaWriter(json_dump_args(pretty)) as writer:
+        for repo in repos:
+            write_schema(
+                repo,
+                glean_config,
+                out_dir,
+                pretty,
+                generic_schema,
+                mps_branch,
+                v2_allowlist,
+                v1_overwrite_allowlist,
+                manifest=manifest,
+                config_path=config,
+                incremental_state=incremental_state,
+                ping_workers=ping_workers,
+                writer=writer,
+                ndjson=ndjson,
             )
-        )
 
-    for repo in repos:
-        write_schema(
-            repo,
-            glean_config,
-            out_dir,
-            pretty,
-            generic_schema,
-            mps_branch,
-            v2_allowlist,
-            v1_overwrite_allowlist,
-        )
+    write_changed_files(changed_files, writer.changed)
+    if manifest is not None:
+        manifest.save()
 
 
 def write_schema(
@@ -229,39 +505,134 @@ def write_schema(
     mps_branch,
     v2_allowlist,
     v1_overwrite_allowlist,
+    manifest=None,
+    config_path=None,
+    incremental_state=None,
+    ping_workers=None,
+    writer=None,
+    ndjson=False,
 ):
-    for version in (1, 2):
-        if version == 2 and (
-            repo["app_id"] in v1_overwrite_allowlist
-            or repo["app_id"] not in v2_allowlist
-        ):
-            continue
-
-        use_metrics_blocklist = version == 2 or repo["app_id"] in v1_overwrite_allowlist
-
-        schema_generator = GleanPing(
-            repo,
-            mps_branch=mps_branch,
-            version=version,
-            use_metrics_blocklist=use_metrics_blocklist,
+    versions = _get_glean_versions(repo, v2_allowlist, v1_overwrite_allowlist)
+
+    if manifest is not None:
+        key = f"glean/{repo['app_id']}"
+        glean = GleanPing(repo, mps_branch=mps_branch)
+        input_fingerprint = fingerprint(
+            urls=glean.get_input_urls(versions),
+            files=[config_path or CONFIGS_DIR / "glean.yaml"],
+            values=[
+                repo,
+                glean.get_catalog_entries(),
+                versions,
+                v2_allowlist.get(repo["app_id"]),
+                pretty,
+                generic_schema,
+            ],
         )
-        schemas = schema_generator.generate_schema(
-            config, generic_schema=generic_schema
-        )
-
-        # only keep pings that are in the allowlist
-        if version == 2:
-            schemas = {
-                name: schema
-                for name, schema in schemas.items()
-                if name in v2_allowlist[repo["app_id"]]
-            }
+        if manifest.is_current(key, input_fingerprint):
+            logger.info(f"Inputs of {repo['app_id']} are unchanged, skipping")
+            return
+
+    versioned_schemas = generate_glean_schemas(
+        repo,
+        config,
+        versions,
+        generic_schema,
+        mps_branch,
+        v2_allowlist,
+        incremental_state=incremental_state,
+        ping_workers=ping_workers,
+    )
 
-        dump_schema(
+    written = []
+    for version, schemas in versioned_schemas.items():
+        written += dump_schema(
             schemas,
             out_dir and out_dir.joinpath(repo["app_id"]),
             pretty,
             version=version,
+            writer=writer,
+            ndjson=ndjson,
+            app=repo["app_id"],
+        )
+
+    if manifest is not None:
+        manifest.update(key, input_fingerprint, written)
+
+
+def generate_glean_schemas(
+    repo,
+    config,
+    versions,
+    generic_schema,
+    mps_branch,
+    v2_allowlist,
+    incremental_state=None,
+    ping_workers=None,
+) -> Dict[int, Dict[str, Schema]]:
+    """Generate the schemas of every version of a Glean app."""
+    schema_generator = GleanPing(repo, mps_branch=mps_branch)
+    if incremental_state is not None:
+        schema_generator = IncrementalGleanPing(
+            schema_generator, Path(incremental_state) / f"{repo['app_id']}.json"
+        )
+
+    with profiling.context(app=repo["app_id"]):
+        versioned_schemas = schema_generator.generate_versioned_schemas(
+            config, versions, generic_schema=generic_schema, workers=ping_workers
+        )
+
+    # only keep pings that are in the allowlist
+    if 2 in versioned_schemas:
+        versioned_schemas[2] = {
+            name: schema
+            for name, schema in versioned_schemas[2].items()
+            if name in v2_allowlist[repo["app_id"]]
+        }
+
+    if incremental_state is not None:
+        schema_generator.save()
+
+    return versioned_schemas
+
+
+def _get_glean_versions(repo, v2_allowlist, v1_overwrite_allowlist) -> Dict[int, bool]:
+    """Get the schema versions of a Glean app, and whether they use the metric
+    blocklist."""
+    # Versions 1 and 2 differ only in their template, the metric blocklist and the
+    # allowlist filter, so generate both from a single pass over the repository.
+    versions = {1: repo["app_id"] in v1_overwrite_allowlist}
+    if repo["app_id"] not in v1_overwrite_allowlist and repo["app_id"] in v2_allowlist:
+        versions[2] = True
+    return versions
+
+
+def _load_glean_allowlists():
+    with open(CONFIGS_DIR / "glean_v2_allowlist.yaml", "r") as f:
+        v2_allowlist = yaml.safe_load(f)
+
+    with open(CONFIGS_DIR / "glean_v1_overwrite_allowlist.yaml", "r") as f:
+        v1_overwrite_allowlist = yaml.safe_load(f) or []
+
+    return v2_allowlist, v1_overwrite_allowlist
+
+
+def _check_glean_config(repo, config_data, config, mps_branch):
+    # validate that the config has mappings for every single metric type specified in the
+    # Glean schema (see: https://bugzilla.mozilla.org/show_bug.cgi?id=1739239)
+    glean_schema = GleanPing(repo, mps_branch=mps_branch).get_schema()
+    glean_matched_metrics_in_config = set(config_data["metrics"].keys())
+    glean_metrics_in_schema = set(
+        glean_schema.get(["properties", "metrics", "properties"]).keys()
+    )
+    new_unmatched_glean_types = (
+        glean_metrics_in_schema - glean_matched_metrics_in_config
+    )
+    if new_unmatched_glean_types:
+        raise click.ClickException(
+            "Unknown metric types in Glean Schema: {}. Please add them to {}".format(
+                ", ".join(sorted(new_unmatched_glean_types)), config
+            )
         )
 
 
@@ -302,10 +673,11 @@ See https://mozilla-hub.atlassian.net/browse/DENG-10606 for details.
 def check_blocked_distribution_metrics(
     config, mps_branch, repo, blocked_distribution_pings
 ):
-    repos = GleanPing.get_repos()
-
     if repo is not None:
-        repos = [r for r in repos if r["app_id"] == repo]
+        repo = GleanPing.get_repository_catalog().get_repo(repo)
+        repos = [repo] if repo is not None else []
+    else:
+        repos = GleanPing.get_repos()
 
     with open(config, "r") as f:
         config_data = yaml.safe_load(f)
@@ -318,27 +690,20 @@ def check_blocked_distribution_metrics(
             repo,
             mps_branch=mps_branch,
         )
-        schemas = ping.generate_schema(
-            glean_config, generic_schema=False, blocked_distribution_pings=None
+        # Only the match stage is needed to find the distributions that would be
+        # dropped, so don't generate and compare full schemas.
+        blocked = ping.get_blocked_distribution_metrics(
+            glean_config,
+            blocked_distribution_pings=blocked_distribution_pings
+            or ("events", "baseline"),
         )
-        if blocked_distribution_pings:
-            schemas_with_block = ping.generate_schema(
-                glean_config,
-                generic_schema=False,
-                blocked_distribution_pings=blocked_distribution_pings,
-            )
-        else:
-            schemas_with_block = ping.generate_schema(
-                glean_config, generic_schema=False
-            )
 
-        if schemas != schemas_with_block:
+        for ping_name, metric_names in blocked.items():
             failed = True
-            for ping_name in schemas.keys():
-                if schemas[ping_name] != schemas_with_block[ping_name]:
-                    print(
-                        f"{repo['app_id']}: {ping_name} has blocked distribution metrics"
-                    )
+            print(
+                f"{repo['app_id']}: {ping_name} has blocked distribution metrics: "
+                + ", ".join(metric_names)
+            )
 
     if failed:
         raise RuntimeError(
@@ -353,7 +718,8 @@ def check_blocked_distribution_metrics(
     default=CONFIGS_DIR / "subset.yaml",
 )
 @common_options
-def generate_subset_pings(config, out_dir, pretty, mps_branch):
+@changed_files_option
+def generate_subset_pings(config, out_dir, pretty, mps_branch, changed_files):
     """Read in pings from disk and move fields to new subset pings.
 
     If configured, also create a remainder ping with all the fields that weren't moved.
@@ -368,51 +734,475 @@ def generate_subset_pings(config, out_dir, pretty, mps_branch):
     with open(config, "r") as f:
         config_data = yaml.safe_load(f)
     schemas = subset_pings.generate(config_data, out_dir)
-    for namespace, doctypes in schemas.items():
+    with SchemaWriter(json_dump_args(pretty)) as writer:
+        for namespace, doctypes in schemas.items():
+            for doctype, versions in doctypes.items():
+                for version, schema in versions.items():
+                    dump_schema(
+                        {doctype: schema},
+                        out_dir / namespace,
+                        pretty,
+                        version=version,
+                        writer=writer,
+                    )
+    write_changed_files(changed_files, writer.changed)
+
+
+@click.command()
+@click.option(
+    "--out-dir",
+    help="The schemas directory of mozilla-pipeline-schemas to write the schemas to.",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    required=True,
+)
+@click.option(
+    "--pretty",
+    is_flag=True,
+    help=(
+        "If specified, pretty-prints the JSON "
+        "schemas that are outputted. Otherwise "
+        "the schemas will be on one line."
+    ),
+)
+@click.option(
+    "--mps-branch",
+    help=("If specified, the source branch of mozilla-pipeline-schemas to reference"),
+    required=False,
+    type=str,
+    default="main",
+)
+@click.option(
+    "--config-dir",
+    help=(
+        "The directory of the main, glean and subset configs, "
+        "and of the configs of the common pings."
+    ),
+    type=click.Path(dir_okay=True, file_okay=False, writable=False, exists=True),
+    default=CONFIGS_DIR,
+)
+@click.option(
+    "--common-pings-config",
+    default="common_pings.json",
+    help=(
+        "File containing URLs to schemas and configs "
+        "of pings in the common ping format."
+    ),
+)
+@click.option(
+    "--aliases",
+    default="aliases.json",
+    help="File containing the schemas to copy into place as aliases of others.",
+)
+@click.option(
+    "--incremental-state",
+    help=(
+        "If specified, a directory with the state of the previous generation "
+        "of each Glean app, see generate-glean-pings."
+    ),
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    required=False,
+)
+@click.option(
+    "--workers",
+    help=(
+        "The number of worker processes to generate the pings on. "
+        "By default, pings are generated in the main process."
+    ),
+    type=click.IntRange(min=1),
+    required=False,
+)
+@changed_files_option
+@click.option(
+    "--archive",
+    help=(
+        "If specified, a zip archive to write all schemas to, instead of "
+        "writing them into --out-dir. Use extract-archive to write the "
+        "changed files into --out-dir later."
+    ),
+    type=click.Path(dir_okay=False, file_okay=True, writable=True),
+    required=False,
+)
+def generate_all(
+    out_dir,
+    pretty,
+    mps_branch,
+    config_dir,
+    common_pings_config,
+    aliases,
+    incremental_state,
+    workers,
+    changed_files,
+    archive,
+):
+    """Generate the schemas of mozilla-pipeline-schemas in a single process.
+
+    Generates the main, bhr, common and Glean pings, copies aliased schemas into
+    place and generates the subset pings. The schemas are written once all
+    stages are done.
+    """
+    if archive and changed_files:
+        raise click.UsageError(
+            "--changed-files can not be used together with --archive, "
+            "use it with extract-archive instead."
+        )
+    out_dir = Path(out_dir)
+    config_dir = Path(config_dir)
+    tree = pipeline.SchemaTree(out_dir)
+
+    with open(config_dir / "main.yaml", "r") as f:
+        main_config_data = yaml.safe_load(f)
+
+    common_pings = _load_common_pings(common_pings_config, config_dir)
+
+    glean_config_path = config_dir / "glean.yaml"
+    with open(glean_config_path, "r") as f:
+        glean_config_data = yaml.safe_load(f)
+    glean_config = Config("glean", glean_config_data)
+    v2_allowlist, v1_overwrite_allowlist = _load_glean_allowlists()
+    repos = GleanPing.get_repos()
+    _check_glean_config(repos[0], glean_config_data, glean_config_path, mps_branch)
+
+    # The namespace and version of the schemas generated by each task; a task
+    # without a version generates the schemas of every version.
+    tasks = [
+        ("telemetry", 4, partial(_generate_main_ping, main_config_data, mps_branch)),
+        ("telemetry", 4, partial(_generate_bhr_ping, mps_branch)),
+    ]
+    for schema_url, name, version, config_data, _ in common_pings:
+        tasks.append(
+            (
+                "telemetry",
+                int(version),
+                partial(
+                    _generate_common_ping, schema_url, name, config_data, mps_branch
+                ),
+            )
+        )
+    for repo in repos:
+        versions = _get_glean_versions(repo, v2_allowlist, v1_overwrite_allowlist)
+        tasks.append(
+            (
+                repo["app_id"],
+                None,
+                partial(
+                    generate_glean_schemas,
+                    repo,
+                    glean_config,
+                    versions,
+                    False,
+                    mps_branch,
+                    v2_allowlist,
+                    incremental_state=incremental_state,
+                ),
+            )
+        )
+
+    if workers is not None and workers > 1:
+        # Load the inputs shared across tasks once, and hand them to every worker
+        shared_inputs = (
+            _preload_common_pings(
+                [(MainPing.schema_url, "main", main_config_data)]
+                + [
+                    (schema_url, name, data)
+                    for schema_url, name, _, data, _ in common_pings
+                ],
+                mps_branch,
+            ),
+            GleanPing.get_shared_inputs(),
+        )
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_generate_all_worker,
+            initargs=shared_inputs,
+        ) as executor:
+            futures = [
+                executor.submit(profiling.wrap(generate)) for _, _, generate in tasks
+            ]
+            results = [profiling.unwrap(future.result()) for future in futures]
+    else:
+        results = [generate() for _, _, generate in tasks]
+
+    for (namespace, version, _), schemas in zip(tasks, results):
+        versioned_schemas = schemas if version is None else {version: schemas}
+        for version, schemas in versioned_schemas.items():
+            tree.add_schemas(namespace, schemas, version)
+
+    pipeline.alias_schemas(pipeline.load_aliases(aliases), tree)
+
+    with open(config_dir / "subset.yaml", "r") as f:
+        subset_config_data = yaml.safe_load(f)
+    subsets = subset_pings.generate(
+        subset_config_data, out_dir, read_schema=partial(_read_subset_source, tree)
+    )
+    for namespace, doctypes in subsets.items():
         for doctype, versions in doctypes.items():
             for version, schema in versions.items():
-                dump_schema(
-                    {doctype: schema}, out_dir / namespace, pretty, version=version
-                )
+                tree.add(namespace, doctype, version, schema)
+
+    changed = tree.write(pretty, archive=archive)
+    write_changed_files(changed_files, changed)
+    if archive:
+        logger.info(f"Wrote {len(changed)} schemas to {archive}")
+    else:
+        logger.info(f"Wrote {len(changed)} changed schemas to {out_dir}")
+
 
+def _init_generate_all_worker(common_inputs, glean_inputs):
+    CommonPing.set_shared_inputs(*common_inputs)
+    GleanPing.set_shared_inputs(*glean_inputs)
 
-def dump_schema(schemas, out_dir, pretty, *, version=1):
-    json_dump_args = {"cls": SchemaEncoder}
-    if pretty:
-        json_dump_args.update(
-            {"indent": 4, "separators": (",", ":"), "sort_keys": True}
+
+def _read_subset_source(tree, namespace, doctype, version):
+    schema = tree.get(namespace, doctype, version)
+    if schema is None:
+        raise SchemaException(
+            "Missing source {} of subset pings".format(
+                tree.get_path(namespace, doctype, version)
+            )
         )
+    return schema
 
-    if not out_dir:
-        print(json.dumps(schemas, **json_dump_args))
+
+@click.command()
+@click.argument(
+    "archive",
+    type=click.Path(dir_okay=False, file_okay=True, writable=False, exists=True),
+)
+@click.option(
+    "--out-dir",
+    help="The directory to write the files of the archive to.",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    default=".",
+)
+@changed_files_option
+def extract_archive(archive, out_dir, changed_files):
+    """Write the files of an archive written by generate-all --archive.
+
+    Only files whose content differs from the archived one are written.
+    """
+    changed = output.extract_archive(archive, out_dir)
+    write_changed_files(changed_files, changed)
+    logger.info(f"Extracted {len(changed)} changed files to {out_dir}")
+
+
+@click.command()
+@click.argument(
+    "metadata-dir",
+    type=click.Path(dir_okay=True, file_okay=False, writable=False, exists=True),
+)
+@click.option(
+    "--schemas-dir",
+    help="The directory of the schemas to merge the metadata into.",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True, exists=True),
+    default=".",
+)
+@click.option(
+    "--workers",
+    help=(
+        "The number of worker processes to merge the schemas on. "
+        "By default, schemas are merged in the main process."
+    ),
+    type=click.IntRange(min=1),
+    required=False,
+)
+@changed_files_option
+def merge_metadata(metadata_dir, schemas_dir, workers, changed_files):
+    """Merge the metadata fields of their ingestion format into all schemas.
+
+    The metadata of format FORMAT is read from
+    METADATA_DIR/FORMAT-ingestion/FORMAT-ingestion.1.schema.json, for the
+    `bq_metadata_format` of each schema. Schemas without a format are skipped.
+    """
+    changed = pipeline.merge_metadata_dir(schemas_dir, metadata_dir, workers=workers)
+    write_changed_files(changed_files, changed)
+    logger.info(f"Merged metadata into {len(changed)} changed schemas")
+
+
+@click.command()
+@click.option(
+    "--schemas-dir",
+    help="The directory of the schemas to write BigQuery schemas for.",
+    type=click.Path(dir_okay=True, file_okay=False, writable=True, exists=True),
+    default=".",
+)
+@click.option(
+    "--workers",
+    help=(
+        "The number of worker processes to convert the schemas on. "
+        "By default, schemas are converted in the main process."
+    ),
+    type=click.IntRange(min=1),
+    required=False,
+)
+@click.option(
+    "--exclude",
+    help=(
+        "Skip schemas whose path contains this, relative to --schemas-dir. "
+        "May be given multiple times; defaults to metadata/sources."
+    ),
+    multiple=True,
+    default=["metadata/sources"],
+)
+@changed_files_option
+def generate_bigquery_schemas(schemas_dir, workers, exclude, changed_files):
+    """Write the BigQuery schema of every JSON schema next to it, as `.bq` file.
+
+    Produces the output of `jsonschema-transpiler --type bigquery --resolve drop
+    --normalize-case --force-nullable --tuple-struct`.
+    """
+    changed = pipeline.transpile_dir(schemas_dir, workers=workers, exclude=exclude)
+    write_changed_files(changed_files, changed)
+    logger.info(f"Wrote {len(changed)} changed BigQuery schemas")
+
+
+@profiling.stage("dump")
+def dump_schema(
+    schemas, out_dir, pretty, *, version=1, writer=None, ndjson=False, app=None
+) -> List[Path]:
+    """Write the schemas to `out_dir`, or to stdout if not given.
+
+    With a `SchemaWriter`, the schemas are written in the background and the
+    writer collects the paths of the files that changed; otherwise they are
+    written before returning. Returns the paths of all schema files.
+
+    With `ndjson`, each schema is written to stdout as a separate
+    `{"app", "ping", "version", "schema"}` record on its own line.
+    """
+    dump_args = json_dump_args(pretty)
+
+    written = []
+    if not out_dir and ndjson:
+        for name, schema in schemas.items():
+            record = {
+                "app": app,
+                "ping": name.replace("_", "-"),
+                "version": int(version),
+                "schema": schema,
+            }
+            # Serialize in chunks rather than into a single string
+            with profiling.stage("serialize"):
+                json.dump(record, sys.stdout, cls=SchemaEncoder)
+            sys.stdout.write("\n")
+        sys.stdout.flush()
+
+    elif not out_dir:
+        with profiling.stage("serialize"):
+            dumped = json.dumps(schemas, **dump_args)
+        print(dumped)
 
     else:
+        own_writer = writer is None
+        if own_writer:
+            writer = SchemaWriter(dump_args)
+
         for name, schema in schemas.items():
             # Bug 1601270; we transform ping names from snake_case to kebab-case;
             # we can remove this line once all snake_case probes have converted.
             name = name.replace("_", "-")
-            ping_out_dir = out_dir.joinpath(name)
-            if not ping_out_dir.exists():
-                ping_out_dir.mkdir(parents=True)
+            fname = out_dir.joinpath(name, "{}.{}.schema.json".format(name, version))
+            writer.write(fname, schema)
+            written.append(fname)
+
+        if own_writer:
+            writer.close()
 
-            fname = ping_out_dir.joinpath("{}.{}.schema.json".format(name, version))
-            with open(fname, "w") as f:
-                f.write(json.dumps(schema, **json_dump_args))
+    return written
 
 
 @click.group()
-def main(args=None):
+@click.option(
+    "--profile",
+    is_flag=True,
+    help=(
+        "If specified, records the wall and CPU time of each stage of the "
+        "command, by app and ping, and prints a summary to stderr."
+    ),
+)
+@click.option(
+    "--profile-dir",
+    help=(
+        "If specified, a directory to write the cProfile stats of the command "
+        "to, as COMMAND.prof. Implies --profile."
+    ),
+    type=click.Path(dir_okay=True, file_okay=False, writable=True),
+    required=False,
+)
+@click.option(
+    "--trace-file",
+    help=(
+        "If specified, a file to write a trace of the command to, with spans of "
+        "each app, ping and stage, in the Chrome trace event format. Open it in "
+        "chrome://tracing or https://ui.perfetto.dev."
+    ),
+    type=click.Path(dir_okay=False, file_okay=True, writable=True),
+    required=False,
+)
+@click.option(
+    "--memory",
+    is_flag=True,
+    help=(
+        "If specified, traces allocations and adds the peak and retained memory "
+        "of each stage and app, and the top allocation sites, to the summary of "
+        "--profile. Implies --profile; slows down the command considerably."
+    ),
+)
+@click.pass_context
+def main(ctx, profile, profile_dir, trace_file, memory):
     """Command line utility for mozilla-schema-generator."""
     import logging
 
     logging.basicConfig(stream=sys.stderr, level=logging.INFO)
 
+    counters.reset()
+    ctx.call_on_close(_report_counters)
+    if profile or profile_dir or trace_file or memory:
+        profiler = profiling.enable(trace=trace_file is not None, memory=memory)
+        cprofile = None
+        if profile_dir:
+            cprofile = cProfile.Profile()
+            cprofile.enable()
+        ctx.call_on_close(
+            partial(
+                _report_profile,
+                profiler,
+                cprofile,
+                profile or profile_dir or memory,
+                profile_dir,
+                trace_file,
+                ctx.invoked_subcommand,
+            )
+        )
+
+
+def _report_counters():
+    click.echo(json.dumps({"counters": counters.get_counters()}), err=True)
+
+
+def _report_profile(profiler, cprofile, summary, profile_dir, trace_file, command):
+    profiling.disable()
+    if summary:
+        click.echo(profiler.summary(), err=True)
+    if trace_file:
+        profiler.write_trace(trace_file)
+        logger.info(f"Wrote trace to {trace_file}")
+    if cprofile is not None:
+        cprofile.disable()
+        Path(profile_dir).mkdir(parents=True, exist_ok=True)
+        path = Path(profile_dir) / f"{command}.prof"
+        cprofile.dump_stats(path)
+        logger.info(f"Wrote cProfile stats to {path}")
+
 
 main.add_command(generate_main_ping)
 main.add_command(generate_bhr_ping)
 main.add_command(generate_glean_pings)
 main.add_command(generate_common_pings)
 main.add_command(generate_subset_pings)
+main.add_command(generate_all)
+main.add_command(extract_archive)
+main.add_command(merge_metadata)
+main.add_command(generate_bigquery_schemas)
 main.add_command(check_blocked_distribution_metrics)
 
 
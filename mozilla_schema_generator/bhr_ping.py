@@ -10,8 +10,8 @@ from .utils import prepend_properties
 
 class BhrPing(CommonPing):
     schema_url = (
-        "https://raw.githubusercontent.com/mozilla-services/mozilla-pipeline-schemas"
-        "/{branch}/schemas/telemetry/bhr/bhr.4.schema.json"
+        CommonPing.schemas_base_url
+        + "/{branch}/schemas/telemetry/bhr/bhr.4.schema.json"
     )
 
     def __init__(self, **kwargs):
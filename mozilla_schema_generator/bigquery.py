@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Convert JSON schemas into BigQuery schemas.
+
+This produces the same BigQuery schemas as
+
+    jsonschema-transpiler --type bigquery --resolve drop --normalize-case \\
+        --force-nullable --tuple-struct
+
+without a process per schema. Only these options are supported:
+
+- Columns that have no BigQuery type (e.g. untyped values, or unions of
+  incompatible types) are dropped, as are records left without columns.
+- Column names are converted to snake_case.
+- Every column is NULLABLE, or REPEATED for arrays and maps.
+- Tuples are records with columns `f0_`, `f1_`, ...
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .output import write_if_changed
+
+# Types of the intermediate representation of a JSON schema
+NULL = "null"
+JSON = "json"
+OBJECT = "object"
+MAP = "map"
+ARRAY = "array"
+TUPLE = "tuple"
+
+ATOMS = {
+    "boolean": "BOOL",
+    "integer": "INT64",
+    "number": "FLOAT64",
+    "string": "STRING",
+    "datetime": "TIMESTAMP",
+}
+
+NON_ALPHANUMERIC_RE = re.compile(r"[^a-zA-Z0-9]")
+# Word boundaries in the reversed name, because look-behinds must have a fixed width
+REV_WORD_BOUNDARY_RE = re.compile(
+    r"\b"
+    r"|(?<=[a-z][A-Z])(?=\d*[A-Z])"  # A7Aa -> A7|Aa
+    r"|(?<=[a-z][A-Z])(?=\d*[a-z])"  # a7Aa -> a7|Aa
+    r"|(?<=[A-Z])(?=\d*[a-z])"  # a7A -> a7|A
+)
+VALID_NAME_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
+
+def to_snake_case(name: str) -> str:
+    """Convert a name to snake_case, e.g. fooBar and FooBAR both become foo_bar."""
+    subbed = NON_ALPHANUMERIC_RE.sub(" ", name[::-1])
+    words = (word.strip() for word in REV_WORD_BOUNDARY_RE.split(subbed))
+    return "_".join(word for word in words if word)[::-1].lower()
+
+
+def normalize_name(name: str) -> str:
+    """Get the column name of a property."""
+    name = to_snake_case(name)
+    if not VALID_NAME_RE.match(name):
+        name = re.sub(r"[^a-zA-Z0-9_]", "_", name)
+        if not name or name[0].isdigit():
+            name = "_" + name
+    return name
+
+
+def _parse(schema) -> Dict:
+    """Parse a JSON schema into a node with a single type."""
+    if not isinstance(schema, dict):
+        return {"type": JSON}
+
+    data_type = schema.get("type")
+    if data_type is None:
+        variants = schema.get("oneOf", schema.get("anyOf"))
+        if variants is None:
+            node = {"type": JSON}
+        else:
+            node = _collapse([_parse(variant) for variant in variants])
+    elif isinstance(data_type, list):
+        node = _collapse([_parse_type(schema, t) for t in data_type])
+    else:
+        node = _parse_type(schema, data_type)
+
+    if schema.get("description"):
+        node = dict(node, description=schema["description"])
+    return node
+
+
+def _parse_type(schema: Dict, data_type: str) -> Dict:
+    if data_type == "string" and schema.get("format") == "date-time":
+        return {"type": "datetime"}
+    if data_type in ATOMS or data_type == NULL:
+        return {"type": data_type}
+
+    if data_type == "object":
+        properties = schema.get("properties")
+        additional_properties = schema.get("additionalProperties")
+        pattern_properties = schema.get("patternProperties")
+        if properties:
+            return {
+                "type": OBJECT,
+                "fields": {name: _parse(prop) for name, prop in properties.items()},
+            }
+        if isinstance(additional_properties, dict) or pattern_properties:
+            values = list((pattern_properties or {}).values())
+            if isinstance(additional_properties, dict):
+                values.insert(0, additional_properties)
+            return {"type": MAP, "value": _collapse([_parse(v) for v in values])}
+        if properties is not None:
+            return {"type": OBJECT, "fields": {}}
+        return {"type": JSON}
+
+    if data_type == "array":
+        items = schema.get("items")
+        if isinstance(items, list):
+            return {"type": TUPLE, "items": [_parse(item) for item in items]}
+        return {"type": ARRAY, "items": _parse(items) if items is not None else None}
+
+    return {"type": JSON}
+
+
+def _collapse(nodes: List[Dict]) -> Dict:
+    """Collapse a union of nodes into a single node, if their types are compatible."""
+    nodes = [node for node in nodes if node["type"] != NULL]
+    if not nodes:
+        return {"type": NULL}
+
+    types = {node["type"] for node in nodes}
+    if len(nodes) == 1:
+        node = nodes[0]
+    elif len(types) == 1 and types <= ATOMS.keys():
+        node = {"type": nodes[0]["type"]}
+    elif types == {"integer", "number"}:
+        node = {"type": "number"}
+    elif types == {"string", "datetime"}:
+        node = {"type": "string"}
+    elif len(types) > 1 or JSON in types:
+        node = {"type": JSON}
+    elif types == {OBJECT}:
+        fields = {}
+        for node in nodes:
+            for name, field in node["fields"].items():
+                fields.setdefault(name, []).append(field)
+        node = {
+            "type": OBJECT,
+            "fields": {name: _collapse(field) for name, field in fields.items()},
+        }
+    elif types == {MAP}:
+        node = {"type": MAP, "value": _collapse([node["value"] for node in nodes])}
+    elif types == {ARRAY}:
+        if any(node["items"] is None for node in nodes):
+            node = {"type": ARRAY, "items": None}
+        else:
+            node = {
+                "type": ARRAY,
+                "items": _collapse([node["items"] for node in nodes]),
+            }
+    elif types == {TUPLE} and len({len(node["items"]) for node in nodes}) == 1:
+        node = {
+            "type": TUPLE,
+            "items": [
+                _collapse(list(items)) for items in zip(*(n["items"] for n in nodes))
+            ],
+        }
+    else:
+        node = {"type": JSON}
+
+    descriptions = [n["description"] for n in nodes if n.get("description")]
+    if descriptions and "description" not in node:
+        node = dict(node, description=descriptions[0])
+    return node
+
+
+def _record(name: str, fields: List[Dict], mode="NULLABLE") -> Optional[Dict]:
+    if not fields:
+        # Records must have at least one column
+        return None
+    return {
+        "fields": sorted(fields, key=lambda f: f["name"]),
+        "mode": mode,
+        "name": name,
+        "type": "RECORD",
+    }
+
+
+def _to_column(node: Dict, name: str) -> Optional[Dict]:
+    """Convert a node into a BigQuery column, or None if it is dropped."""
+    data_type = node["type"]
+    if data_type in ATOMS:
+        column = {"mode": "NULLABLE", "name": name, "type": ATOMS[data_type]}
+
+    elif data_type == OBJECT:
+        children = {}
+        for prop, field in node["fields"].items():
+            child = _to_column(field, normalize_name(prop))
+            if child is not None:
+                children[child["name"]] = child
+        column = _record(name, list(children.values()))
+
+    elif data_type == MAP:
+        value = _to_column(node["value"], "value")
+        if value is None:
+            return None
+        key = {"mode": "NULLABLE", "name": "key", "type": "STRING"}
+        column = _record(name, [key, value], mode="REPEATED")
+
+    elif data_type == ARRAY:
+        if node["items"] is None:
+            return None
+        column = _to_column(node["items"], "list")
+        if column is None:
+            return None
+        if column["mode"] == "REPEATED":
+            # BigQuery does not support nested arrays
+            column = _record(name, [column], mode="REPEATED")
+        else:
+            column = dict(column, mode="REPEATED", name=name)
+            column.pop("description", None)
+
+    elif data_type == TUPLE:
+        columns = [_to_column(item, f"f{i}_") for i, item in enumerate(node["items"])]
+        column = _record(name, [c for c in columns if c is not None])
+
+    else:
+        return None
+
+    if column is not None and node.get("description"):
+        column["description"] = node["description"]
+    return column
+
+
+def transpile(schema: Dict) -> List[Dict]:
+    """Get the BigQuery columns of a JSON schema."""
+    root = _to_column(_parse(schema), "root")
+    if root is None or root["type"] != "RECORD":
+        return []
+    return root["fields"]
+
+
+def dumps(columns: List[Dict]) -> str:
+    """Serialize BigQuery columns like jsonschema-transpiler does."""
+    return json.dumps(columns, indent=2, sort_keys=True, ensure_ascii=False) + "\n"
+
+
+def get_bq_path(schema_path: Path) -> Path:
+    return schema_path.with_name(schema_path.name.replace("schema.json", "bq", 1))
+
+
+def transpile_files(paths) -> List[Path]:
+    """Write the BigQuery schema of every JSON schema file next to it.
+
+    Returns the paths of the BigQuery schemas that changed.
+    """
+    changed = []
+    for path in paths:
+        path = Path(path)
+        bq_path = get_bq_path(path)
+        if write_if_changed(bq_path, dumps(transpile(json.loads(path.read_text())))):
+            changed.append(bq_path)
+    return changed
@@ -5,8 +5,9 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import json
-from typing import List
+from typing import Dict, List, Tuple
 
+from . import profiling
 from .generic_ping import GenericPing
 from .probes import MainProbe
 from .schema import Schema
@@ -20,11 +21,14 @@ class CommonPing(GenericPing):
     MIN_FX_VERSION = 30
 
     env_url = (
-        "https://raw.githubusercontent.com/mozilla-services/mozilla-pipeline-schemas"
-        "/{branch}/templates/include/telemetry/environment.1.schema.json"
+        GenericPing.schemas_base_url
+        + "/{branch}/templates/include/telemetry/environment.1.schema.json"
     )
     probes_url = GenericPing.probe_info_base_url + "/firefox/all/main/all_probes"
 
+    _env_cache: Dict[Tuple[type, str], str] = {}
+    _probes_cache: Dict[Tuple[str, int], Tuple[MainProbe, ...]] = {}
+
     def __init__(self, schema_url, **kwargs):
         super().__init__(schema_url, self.env_url, self.probes_url, **kwargs)
 
@@ -79,13 +83,41 @@ class CommonPing(GenericPing):
         return schema
 
     def get_env(self):
-        env_property = json.loads("{" + self._get_json_str(self.env_url) + "}")
-        env = {"type": "object", "properties": env_property}
+        # The environment is shared by all common pings, so it is prepared once
+        # per process and kind of ping, and kept serialized to hand out copies.
+        key = (type(self), self.env_url)
+        if key not in CommonPing._env_cache:
+            env_property = json.loads("{" + self._get_json_str(self.env_url) + "}")
+            env = {"type": "object", "properties": env_property}
+            CommonPing._env_cache[key] = json.dumps(
+                self._update_env(Schema(env)).schema
+            )
 
-        return self._update_env(Schema(env))
+        return Schema(json.loads(CommonPing._env_cache[key]))
 
+    @profiling.stage("probes")
     def get_probes(self) -> List[MainProbe]:
-        probes = self._get_json(self.probes_url)
+        # The probes are shared by all common pings, and only read while generating
+        # schemas, so they are loaded once per process.
+        key = (self.probes_url, self.MIN_FX_VERSION)
+        if key not in CommonPing._probes_cache:
+            CommonPing._probes_cache[key] = self._load_probes(*key)
+        return list(CommonPing._probes_cache[key])
+
+    @staticmethod
+    def get_shared_inputs() -> Tuple[Dict, Dict]:
+        """Get the environments and probes loaded by this process, e.g. to hand
+        them to worker processes with `set_shared_inputs`."""
+        return dict(CommonPing._env_cache), dict(CommonPing._probes_cache)
+
+    @staticmethod
+    def set_shared_inputs(env_cache: Dict, probes_cache: Dict):
+        CommonPing._env_cache.update(env_cache)
+        CommonPing._probes_cache.update(probes_cache)
+
+    @staticmethod
+    def _load_probes(probes_url: str, min_fx_version: int) -> Tuple[MainProbe, ...]:
+        probes = GenericPing._get_json(probes_url)
 
         filtered = {
             pname: pdef
@@ -95,8 +127,8 @@ class CommonPing(GenericPing):
 
         # This will be made much better with PEP 572
         main_probes = [MainProbe(_id, defn) for _id, defn in filtered.items()]
-        return [
+        return tuple(
             p
             for p in main_probes
-            if int(p.definition["versions"]["last"]) > self.MIN_FX_VERSION
-        ]
+            if int(p.definition["versions"]["last"]) > min_fx_version
+        )
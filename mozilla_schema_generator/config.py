@@ -7,8 +7,9 @@
 from __future__ import annotations
 
 import queue
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 
+from . import counters, profiling
 from .matcher import Matcher
 
 # TODO: s/probes/probe
@@ -53,6 +54,7 @@ class Config(object):
     def get_match_keys(self) -> List[Tuple[str]]:
         return [prepend_properties(key) for key in self.matchers.keys()]
 
+    @profiling.stage("match")
     def get_schema_elements(self, probes: List[Probe]) -> List[Tuple[tuple, Probe]]:
         """
         Given a schema and set of probes, get a list of probe and
@@ -66,6 +68,46 @@ class Config(object):
             schema_key = prepend_properties(key)
 
             # Get the probes for the fill-in
-            schema_elements += [(schema_key, p) for p in probes if matcher.matches(p)]
+            matched = [(schema_key, p) for p in probes if matcher.matches(p)]
+            schema_elements += matched
+            counters.count("matcher.evaluations", len(probes))
+            counters.count("matcher.matches." + ".".join(key), len(matched))
+
+        return schema_elements
+
+    @profiling.stage("match")
+    def get_schema_elements_by_variant(
+        self, probes: List[Probe], variants: Dict[Any, Dict[int, Probe]]
+    ) -> Dict[Any, List[Tuple[tuple, Probe]]]:
+        """
+        Get the schema elements for several variants of the same set of
+        probes, where each variant replaces some of the probes (by index).
+
+        Every probe is matched once; only the replacements are matched
+        again for the variants they belong to. The elements of each variant
+        are in the same order `get_schema_elements` would return them.
+        """
+        schema_elements = {variant: [] for variant in variants}
+
+        for key, matcher in self.matchers.items():
+            schema_key = prepend_properties(key)
+
+            evaluations = n_matched = 0
+            for i, probe in enumerate(probes):
+                matched = matcher.matches(probe)
+                evaluations += 1
+                n_matched += matched
+                for variant, replacements in variants.items():
+                    if i in replacements:
+                        evaluations += 1
+                        if matcher.matches(replacements[i]):
+                            n_matched += 1
+                            schema_elements[variant].append(
+                                (schema_key, replacements[i])
+                            )
+                    elif matched:
+                        schema_elements[variant].append((schema_key, probe))
+            counters.count("matcher.evaluations", evaluations)
+            counters.count("matcher.matches." + ".".join(key), n_matched)
 
         return schema_elements
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Counters of the operations that drive the cost of generating schemas.
+
+Unlike timings, the counts of a run only change with its inputs or with the
+algorithms used, so they tell regressions apart from noise. Counters are always
+on; a count costs a dict update, so operations are counted in bulk where
+possible (e.g. matcher evaluations per call of `Config.get_schema_elements`).
+
+Counters:
+
+- `matcher.evaluations`: probes evaluated by a matcher
+- `matcher.matches.KEY`: probes matched by the matcher of config key KEY
+- `schema.clone`: calls of `Schema.clone`
+- `deepcopy`: deep copies of schemas, including those of `Schema.clone`
+- `schema.set_schema_elem`, `schema.set_schema_elem.steps`: calls of
+  `Schema.set_schema_elem`, and the keys walked by them
+- `schema.get_size`, `schema.get_size.nodes`: calls of `Schema.get_size`, and the
+  schema nodes traversed by them
+- `cache.hits`, `cache.misses`, `cache.bytes_read`, `cache.bytes_written`: reads
+  of the probe cache, and the characters read from and written to it
+- `http.requests`, `http.retries`: HTTP requests, and their retries
+
+Counts of worker processes are returned to the parent by `profiling.wrap`.
+"""
+
+from collections import Counter
+from typing import Dict
+
+_counters: Counter = Counter()
+
+
+def count(name: str, n: int = 1):
+    """Add `n` to the counter `name`."""
+    _counters[name] += n
+
+
+def get_counters() -> Dict[str, int]:
+    """Get the current value of every counter, by name."""
+    return dict(sorted(_counters.items()))
+
+
+def merge(counters: Dict[str, int]):
+    """Add counts, e.g. of a worker process."""
+    _counters.update(counters)
+
+
+def reset():
+    _counters.clear()
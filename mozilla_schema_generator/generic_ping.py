@@ -10,12 +10,13 @@ import os
 import pathlib
 import re
 from json.decoder import JSONDecodeError
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from . import counters, profiling
 from .config import Config
 from .probes import Probe
 from .schema import Schema, SchemaException
@@ -31,11 +32,25 @@ _http_session.mount(
 )
 
 
+DEFAULT_PROBE_INFO_BASE_URL = "https://probeinfo.telemetry.mozilla.org"
+DEFAULT_SCHEMAS_BASE_URL = (
+    "https://raw.githubusercontent.com/mozilla-services/mozilla-pipeline-schemas"
+)
+
+
 class GenericPing(object):
-    probe_info_base_url = "https://probeinfo.telemetry.mozilla.org"
+    # The base URLs can be overridden to fetch from a stand-in of the services,
+    # e.g. a local server for benchmarks
+    probe_info_base_url = os.environ.get(
+        "MSG_PROBE_INFO_BASE_URL", DEFAULT_PROBE_INFO_BASE_URL
+    )
+    schemas_base_url = os.environ.get("MSG_SCHEMAS_BASE_URL", DEFAULT_SCHEMAS_BASE_URL)
     default_encoding = "utf-8"
     default_max_size = 12900  # https://bugzilla.mozilla.org/show_bug.cgi?id=1688633
     cache_dir = pathlib.Path(os.environ.get("MSG_PROBE_CACHE_DIR", ".probe_cache"))
+    # URLs that were not found in this process, so they are not requested again;
+    # other errors, e.g. 5xx or 429, may be transient and are not kept
+    _failed_urls: Dict[str, requests.HTTPError] = {}
 
     def __init__(self, schema_url, env_url, probes_url, mps_branch="main"):
         self.branch_name = mps_branch
@@ -49,50 +64,91 @@ class GenericPing(object):
     def get_env(self) -> Schema:
         return Schema(self._get_json(self.env_url))
 
+    @profiling.stage("probes")
     def get_probes(self) -> List[Probe]:
         return [
             Probe(_id, defn) for _id, defn in self._get_json(self.probes_url).items()
         ]
 
-    def generate_schema(
-        self, config: Config, *, max_size: int = None
-    ) -> Dict[str, Schema]:
-        schema = self.get_schema()
-        env = self.get_env()
-
-        probes = self.get_probes()
-
-        if max_size is None:
-            max_size = self.default_max_size
+    def get_input_urls(self, config: Config = None) -> List[str]:
+        """Get the URLs of all documents the generated schemas depend on.
 
-        if env.get_size() >= max_size:
-            raise SchemaException(
-                "Environment must be smaller than max_size {}".format(max_size)
-            )
+        The probes are not an input of schemas generated with a `config`
+        without matchers.
+        """
+        if config is not None and not config.matchers:
+            return [self.schema_url, self.env_url]
+        return [self.schema_url, self.env_url, self.probes_url]
 
-        if schema.get_size() >= max_size:
-            raise SchemaException(
-                "Schema must be smaller than max_size {}".format(max_size)
-            )
+    def generate_schema(
+        self,
+        config: Config,
+        *,
+        max_size: int = None,
+        schema: Schema = None,
+        schema_elements: List[Tuple[tuple, Probe]] = None,
+    ) -> Dict[str, Schema]:
+        """
+        If `schema` is given, it is used instead of `get_schema`.
 
-        schemas = {config.name: self.make_schema(schema, probes, config, max_size)}
+        If `schema_elements` is given, it is used as the already matched
+        result of `config.get_schema_elements` and no probes are loaded.
+        Probes are not loaded either if `config` has no matchers.
+        """
+        with profiling.context(ping=config.name):
+            if schema is None:
+                schema = self.get_schema()
+            env = self.get_env()
+
+            probes = []
+            if schema_elements is None and config.matchers:
+                probes = self.get_probes()
+
+            if max_size is None:
+                max_size = self.default_max_size
+
+            with profiling.stage("size check"):
+                if env.get_size() >= max_size:
+                    raise SchemaException(
+                        "Environment must be smaller than max_size {}".format(max_size)
+                    )
+
+                if schema.get_size() >= max_size:
+                    raise SchemaException(
+                        "Schema must be smaller than max_size {}".format(max_size)
+                    )
+
+            schemas = {
+                config.name: self.make_schema(
+                    schema, probes, config, max_size, schema_elements=schema_elements
+                )
+            }
 
-        if any(schema.get_size() > max_size for schema in schemas.values()):
-            raise SchemaException(
-                "Schema must be smaller or equal max_size {}".format(max_size)
-            )
+            with profiling.stage("size check"):
+                if any(schema.get_size() > max_size for schema in schemas.values()):
+                    raise SchemaException(
+                        "Schema must be smaller or equal max_size {}".format(max_size)
+                    )
 
-        return schemas
+            return schemas
 
     @staticmethod
+    @profiling.stage("build")
     def make_schema(
-        env: Schema, probes: List[Probe], config: Config, max_size: int
+        env: Schema,
+        probes: List[Probe],
+        config: Config,
+        max_size: int,
+        *,
+        schema_elements: List[Tuple[tuple, Probe]] = None,
     ) -> Schema:
         """
         Fill in probes based on the config, and keep only the env
         parts of the schema. Throw away everything else.
         """
-        schema_elements = sorted(config.get_schema_elements(probes), key=lambda x: x[1])
+        if schema_elements is None:
+            schema_elements = config.get_schema_elements(probes)
+        schema_elements = sorted(schema_elements, key=lambda x: x[1])
 
         schema = env.clone()
         for schema_key, probe in schema_elements:
@@ -125,6 +181,13 @@ class GenericPing(object):
 
         return schema
 
+    @staticmethod
+    def with_schemas_base_url(url: str) -> str:
+        """Point a mozilla-pipeline-schemas URL at the overridden base URL."""
+        if not url.startswith(DEFAULT_SCHEMAS_BASE_URL):
+            return url
+        return url.replace(DEFAULT_SCHEMAS_BASE_URL, GenericPing.schemas_base_url, 1)
+
     @staticmethod
     def _slugify(text: str) -> str:
         """Get a valid slug from an arbitrary string"""
@@ -153,9 +216,18 @@ class GenericPing(object):
         return (GenericPing.cache_dir / GenericPing._slugify(url)).read_text()
 
     @staticmethod
+    @profiling.stage("fetch")
     def _get_json_str(url: str) -> str:
         if GenericPing._present_in_cache(url):
-            return GenericPing._retrieve_from_cache(url)
+            profiling.annotate(url=url, cache="hit")
+            cached = GenericPing._retrieve_from_cache(url)
+            counters.count("cache.hits")
+            counters.count("cache.bytes_read", len(cached))
+            return cached
+        profiling.annotate(url=url, cache="miss")
+        counters.count("cache.misses")
+        if url in GenericPing._failed_urls:
+            raise GenericPing._failed_urls[url]
 
         headers = {}
         if url.startswith(GenericPing.probe_info_base_url):
@@ -164,17 +236,29 @@ class GenericPing(object):
             headers["Cache-Control"] = "no-cache"
 
         r = _http_session.get(url, headers=headers)
-        r.raise_for_status()
+        counters.count("http.requests")
+        retries = getattr(r.raw, "retries", None)
+        if retries is not None:
+            counters.count("http.retries", len(retries.history))
+        try:
+            r.raise_for_status()
+        except requests.HTTPError as e:
+            if r.status_code == 404:
+                GenericPing._failed_urls[url] = e
+            raise
 
         final_json = r.content.decode(r.encoding or GenericPing.default_encoding)
         GenericPing._add_to_cache(url, final_json)
+        counters.count("cache.bytes_written", len(final_json))
 
         return final_json
 
     @staticmethod
     def _get_json(url: str) -> dict:
+        json_str = GenericPing._get_json_str(url)
         try:
-            return json.loads(GenericPing._get_json_str(url))
+            with profiling.stage("decode"):
+                return json.loads(json_str)
         except JSONDecodeError:
             logging.error("Unable to process JSON for url: %s", url)
             raise
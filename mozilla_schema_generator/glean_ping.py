@@ -5,19 +5,22 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import copy
+import json
 import logging
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from functools import cache
+from functools import cache, partial
 from pathlib import Path
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import yaml
 from requests import HTTPError
 
+from . import profiling
 from .config import Config
 from .generic_ping import GenericPing
 from .probes import GleanProbe
+from .repository_catalog import RepositoryCatalog
 from .schema import Schema
 
 ROOT_DIR = Path(__file__).parent
@@ -26,11 +29,7 @@ METRIC_BLOCKLIST = ROOT_DIR / "configs" / "metric_blocklist.yaml"
 
 logger = logging.getLogger(__name__)
 
-SCHEMA_URL_TEMPLATE = (
-    "https://raw.githubusercontent.com"
-    "/mozilla-services/mozilla-pipeline-schemas"
-    "/{branch}/schemas/glean/glean/"
-)
+SCHEMA_URL_TEMPLATE = GenericPing.schemas_base_url + "/{branch}/schemas/glean/glean/"
 
 SCHEMA_VERSION_TEMPLATE = "{schema_type}.{version}.schema.json"
 
@@ -38,6 +37,18 @@ DEFAULT_SCHEMA_URL = SCHEMA_URL_TEMPLATE + SCHEMA_VERSION_TEMPLATE.format(
     schema_type="glean", version=1
 )
 
+# The ping generation of a worker process, see `GleanPing._generate_schemas`
+_ping_worker = None
+
+
+def _init_ping_worker(glean, *args):
+    global _ping_worker
+    _ping_worker = partial(glean._generate_ping_schemas, *args)
+
+
+def _run_ping_worker(ping, pipeline_meta):
+    return _ping_worker(ping, pipeline_meta)
+
 
 class GleanPing(GenericPing):
     probes_url_template = GenericPing.probe_info_base_url + "/glean/{}/metrics"
@@ -50,6 +61,10 @@ class GleanPing(GenericPing):
 
     default_dependencies = ["glean-core"]
 
+    # Loaded once per process, or handed to workers with `set_shared_inputs`
+    _repository_catalog: Optional[RepositoryCatalog] = None
+    _metric_blocklist: Optional[Dict[str, Dict[str, List[str]]]] = None
+
     with open(BUG_1737656_TXT, "r") as f:
         bug_1737656_affected_tables = [
             line.strip() for line in f.readlines() if line.strip()
@@ -75,16 +90,50 @@ class GleanPing(GenericPing):
             **kwargs,
         )
 
-    def get_schema(self, generic_schema=False) -> Schema:
+    def get_schema(
+        self, generic_schema=False, *, schema_type="glean", version=None
+    ) -> Schema:
         """
         Fetch schema via URL.
 
         Unless *generic_schema* is set to true, this function makes some modifications
         to allow some workarounds for proper injection of metrics.
+
+        The template of `schema_type` and `version` (by default, the version of this
+        ping) is prepared once per process; every call returns a new copy of it.
         """
-        schema = super().get_schema()
+        if version is None:
+            version = self.version
+        return Schema(
+            json.loads(
+                self._get_template_json(
+                    self.branch_name, schema_type, version, generic_schema
+                )
+            )
+        )
+
+    def get_env(self) -> Schema:
+        return self.get_schema(generic_schema=True, version=1)
+
+    @staticmethod
+    def get_template_url(branch: str, schema_type: str, version: int) -> str:
+        return SCHEMA_URL_TEMPLATE.format(
+            branch=branch
+        ) + SCHEMA_VERSION_TEMPLATE.format(schema_type=schema_type, version=version)
+
+    @staticmethod
+    @cache
+    def _get_template_json(
+        branch: str, schema_type: str, version: int, generic_schema: bool
+    ) -> str:
+        # Kept serialized, as parsing is cheaper than deep-copying the template
+        schema = Schema(
+            GleanPing._get_json(
+                GleanPing.get_template_url(branch, schema_type, version)
+            )
+        )
         if generic_schema:
-            return schema
+            return json.dumps(schema.schema)
 
         # We need to inject placeholders for the url2, text2, etc. types as part
         # of mitigation for https://bugzilla.mozilla.org/show_bug.cgi?id=1737656
@@ -97,43 +146,59 @@ class GleanPing(GenericPing):
                 metric1,
             )
 
-        return schema
+        return json.dumps(schema.schema)
 
-    @cache
     def get_dependencies(self):
-        # Get all of the library dependencies for the application that
-        # are also known about in the repositories file.
+        return GleanPing.resolve_dependencies(self.repo_name)
 
+    @staticmethod
+    @cache
+    def resolve_dependencies(repo_name: str) -> List[str]:
+        """Get all of the library dependencies for the application that
+        are also known about in the repositories file.
+
+        Resolved once per repository and process; failing lookups fall back
+        to the default dependencies, and are not retried either.
+        """
         # The dependencies are specified using library names, but we need to
         # map those back to the name of the repository in the repository file.
         try:
-            dependencies = self._get_json(
-                self.dependencies_url_template.format(self.repo_name)
+            dependencies = GleanPing._get_json(
+                GleanPing.dependencies_url_template.format(repo_name)
             )
         except HTTPError:
-            logging.info(f"For {self.repo_name}, using default Glean dependencies")
-            return self.default_dependencies
-
-        dependency_library_names = list(dependencies.keys())
-
-        repos = GleanPing._get_json(GleanPing.repos_url)
-        repos_by_dependency_name = {}
-        for repo in repos:
-            for library_name in repo.get("library_names", []):
-                repos_by_dependency_name[library_name] = repo["name"]
+            logging.info(f"For {repo_name}, using default Glean dependencies")
+            return GleanPing.default_dependencies
 
-        dependencies = []
-        for name in dependency_library_names:
-            if name in repos_by_dependency_name:
-                dependencies.append(repos_by_dependency_name[name])
+        dependencies = [
+            GleanPing.get_repository_catalog().get_library_repo_name(name)
+            for name in dependencies.keys()
+        ]
+        dependencies = [name for name in dependencies if name is not None]
 
         if len(dependencies) == 0:
-            logging.info(f"For {self.repo_name}, using default Glean dependencies")
-            return self.default_dependencies
+            logging.info(f"For {repo_name}, using default Glean dependencies")
+            return GleanPing.default_dependencies
 
-        logging.info(f"For {self.repo_name}, found Glean dependencies: {dependencies}")
+        logging.info(f"For {repo_name}, found Glean dependencies: {dependencies}")
         return dependencies
 
+    @staticmethod
+    def _is_blocklist_applicable(
+        metric: Dict[str, Any], blocked_pings: List[str]
+    ) -> bool:
+        """Whether removing `blocked_pings` from the metric would have any effect.
+
+        Only metrics that have been removed from the source since a fixed date
+        (2025-01-01) are affected. This allows metrics to be added back to the schema.
+        """
+        return not (
+            metric["in-source"]
+            or len(blocked_pings) == 0
+            or datetime.fromisoformat(metric["history"][-1]["dates"]["last"])
+            >= datetime(year=2025, month=1, day=1)
+        )
+
     @staticmethod
     def remove_pings_from_metric(
         metric: Dict[str, Any], blocked_pings: List[str]
@@ -143,12 +208,7 @@ class GleanPing(GenericPing):
         Only removes if the given metric has been removed from the source since a fixed date
         (2025-01-01). This allows metrics to be added back to the schema.
         """
-        if (
-            metric["in-source"]
-            or len(blocked_pings) == 0
-            or datetime.fromisoformat(metric["history"][-1]["dates"]["last"])
-            >= datetime(year=2025, month=1, day=1)
-        ):
+        if not GleanPing._is_blocklist_applicable(metric, blocked_pings):
             return metric
 
         for history_entry in metric["history"]:
@@ -158,75 +218,130 @@ class GleanPing(GenericPing):
 
         return metric
 
-    def get_probes(self) -> List[GleanProbe]:
-        data = self._get_json(self.probes_url)
+    @staticmethod
+    def index_metric_blocklist(metric_blocklist) -> Dict[str, Dict[str, List[str]]]:
+        """Turn the app or library -> ping_type -> metric_names blocklist, as found in
+        `metric_blocklist.yaml`, into an app or library -> metric_name -> ping_types map.
+        """
+        index = {}
+        for name, blocklist in metric_blocklist.items():
+            index[name] = {}
+            for ping_type, metric_names in blocklist.items():
+                for metric_name in metric_names:
+                    index[name].setdefault(metric_name, []).append(ping_type)
+        return index
 
-        # blocklist needs to be applied here instead of generate_schema because it needs to be
-        # dependency-aware; metrics can move between app and library and still be in the schema
-        # turn blocklist into metric_name -> ping_types map
-        blocklist = defaultdict(list)
-        for ping_type, metric_names in self.metric_blocklist.get(
-            self.get_app_name(), {}
-        ).items():
-            for metric_name in metric_names:
-                blocklist[metric_name].append(ping_type)
-
-        probes = [
-            (name, self.remove_pings_from_metric(defn, blocklist.get(name, [])))
-            for name, defn in data.items()
-        ]
+    def _get_metric_definitions(self) -> List[Tuple[str, str, Dict]]:
+        """Get the metric definitions of the app and of all of its dependencies.
+
+        Each entry is a tuple of (blocklist name, metric name, definition), where the
+        blocklist name is the key of the owning app or library in the metric blocklist.
+        """
+        data = self._get_json(self.probes_url)
+        app_name = self.get_app_name()
+        definitions = [(app_name, name, defn) for name, defn in data.items()]
 
         for dependency in self.get_dependencies():
             dependency_probes = self._get_json(
                 self.probes_url_template.format(dependency)
             )
-
-            dependency_blocklist = defaultdict(list)
-            for ping_type, metric_names in self.metric_blocklist.get(
-                dependency, {}
-            ).items():
-                for metric_name in metric_names:
-                    dependency_blocklist[metric_name].append(ping_type)
-
-            probes += [
-                (
-                    name,
-                    self.remove_pings_from_metric(
-                        defn, dependency_blocklist.get(name, [])
-                    ),
-                )
-                for name, defn in dependency_probes.items()
+            definitions += [
+                (dependency, name, defn) for name, defn in dependency_probes.items()
             ]
 
+        return definitions
+
+    @staticmethod
+    def _make_probes(_id: str, defn: Dict, pings) -> List[GleanProbe]:
+        """Create the probes for a single metric definition."""
+        probe = GleanProbe(_id, defn, pings=pings)
+        processed = [probe]
+
+        # Handling probe type changes (Bug 1870317)
+        probe_types = {hist["type"] for hist in defn[probe.history_key]}
+        if len(probe_types) > 1:
+            # The probe type changed at some point in history.
+            # Create schema entry for each type.
+            hist_defn = defn.copy()
+
+            # No new entry needs to be created for the current probe type
+            probe_types.remove(defn["type"])
+
+            for hist in hist_defn[probe.history_key]:
+                # Create a new entry for a historic type
+                if hist["type"] in probe_types:
+                    hist_defn["type"] = hist["type"]
+                    probe = GleanProbe(_id, hist_defn, pings=pings)
+                    processed.append(probe)
+
+                    # Keep track of the types entries were already created for
+                    probe_types.remove(hist["type"])
+
+        return processed
+
+    @profiling.stage("probes")
+    def get_probes(self) -> List[GleanProbe]:
+        # blocklist needs to be applied here instead of generate_schema because it needs to be
+        # dependency-aware; metrics can move between app and library and still be in the schema
+        definitions = self._get_metric_definitions()
         pings = self.get_pings()
 
         processed = []
-        for _id, defn in probes:
-            probe = GleanProbe(_id, defn, pings=pings)
-            processed.append(probe)
-
-            # Handling probe type changes (Bug 1870317)
-            probe_types = {hist["type"] for hist in defn[probe.history_key]}
-            if len(probe_types) > 1:
-                # The probe type changed at some point in history.
-                # Create schema entry for each type.
-                hist_defn = defn.copy()
-
-                # No new entry needs to be created for the current probe type
-                probe_types.remove(defn["type"])
-
-                for hist in hist_defn[probe.history_key]:
-                    # Create a new entry for a historic type
-                    if hist["type"] in probe_types:
-                        hist_defn["type"] = hist["type"]
-                        probe = GleanProbe(_id, hist_defn, pings=pings)
-                        processed.append(probe)
-
-                        # Keep track of the types entries were already created for
-                        probe_types.remove(hist["type"])
+        for blocklist_name, _id, defn in definitions:
+            defn = self.remove_pings_from_metric(
+                defn, self.metric_blocklist.get(blocklist_name, {}).get(_id, [])
+            )
+            processed += self._make_probes(_id, defn, pings)
 
         return processed
 
+    @profiling.stage("probes")
+    def get_probes_with_blocklist(
+        self, metric_blocklist
+    ) -> Tuple[List[GleanProbe], Dict[int, GleanProbe]]:
+        """Get the probes both without and with `metric_blocklist` applied.
+
+        The probes are constructed once without the blocklist. Only the metrics
+        the blocklist actually changes are constructed a second time; these are
+        returned as a map from their index in the unblocked list to the probe that
+        replaces them when the blocklist is applied.
+        """
+        probes, replacements, _ = self._construct_probes(
+            self._get_metric_definitions(), metric_blocklist, self.get_pings()
+        )
+        return probes, replacements
+
+    def _construct_probes(
+        self, definitions: List[Tuple[str, str, Dict]], metric_blocklist, pings
+    ) -> Tuple[List[GleanProbe], Dict[int, GleanProbe], List[str]]:
+        """Construct the probes of `definitions`, see `get_probes_with_blocklist`.
+
+        Additionally returns the key of the definition each probe was created from,
+        in the form "{blocklist name}/{metric name}".
+        """
+        probes = []
+        replacements = {}
+        keys = []
+        for blocklist_name, _id, defn in definitions:
+            blocked_pings = metric_blocklist.get(blocklist_name, {}).get(_id, [])
+
+            # Constructing a probe modifies the definition, so the blocked
+            # definition has to be copied before the unblocked probe is built.
+            blocked_defn = None
+            if self._is_blocklist_applicable(defn, blocked_pings):
+                blocked_defn = self.remove_pings_from_metric(
+                    copy.deepcopy(defn), blocked_pings
+                )
+
+            if blocked_defn is not None:
+                blocked_probes = self._make_probes(_id, blocked_defn, pings)
+                replacements.update(enumerate(blocked_probes, start=len(probes)))
+            group = self._make_probes(_id, defn, pings)
+            probes += group
+            keys += [f"{blocklist_name}/{_id}"] * len(group)
+
+        return probes, replacements, keys
+
     def _get_ping_data(self) -> Dict[str, Dict]:
         url = self.ping_url_template.format(self.repo_name)
         ping_data = GleanPing._get_json(url)
@@ -273,8 +388,7 @@ class GleanPing(GenericPing):
         # moz_pipeline_metadata_defaults so they need to be applied here.
 
         # 1.  Get repo and pipeline default metadata.
-        repos = self.get_repos()
-        current_repo = next((x for x in repos if x.get("app_id") == self.app_id), {})
+        current_repo = self.get_repository_catalog().get_repo(self.app_id) or {}
         default_metadata = current_repo.get("moz_pipeline_metadata_defaults", {})
 
         # 2.  Apply the default metadata to each dependency defined ping.
@@ -391,111 +505,355 @@ class GleanPing(GenericPing):
         # The ping was created with include_info_sections = False. The fields can be excluded.
         return False
 
-    def set_schema_url(self, metadata):
+    @staticmethod
+    def get_schema_type(metadata) -> str:
         """
         Switch between the glean-min and glean schemas if the ping does not require
         info sections as specified in the parsed ping info in probe scraper.
         """
         if not metadata["include_info_sections"]:
-            self.schema_url = SCHEMA_URL_TEMPLATE.format(
-                branch=self.branch_name
-            ) + SCHEMA_VERSION_TEMPLATE.format(
-                schema_type="glean-min", version=self.version
+            return "glean-min"
+        return "glean"
+
+    def get_input_urls(self, versions=None) -> List[str]:
+        """Get the URLs of all documents the schemas of `versions` depend on.
+
+        This covers the probe-info documents of the app and its dependencies,
+        and the templates of every version. The repositories and app listings
+        are shared by all apps; see `get_catalog_entries` for the entries the
+        schemas depend on.
+        """
+        if versions is None:
+            versions = (self.version,)
+
+        urls = [
+            self.probes_url,
+            self.ping_url_template.format(self.repo_name),
+            self.dependencies_url_template.format(self.repo_name),
+        ]
+        for dependency in self.get_dependencies():
+            urls.append(self.probes_url_template.format(dependency))
+            urls.append(self.ping_url_template.format(dependency))
+        for version in versions:
+            for schema_type in ("glean", "glean-min"):
+                urls.append(
+                    self.get_template_url(self.branch_name, schema_type, version)
+                )
+        return urls
+
+    def get_catalog_entries(self) -> Dict[str, Any]:
+        """Get the entries of the repositories and app listings the schemas
+        depend on: those of the app and of its dependencies."""
+        catalog = self.get_repository_catalog()
+        return {
+            "repository": catalog.get_repo(self.app_id),
+            "app_listing": catalog.get_app_listing(self.app_id),
+            "dependencies": {
+                dependency: catalog.get_repo_by_name(dependency)
+                for dependency in self.get_dependencies()
+            },
+        }
+
+    def get_ping_config(
+        self,
+        config: Config,
+        ping: str,
+        pipeline_meta: Dict,
+        blocked_distribution_pings=("events", "baseline"),
+    ) -> Config:
+        """Specialize the matchers of `config` to the metrics sent in `ping`."""
+        matchers = {
+            loc: m.clone(new_table_group=ping) for loc, m in config.matchers.items()
+        }
+
+        # Four newly introduced metric types were incorrectly deployed
+        # as repeated key/value structs in all Glean ping tables existing prior
+        # to November 2021. We maintain the incorrect fields for existing tables
+        # by disabling the associated matchers.
+        # Note that each of these types now has a "2" matcher ("text2", "url2", etc.)
+        # defined that will allow metrics of these types to be injected into proper
+        # structs. The gcp-ingestion repository includes logic to rewrite these
+        # metrics under the "2" names.
+        # See https://bugzilla.mozilla.org/show_bug.cgi?id=1737656
+        bq_identifier = "{bq_dataset_family}.{bq_table}".format(**pipeline_meta)
+        if bq_identifier in self.bug_1737656_affected_tables:
+            matchers = {
+                loc: m
+                for loc, m in matchers.items()
+                if not m.matcher.get("bug_1737656_affected")
+            }
+
+        for matcher in matchers.values():
+            matcher.matcher["send_in_pings"]["contains"] = ping
+
+            # temporarily block distributions from being added to events and baseline pings
+            # https://mozilla-hub.atlassian.net/browse/DENG-10606
+            if (
+                blocked_distribution_pings
+                and ping in blocked_distribution_pings
+                and matcher.type.endswith("_distribution")
+            ):
+                matcher.matcher["send_in_pings"]["not_contains"] = ping
+
+        return Config(ping, matchers=matchers)
+
+    def get_blocked_distribution_metrics(
+        self, config, blocked_distribution_pings=("events", "baseline")
+    ) -> Dict[str, List[str]]:
+        """Find the distribution metrics dropped by `blocked_distribution_pings`.
+
+        Only the match stage is run for the blocked pings; no schemas are built.
+        Returns the names of the dropped metrics of every affected ping.
+        """
+        pings = self.get_pings_and_pipeline_metadata()
+        probes = None
+        blocked = {}
+
+        for ping, pipeline_meta in pings.items():
+            if ping not in blocked_distribution_pings:
+                continue
+            if probes is None:
+                probes = self.get_probes()
+
+            ping_config = self.get_ping_config(
+                config, ping, pipeline_meta, blocked_distribution_pings=None
             )
-        else:
-            self.schema_url = SCHEMA_URL_TEMPLATE.format(
-                branch=self.branch_name
-            ) + SCHEMA_VERSION_TEMPLATE.format(
-                schema_type="glean", version=self.version
+            distribution_config = Config(
+                ping,
+                matchers={
+                    loc: m
+                    for loc, m in ping_config.matchers.items()
+                    if m.type.endswith("_distribution")
+                },
+            )
+            names = sorted(
+                {p.name for _, p in distribution_config.get_schema_elements(probes)}
             )
+            if names:
+                blocked[ping] = names
+
+        return blocked
 
     def generate_schema(
         self,
         config,
         generic_schema=False,
         blocked_distribution_pings=("events", "baseline"),
+        workers: int = None,
     ) -> Dict[str, Schema]:
-        pings = self.get_pings_and_pipeline_metadata()
-        schemas = {}
+        probes = []
+        if not generic_schema and config.matchers:
+            probes = self.get_probes()
+        schemas = self._generate_schemas(
+            config,
+            probes,
+            {self.version: {}},
+            generic_schema=generic_schema,
+            blocked_distribution_pings=blocked_distribution_pings,
+            workers=workers,
+        )
+        return schemas[self.version]
 
-        for ping, pipeline_meta in pings.items():
-            matchers = {
-                loc: m.clone(new_table_group=ping) for loc, m in config.matchers.items()
-            }
+    def generate_versioned_schemas(
+        self,
+        config,
+        versions: Dict[int, bool],
+        generic_schema=False,
+        blocked_distribution_pings=("events", "baseline"),
+        workers: int = None,
+    ) -> Dict[int, Dict[str, Schema]]:
+        """Generate the schemas of several versions in a single pass.
 
-            # Four newly introduced metric types were incorrectly deployed
-            # as repeated key/value structs in all Glean ping tables existing prior
-            # to November 2021. We maintain the incorrect fields for existing tables
-            # by disabling the associated matchers.
-            # Note that each of these types now has a "2" matcher ("text2", "url2", etc.)
-            # defined that will allow metrics of these types to be injected into proper
-            # structs. The gcp-ingestion repository includes logic to rewrite these
-            # metrics under the "2" names.
-            # See https://bugzilla.mozilla.org/show_bug.cgi?id=1737656
-            bq_identifier = "{bq_dataset_family}.{bq_table}".format(**pipeline_meta)
-            if bq_identifier in self.bug_1737656_affected_tables:
-                matchers = {
-                    loc: m
-                    for loc, m in matchers.items()
-                    if not m.matcher.get("bug_1737656_affected")
-                }
-
-            for matcher in matchers.values():
-                matcher.matcher["send_in_pings"]["contains"] = ping
-
-                # temporarily block distributions from being added to events and baseline pings
-                # https://mozilla-hub.atlassian.net/browse/DENG-10606
-                if (
-                    blocked_distribution_pings
-                    and ping in blocked_distribution_pings
-                    and matcher.type.endswith("_distribution")
-                ):
-                    matcher.matcher["send_in_pings"]["not_contains"] = ping
-
-            new_config = Config(ping, matchers=matchers)
-
-            defaults = {"mozPipelineMetadata": pipeline_meta}
-
-            # Adjust the schema path if the ping does not require info sections
-            self.set_schema_url(pipeline_meta)
-            if generic_schema:  # Use the generic glean ping schema
-                schema = self.get_schema(generic_schema=True)
-                schema.schema.update(defaults)
-                schemas[new_config.name] = schema
+        `versions` maps each schema version to whether the metric blocklist
+        applies to it. Fetched data, probes and match results are shared between
+        the versions; only the probes changed by the blocklist are matched again,
+        and only the schema templates are specific to each version.
+
+        See `_generate_schemas` for `workers`.
+        """
+        probes, replacements = [], {}
+        if not generic_schema and config.matchers:
+            if any(versions.values()):
+                probes, replacements = self.get_probes_with_blocklist(
+                    self.get_metric_blocklist()
+                )
             else:
-                generated = super().generate_schema(new_config)
-                for schema in generated.values():
-                    # We want to override each individual key with assembled defaults,
-                    # but keep values _inside_ them if they have been set in the schemas.
-                    for key, value in defaults.items():
-                        if key not in schema.schema:
-                            schema.schema[key] = {}
-                        schema.schema[key].update(value)
-                schemas.update(generated)
+                probes = self.get_probes_with_blocklist({})[0]
+
+        return self._generate_schemas(
+            config,
+            probes,
+            {
+                version: replacements if use_metrics_blocklist else {}
+                for version, use_metrics_blocklist in versions.items()
+            },
+            generic_schema=generic_schema,
+            blocked_distribution_pings=blocked_distribution_pings,
+            workers=workers,
+        )
 
+    def _generate_schemas(
+        self,
+        config,
+        probes: List[GleanProbe],
+        variants: Dict[int, Dict[int, GleanProbe]],
+        generic_schema=False,
+        blocked_distribution_pings=("events", "baseline"),
+        workers: int = None,
+    ) -> Dict[int, Dict[str, Schema]]:
+        """Generate the schemas of every version in `variants`.
+
+        `variants` maps each version onto the probes replacing entries of `probes`
+        (by index) for that version.
+
+        With more than one of `workers`, the pings are generated on a pool of
+        worker processes. The schemas are returned in the order of the pings
+        either way.
+        """
+        pings = self.get_pings_and_pipeline_metadata()
+        args = (config, probes, variants, generic_schema, blocked_distribution_pings)
+
+        if workers is not None and workers > 1 and len(pings) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(pings)),
+                initializer=_init_ping_worker,
+                initargs=(self, *args),
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        profiling.wrap(_run_ping_worker), ping, pipeline_meta
+                    )
+                    for ping, pipeline_meta in pings.items()
+                ]
+                results = [profiling.unwrap(future.result()) for future in futures]
+        else:
+            results = [
+                self._generate_ping_schemas(*args, ping, pipeline_meta)
+                for ping, pipeline_meta in pings.items()
+            ]
+
+        schemas = {version: {} for version in variants}
+        for ping_schemas in results:
+            for version, (name, schema) in ping_schemas.items():
+                schemas[version][name] = schema
         return schemas
 
+    def _generate_ping_schemas(
+        self,
+        config,
+        probes: List[GleanProbe],
+        variants: Dict[int, Dict[int, GleanProbe]],
+        generic_schema,
+        blocked_distribution_pings,
+        ping: str,
+        pipeline_meta: Dict,
+    ) -> Dict[int, Tuple[str, Schema]]:
+        """Generate the (name, schema) of a single ping for every version in `variants`."""
+        with profiling.context(app=self.app_id, ping=ping):
+            new_config = self.get_ping_config(
+                config, ping, pipeline_meta, blocked_distribution_pings
+            )
+            if not generic_schema:
+                schema_elements = new_config.get_schema_elements_by_variant(
+                    probes, variants
+                )
+
+            schemas = {}
+            for version in variants:
+                if generic_schema:  # Use the generic glean ping schema
+                    # Adjust the schema path if the ping does not require info sections
+                    schema = self.get_schema(
+                        generic_schema=True,
+                        schema_type=self.get_schema_type(pipeline_meta),
+                        version=version,
+                    )
+                    schema.schema.update(
+                        {"mozPipelineMetadata": copy.deepcopy(pipeline_meta)}
+                    )
+                else:
+                    schema = self.build_ping_schema(
+                        new_config, pipeline_meta, version, schema_elements[version]
+                    )
+                    self.apply_pipeline_metadata(schema, pipeline_meta)
+                schemas[version] = (new_config.name, schema)
+
+            return schemas
+
+    def build_ping_schema(
+        self,
+        ping_config: Config,
+        pipeline_meta: Dict,
+        version: int,
+        schema_elements: List[Tuple[tuple, GleanProbe]],
+    ) -> Schema:
+        """Build the schema of a single ping from its matched schema elements."""
+        # Adjust the schema path if the ping does not require info sections
+        schema = self.get_schema(
+            schema_type=self.get_schema_type(pipeline_meta), version=version
+        )
+        generated = super().generate_schema(
+            ping_config, schema=schema, schema_elements=schema_elements
+        )
+        return generated[ping_config.name]
+
+    @staticmethod
+    def apply_pipeline_metadata(schema: Schema, pipeline_meta: Dict):
+        defaults = {"mozPipelineMetadata": copy.deepcopy(pipeline_meta)}
+        # We want to override each individual key with assembled defaults,
+        # but keep values _inside_ them if they have been set in the schemas.
+        for key, value in defaults.items():
+            if key not in schema.schema:
+                schema.schema[key] = {}
+            schema.schema[key].update(value)
+
+    @staticmethod
+    def get_repository_catalog() -> RepositoryCatalog:
+        """
+        Retrieve and index the Glean repositories and app listings, once per process
+        """
+        if GleanPing._repository_catalog is None:
+            GleanPing._repository_catalog = RepositoryCatalog(
+                GleanPing._get_json(GleanPing.repos_url),
+                GleanPing._get_json(GleanPing.app_listings_url),
+            )
+        return GleanPing._repository_catalog
+
     @staticmethod
     def get_repos():
         """
         Retrieve metadata for all non-library Glean repositories
         """
-        repos = GleanPing._get_json(GleanPing.repos_url)
-        return [repo for repo in repos if "library_names" not in repo]
+        return GleanPing.get_repository_catalog().get_app_repos()
 
     def get_app_name(self) -> str:
         """Get app name associated with the app id.
 
         e.g. org-mozilla-firefox -> fenix
         """
-        apps = GleanPing._get_json(GleanPing.app_listings_url)
-        # app id in app-listings has "." instead of "-" so using document_namespace
-        app_name = [
-            app["app_name"] for app in apps if app["document_namespace"] == self.app_id
-        ]
-        return app_name[0] if len(app_name) > 0 else self.app_id
+        return self.get_repository_catalog().get_app_name(self.app_id) or self.app_id
+
+    @staticmethod
+    def get_metric_blocklist() -> Dict[str, Dict[str, List[str]]]:
+        """Get the metric blocklist, indexed by app or library and metric name.
+
+        Loaded once per process; see `index_metric_blocklist`.
+        """
+        if GleanPing._metric_blocklist is None:
+            with open(METRIC_BLOCKLIST, "r") as f:
+                GleanPing._metric_blocklist = GleanPing.index_metric_blocklist(
+                    yaml.safe_load(f)
+                )
+        return GleanPing._metric_blocklist
+
+    @staticmethod
+    def get_shared_inputs() -> Tuple[RepositoryCatalog, Dict]:
+        """Load the repository catalog and metric blocklist, e.g. to hand them to
+        worker processes with `set_shared_inputs`."""
+        return GleanPing.get_repository_catalog(), GleanPing.get_metric_blocklist()
 
     @staticmethod
-    def get_metric_blocklist():
-        with open(METRIC_BLOCKLIST, "r") as f:
-            return yaml.safe_load(f)
+    def set_shared_inputs(
+        repository_catalog: RepositoryCatalog, metric_blocklist: Dict
+    ):
+        GleanPing._repository_catalog = repository_catalog
+        GleanPing._metric_blocklist = metric_blocklist
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Incrementally update previously generated Glean schemas.
+
+The metrics of an app usually change by a few added metrics between runs. Instead
+of matching every probe against every ping again, the previous generation is kept
+in a state file. The new metric definitions are diffed against the previous ones,
+and only the added, removed or changed probes are matched and patched into the
+previously generated schemas.
+
+A ping is fully rebuilt whenever patching cannot reproduce the result of a full
+build, i.e. when its template, matchers or the set of pings changed, or when the
+patch would change the order of fields or add or remove a whole group.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import counters
+from .config import Config
+from .generic_ping import GenericPing
+from .glean_ping import GleanPing
+from .manifest import fingerprint_package
+from .probes import GleanProbe
+from .schema import Schema, SchemaException
+from .utils import prepend_properties
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=sorted).encode()
+    ).hexdigest()
+
+
+def _sort_key(probe: GleanProbe) -> List[str]:
+    # Matches the ordering of `Probe.__lt__`
+    return [probe.get_first_added().isoformat(), probe.get_name()]
+
+
+class IncrementalGleanPing(object):
+    """Generate the schemas of a Glean app, reusing a previous generation."""
+
+    def __init__(self, glean: GleanPing, state_path):
+        self.glean = glean
+        self.state_path = Path(state_path)
+
+        self.state = {}
+        if self.state_path.exists():
+            state = json.loads(self.state_path.read_text())
+            if state.get("version") == STATE_VERSION:
+                self.state = state
+
+        # statistics of the last generation, for logging and tests
+        self.patched = []
+        self.rebuilt = []
+
+    def save(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_path.write_text(json.dumps(self.state))
+
+    def generate_versioned_schemas(
+        self,
+        config: Config,
+        versions: Dict[int, bool],
+        generic_schema=False,
+        blocked_distribution_pings=("events", "baseline"),
+        workers: int = None,
+    ) -> Dict[int, Dict[str, Schema]]:
+        """See `GleanPing.generate_versioned_schemas`.
+
+        `workers` only applies to generic schemas; patches and rebuilds are
+        generated in this process.
+        """
+        if generic_schema:
+            # Nothing to patch without probes
+            return self.glean.generate_versioned_schemas(
+                config,
+                versions,
+                generic_schema=True,
+                blocked_distribution_pings=blocked_distribution_pings,
+                workers=workers,
+            )
+
+        glean = self.glean
+        definitions = glean._get_metric_definitions()
+        pings = sorted(glean.get_pings())
+        pipeline_metadata = glean.get_pings_and_pipeline_metadata()
+        metric_blocklist = (
+            glean.get_metric_blocklist() if any(versions.values()) else {}
+        )
+
+        # Constructing probes modifies their definitions, so take the digests first
+        definition_digests = {
+            f"{blocklist_name}/{_id}": _digest(defn)
+            for blocklist_name, _id, defn in definitions
+        }
+
+        previous_versions = self.state.get("versions", {})
+        digests, touched = {}, {}
+        for version, use_metrics_blocklist in versions.items():
+            # The digest of every definition, as seen by this version
+            digests[version] = {}
+            for blocklist_name, _id, defn in definitions:
+                key = f"{blocklist_name}/{_id}"
+                blocked_pings = metric_blocklist.get(blocklist_name, {}).get(_id, [])
+                if not (
+                    use_metrics_blocklist
+                    and glean._is_blocklist_applicable(defn, blocked_pings)
+                ):
+                    blocked_pings = []
+                digests[version][key] = _digest(
+                    [definition_digests[key], sorted(blocked_pings)]
+                )
+
+            previous = previous_versions.get(str(version))
+            touched[version] = None
+            if previous is not None and previous["pings"] == pings:
+                touched[version] = {
+                    key
+                    for key in digests[version].keys() | previous["definitions"].keys()
+                    if digests[version].get(key) != previous["definitions"].get(key)
+                }
+
+        # Keep unmodified copies of the touched definitions for the delta probes
+        all_touched = set().union(*(t for t in touched.values() if t is not None))
+        delta_definitions = [
+            (blocklist_name, _id, copy.deepcopy(defn))
+            for blocklist_name, _id, defn in definitions
+            if f"{blocklist_name}/{_id}" in all_touched
+        ]
+
+        full_probes = None
+        new_state = {"version": STATE_VERSION, "versions": {}}
+        schemas = {}
+
+        for version, use_metrics_blocklist in versions.items():
+            previous = previous_versions.get(str(version))
+            delta_probes = None
+            version_state = {
+                "pings": pings,
+                "definitions": digests[version],
+                "schemas": {},
+            }
+            schemas[version] = {}
+
+            for ping, pipeline_meta in pipeline_metadata.items():
+                ping_config = glean.get_ping_config(
+                    config, ping, pipeline_meta, blocked_distribution_pings
+                )
+                ping_fingerprint = self._get_ping_fingerprint(
+                    ping_config, pipeline_meta, version
+                )
+
+                result = None
+                previous_ping = (previous or {}).get("schemas", {}).get(ping)
+                if (
+                    touched[version] is not None
+                    and previous_ping is not None
+                    and previous_ping["fingerprint"] == ping_fingerprint
+                ):
+                    if delta_probes is None:
+                        delta_probes = self._construct_delta_probes(
+                            delta_definitions,
+                            touched[version],
+                            metric_blocklist if use_metrics_blocklist else {},
+                        )
+                    result = self._patch_schema(
+                        ping_config,
+                        pipeline_meta,
+                        version,
+                        previous_ping,
+                        touched[version],
+                        delta_probes,
+                    )
+
+                if result is None:
+                    if full_probes is None:
+                        full_probes = glean._construct_probes(
+                            definitions, metric_blocklist, pings
+                        )
+                    result = self._build_schema(
+                        ping_config,
+                        pipeline_meta,
+                        version,
+                        full_probes,
+                        use_metrics_blocklist,
+                    )
+                    self.rebuilt.append((version, ping))
+                else:
+                    self.patched.append((version, ping))
+
+                schema, elements = result
+                version_state["schemas"][ping] = {
+                    "fingerprint": ping_fingerprint,
+                    "elements": elements,
+                    "schema": schema.schema,
+                }
+
+                schema = schema.clone()
+                glean.apply_pipeline_metadata(schema, pipeline_meta)
+                schemas[version][ping] = schema
+
+            new_state["versions"][str(version)] = version_state
+
+        logger.info(
+            f"For {glean.app_id}, patched {len(self.patched)} and "
+            f"rebuilt {len(self.rebuilt)} schemas"
+        )
+        self.state = new_state
+        return schemas
+
+    def _get_ping_fingerprint(
+        self, ping_config: Config, pipeline_meta: Dict, version: int
+    ) -> str:
+        """Fingerprint everything a ping's schema depends on, except for probes."""
+        schema_url = self.glean.get_template_url(
+            self.glean.branch_name, self.glean.get_schema_type(pipeline_meta), version
+        )
+        return _digest(
+            [
+                fingerprint_package(),
+                GenericPing._get_json_str(schema_url),
+                [
+                    [list(key), m.type, m.table_group, m.matcher]
+                    for key, m in ping_config.matchers.items()
+                ],
+            ]
+        )
+
+    def _construct_delta_probes(
+        self, definitions, touched, metric_blocklist
+    ) -> Dict[str, List[GleanProbe]]:
+        """Construct the probes of the touched definitions only."""
+        pings = self.glean.get_pings()
+        probes = {}
+        for blocklist_name, _id, defn in definitions:
+            key = f"{blocklist_name}/{_id}"
+            if key not in touched:
+                continue
+            defn = self.glean.remove_pings_from_metric(
+                copy.deepcopy(defn),
+                metric_blocklist.get(blocklist_name, {}).get(_id, []),
+            )
+            probes[key] = self.glean._make_probes(_id, defn, pings)
+        return probes
+
+    def _build_schema(
+        self, ping_config, pipeline_meta, version, full_probes, use_metrics_blocklist
+    ) -> Tuple[Schema, List]:
+        probes, replacements, keys = full_probes
+        variants = {version: replacements if use_metrics_blocklist else {}}
+        schema_elements = ping_config.get_schema_elements_by_variant(probes, variants)[
+            version
+        ]
+
+        schema = self.glean.build_ping_schema(
+            ping_config, pipeline_meta, version, schema_elements
+        )
+
+        key_by_probe = {id(p): k for p, k in zip(probes, keys)}
+        key_by_probe.update({id(replacements[i]): keys[i] for i in replacements})
+        elements = [
+            [list(schema_key), key_by_probe[id(probe)], probe.name, _sort_key(probe)]
+            for schema_key, probe in sorted(schema_elements, key=lambda x: x[1])
+        ]
+        return schema, elements
+
+    def _patch_schema(
+        self,
+        ping_config: Config,
+        pipeline_meta: Dict,
+        version: int,
+        previous_ping: Dict,
+        touched,
+        delta_probes: Dict[str, List[GleanProbe]],
+    ) -> Optional[Tuple[Schema, List]]:
+        """Apply the changed probes to the previous schema of the ping.
+
+        Returns None if the result would differ from a full build.
+        """
+        old_elements = previous_ping["elements"]
+        kept = [e for e in old_elements if e[1] not in touched]
+        removed = [e for e in old_elements if e[1] in touched]
+
+        added = []
+        for key, probes in delta_probes.items():
+            for probe in probes:
+                for match_key, matcher in ping_config.matchers.items():
+                    if matcher.matches(probe):
+                        added.append((prepend_properties(match_key), key, probe))
+        added.sort(key=lambda x: x[2])
+
+        if not removed and not added:
+            return Schema(previous_ping["schema"]), old_elements
+
+        # A field that is set more than once depends on the order of all matches,
+        # and a probe without a description inherits the previous one of its group.
+        old_fields = [(tuple(e[0]), e[2]) for e in old_elements]
+        new_fields = [(e[0], e[2].name) for e in added]
+        kept_fields = {(tuple(e[0]), e[2]) for e in kept}
+        if (
+            len(old_fields) != len(set(old_fields))
+            or len(new_fields) != len(set(new_fields))
+            or kept_fields & set(new_fields)
+            or not all(e[2].description for e in added)
+        ):
+            return None
+
+        # Groups that lose their last field, or gain their first, are added or
+        # deleted as a whole by a full build.
+        kept_by_group = {}
+        for e in kept:
+            kept_by_group.setdefault(tuple(e[0]), []).append(e[3])
+        new_groups = {e[0] for e in added}
+        removed_groups = {tuple(e[0]) for e in removed}
+        if any(g not in kept_by_group and g not in new_groups for g in removed_groups):
+            return None
+        if any(g not in kept_by_group and g not in removed_groups for g in new_groups):
+            return None
+
+        counters.count("deepcopy")
+        schema = Schema(copy.deepcopy(previous_ping["schema"]))
+        template = self.glean.get_schema(
+            schema_type=self.glean.get_schema_type(pipeline_meta), version=version
+        )
+        removed_by_field = {(tuple(e[0]), e[2]): e for e in removed}
+        new_elements = list(kept)
+
+        for schema_key, key, probe in added:
+            field = (schema_key, probe.name)
+            sort_key = _sort_key(probe)
+            previous_element = removed_by_field.pop(field, None)
+
+            if previous_element is not None and previous_element[3] == sort_key:
+                # Replacing the field in place keeps its position
+                pass
+            else:
+                # Otherwise the field is appended, so it must sort after the others
+                group = kept_by_group.setdefault(schema_key, [])
+                if group and max(group) >= sort_key:
+                    return None
+                group.append(sort_key)
+                self._delete_field(schema, field)
+
+            try:
+                addtlProps = template.get(schema_key + ("additionalProperties",))
+            except KeyError:
+                addtlProps = None
+            probe_schema = Schema(probe.get_schema(addtlProps)).clone()
+
+            schema.set_schema_elem(
+                schema_key + ("properties", probe.name), probe_schema.schema
+            )
+            new_elements.append([list(schema_key), key, probe.name, sort_key])
+
+        for field in removed_by_field:
+            self._delete_field(schema, field)
+
+        max_size = self.glean.default_max_size
+        if schema.get_size() > max_size:
+            raise SchemaException(
+                "Schema must be smaller or equal max_size {}".format(max_size)
+            )
+
+        new_elements.sort(key=lambda e: e[3])
+        return schema, new_elements
+
+    @staticmethod
+    def _delete_field(schema: Schema, field):
+        schema_key, name = field
+        try:
+            del schema.get(schema_key + ("properties",))[name]
+        except KeyError:
+            pass
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import hashlib
+import json
+import logging
+import os
+from functools import cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Union
+
+from requests import HTTPError
+
+from .generic_ping import GenericPing
+
+ROOT_DIR = Path(__file__).parent
+
+logger = logging.getLogger(__name__)
+
+
+@cache
+def fingerprint_package() -> str:
+    """Fingerprint the source and configs of the generator itself, so that
+    changes to the generator invalidate every previously generated schema."""
+    digest = hashlib.sha256()
+    for path in sorted(ROOT_DIR.rglob("*")):
+        if path.suffix in (".py", ".yaml", ".txt") and path.is_file():
+            digest.update(path.relative_to(ROOT_DIR).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def fingerprint(
+    *, urls: Iterable[str] = (), files: Iterable[Path] = (), values: Any = None
+) -> str:
+    """
+    Compute a fingerprint of everything a schema is generated from.
+
+    @param urls: Documents fetched through the probe cache, e.g. probe-info
+                 documents and schema templates. Documents that fail to fetch
+                 are fingerprinted as missing.
+    @param files: Local files, e.g. configs and allowlists.
+    @param values: Any other JSON-serializable inputs, e.g. command options.
+    """
+    digest = hashlib.sha256(fingerprint_package().encode())
+
+    for url in urls:
+        digest.update(url.encode())
+        try:
+            digest.update(GenericPing._get_json_str(url).encode())
+        except HTTPError as e:
+            digest.update(f"missing: {e}".encode())
+
+    for path in files:
+        digest.update(str(path).encode())
+        digest.update(Path(path).read_bytes())
+
+    digest.update(json.dumps(values, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class InputManifest(object):
+    """
+    A manifest mapping the outputs of each generated unit (e.g. a Glean app, or a
+    common ping) to the fingerprint of its inputs. A unit whose fingerprint has
+    not changed and whose outputs all still exist does not need to be generated
+    again.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.base_dir = self.path.parent
+        self.entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            self.entries = json.loads(self.path.read_text())
+
+    def _relative(self, path: Path) -> str:
+        return Path(os.path.relpath(path, self.base_dir)).as_posix()
+
+    def is_current(self, key: str, input_fingerprint: str) -> bool:
+        entry = self.entries.get(key)
+        if entry is None or entry["fingerprint"] != input_fingerprint:
+            return False
+        return all((self.base_dir / p).exists() for p in entry["outputs"])
+
+    def update(self, key: str, input_fingerprint: str, outputs: Iterable[Path]):
+        self.entries[key] = {
+            "fingerprint": input_fingerprint,
+            "outputs": sorted(self._relative(p) for p in outputs),
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.entries, indent=2, sort_keys=True))
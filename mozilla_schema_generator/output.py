@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Writing generated files.
+
+Most generated files are identical to the ones of the previous run, so files are
+only written when their content changed. This keeps the modification times of
+unchanged files, and the changed files can be reported to downstream stages.
+
+Files are written to a temporary file that is renamed into place, so readers
+never see a partially written file. A `SchemaWriter` serializes and writes
+schemas on background threads, so that generating the next schemas overlaps with
+writing the previous ones.
+
+Alternatively, an `ArchiveWriter` writes all schemas into a single zip archive
+in one sequential stream, which is much faster than creating many small files
+on overlay and network filesystems. The archive contains a manifest of the
+hash of every file, so `extract_archive` only writes the files that changed.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from . import profiling
+
+# The number of schemas serialized and written by a single task
+BATCH_SIZE = 32
+DEFAULT_WRITERS = 4
+# The member of an archive listing the hash and size of every other member
+ARCHIVE_MANIFEST = "manifest.json"
+# Members get a fixed timestamp, so the same schemas give the same archive
+ARCHIVE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# Temporary files are created readable by the owner only, so they get the mode of
+# a regular new file before being renamed into place
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def has_content(path: Path, size: int, sha256: str) -> bool:
+    """Whether the file at `path` has the given size and content hash."""
+    try:
+        # Only files of the same size need to be hashed
+        return path.stat().st_size == size and content_hash(path.read_bytes()) == sha256
+    except FileNotFoundError:
+        return False
+
+
+@profiling.stage("write")
+def write_if_changed(path: Path, content: str) -> bool:
+    """Write `content` to `path`, unless the file already has that content.
+
+    Returns whether the file was written.
+    """
+    data = content.encode("utf-8")
+    if has_content(path, len(data), content_hash(data)):
+        return False
+
+    _write_atomic(path, data)
+    return True
+
+
+def _write_atomic(path: Path, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{path.name}.", suffix=".tmp", dir=path.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _write_batch(batch, dump_args: Dict) -> List[Path]:
+    changed = []
+    for path, obj in batch:
+        with profiling.stage("serialize"):
+            content = json.dumps(obj, **dump_args)
+        if write_if_changed(path, content):
+            changed.append(path)
+    return changed
+
+
+class SchemaWriter(object):
+    """Serialize and write schemas on a pool of background threads.
+
+    Schemas are buffered and handed to the pool in batches. The directories of a
+    batch are created before it is submitted, each directory once. Schemas must
+    not be modified after they are passed to `write`.
+
+    Use as a context manager; leaving the context waits for all writes to finish
+    and raises the first error of any of them.
+    """
+
+    def __init__(self, dump_args: Dict = None, workers: int = DEFAULT_WRITERS):
+        self.dump_args = dump_args or {}
+        self.changed: List[Path] = []
+        self._buffer = []
+        self._dirs: Set[Path] = set()
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def write(self, path: Path, obj):
+        """Schedule writing `obj` as JSON to `path`."""
+        self._buffer.append((Path(path), obj))
+        if len(self._buffer) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Submit the buffered schemas to the pool."""
+        if not self._buffer:
+            return
+        for parent in {path.parent for path, _ in self._buffer} - self._dirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            self._dirs.add(parent)
+        self._futures.append(
+            self._executor.submit(_write_batch, self._buffer, self.dump_args)
+        )
+        self._buffer = []
+
+    def close(self) -> List[Path]:
+        """Wait for all writes to finish. Returns the paths of the changed files."""
+        self.flush()
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            self.changed += future.result()
+        self._futures = []
+        return self.changed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't mask the original error with one of the writes
+            self._executor.shutdown(wait=True)
+
+
+def write_changed_files(changed_files: Optional[str], changed: Iterable[Path]):
+    """Write the paths of the changed files to `changed_files`, one per line."""
+    if changed_files is None:
+        return
+    Path(changed_files).write_text("".join(f"{path}\n" for path in changed))
+
+
+class ArchiveWriter(object):
+    """Write schemas into a single zip archive, with the same interface as a
+    `SchemaWriter`.
+
+    Members are named by their path relative to `base_dir`. Since the archive is
+    written from scratch, `changed` lists every written path.
+    """
+
+    def __init__(self, path, base_dir, dump_args: Dict = None):
+        self.base_dir = Path(base_dir)
+        self.dump_args = dump_args or {}
+        self.changed: List[Path] = []
+        self._manifest = {}
+        self._archive = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def _add(self, name: str, data: bytes):
+        info = zipfile.ZipInfo(name, date_time=ARCHIVE_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = (0o666 & ~_UMASK) << 16
+        self._archive.writestr(info, data)
+
+    def write(self, path: Path, obj):
+        path = Path(path)
+        name = path.relative_to(self.base_dir).as_posix()
+        with profiling.stage("serialize"):
+            data = json.dumps(obj, **self.dump_args).encode("utf-8")
+        with profiling.stage("write"):
+            self._add(name, data)
+        self._manifest[name] = {"sha256": content_hash(data), "size": len(data)}
+        self.changed.append(path)
+
+    def close(self) -> List[Path]:
+        """Write the manifest and close the archive."""
+        manifest = json.dumps(self._manifest, indent=2, sort_keys=True)
+        self._add(ARCHIVE_MANIFEST, manifest.encode("utf-8"))
+        self._archive.close()
+        return self.changed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._archive.close()
+
+
+def extract_archive(path, out_dir) -> List[Path]:
+    """Write the files of an archive to `out_dir` whose content changed.
+
+    Files are compared against the hashes in the manifest of the archive, so
+    unchanged members are not decompressed. Returns the paths of the changed
+    files.
+    """
+    out_dir = Path(out_dir)
+    changed = []
+    dirs: Set[Path] = set()
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(ARCHIVE_MANIFEST))
+        for name, entry in sorted(manifest.items()):
+            target = out_dir / name
+            with profiling.stage("write"):
+                if has_content(target, entry["size"], entry["sha256"]):
+                    continue
+                if target.parent not in dirs:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    dirs.add(target.parent)
+                _write_atomic(target, archive.read(name))
+            changed.append(target)
+    return changed
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Stages of generating the schemas of mozilla-pipeline-schemas in one process.
+
+The generated schemas are kept in a `SchemaTree` overlaid on the `schemas`
+directory of mozilla-pipeline-schemas, so that later stages (aliasing and subset
+pings) read the output of earlier ones without a round trip through the disk.
+The tree is written once, at the end.
+
+The metadata fields of each ingestion format are then merged into every schema
+file of the directory in a single pass, loading each metadata schema once, and
+the BigQuery schema of every file is written next to it.
+"""
+
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import jsonschema
+
+from . import bigquery, counters, profiling
+from .output import ArchiveWriter, SchemaWriter, write_if_changed
+from .schema import Schema, SchemaException, json_dump_args
+
+ALIASES_SCHEMA_PATH = (
+    Path(__file__).parent.parent / "validation-schemas" / "aliases.json"
+)
+# Schemas with merged metadata are written like `bin/metadata_merge` does
+METADATA_DUMP_ARGS = {"indent": 2, "separators": (",", ": ")}
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaTree(object):
+    """Generated JSON schemas by namespace, doctype and version, overlaid on a
+    directory of schemas."""
+
+    def __init__(self, base_dir):
+        self.base_dir = Path(base_dir)
+        self.schemas: Dict[Tuple[str, str, str], Dict] = {}
+
+    def get_path(self, namespace: str, doctype: str, version) -> Path:
+        return self.base_dir / namespace / doctype / f"{doctype}.{version}.schema.json"
+
+    def add(self, namespace: str, doctype: str, version, schema):
+        if isinstance(schema, Schema):
+            schema = schema.schema
+        self.schemas[(namespace, doctype, str(version))] = schema
+
+    def add_schemas(self, namespace: str, schemas: Dict, version):
+        """Add schemas by ping name, as returned by the schema generators."""
+        for name, schema in schemas.items():
+            # Bug 1601270; ping names are written in kebab-case
+            self.add(namespace, name.replace("_", "-"), version, schema)
+
+    def get(self, namespace: str, doctype: str, version, copy=True) -> Optional[Dict]:
+        """Get a schema, falling back to the one in the directory.
+
+        Returns None if the schema does not exist.
+        """
+        key = (namespace, doctype, str(version))
+        if key in self.schemas:
+            schema = self.schemas[key]
+            if copy:
+                counters.count("deepcopy")
+                return deepcopy(schema)
+            return schema
+
+        path = self.get_path(*key)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def write(self, pretty=False, archive=None) -> List[Path]:
+        """Write every schema added to the tree whose file changed.
+
+        Returns the paths of the changed files. With `archive`, every schema is
+        written into that zip archive instead, see `output.ArchiveWriter`.
+        """
+        if archive is not None:
+            writer = ArchiveWriter(archive, self.base_dir, json_dump_args(pretty))
+        else:
+            writer = SchemaWriter(json_dump_args(pretty))
+
+        with writer:
+            for key, schema in sorted(self.schemas.items()):
+                writer.write(self.get_path(*key), schema)
+        return writer.changed
+
+
+def load_aliases(aliases_path) -> Dict:
+    with open(aliases_path) as f:
+        aliases = json.load(f)
+
+    # The validation schema is part of the repository, not of the package
+    if ALIASES_SCHEMA_PATH.exists():
+        jsonschema.validate(
+            instance=aliases, schema=json.loads(ALIASES_SCHEMA_PATH.read_text())
+        )
+    return aliases
+
+
+def alias_schemas(aliases: Dict, tree: SchemaTree):
+    """Copy the source schema of every alias into the tree, see `bin/alias_schemas`."""
+    for dest_namespace, doctypes in aliases.items():
+        for dest_doctype, versions in doctypes.items():
+            for dest_version, alias_info in versions.items():
+                source_key = (
+                    alias_info["source-namespace"],
+                    alias_info["source-doctype"],
+                    alias_info["source-version"],
+                )
+                source = tree.get(*source_key, copy=False)
+                if source is None:
+                    raise SchemaException(
+                        "Missing source {} of alias {}".format(
+                            tree.get_path(*source_key),
+                            tree.get_path(dest_namespace, dest_doctype, dest_version),
+                        )
+                    )
+
+                # Only the metadata is modified, so a shallow copy is sufficient
+                source = dict(source)
+                dest = tree.get(dest_namespace, dest_doctype, dest_version, copy=False)
+                if dest is not None and "mozPipelineMetadata" in dest:
+                    source["mozPipelineMetadata"] = dest["mozPipelineMetadata"]
+                elif "mozPipelineMetadata" in source:
+                    metadata = dict(source["mozPipelineMetadata"])
+                    metadata["bq_dataset_family"] = dest_namespace
+                    metadata[
+                        "bq_table"
+                    ] = f'{dest_doctype.replace("-", "_")}_v{dest_version}'
+                    source["mozPipelineMetadata"] = metadata
+
+                logger.info(
+                    "Aliasing {}.{}.{} to {}.{}.{}".format(
+                        *source_key, dest_namespace, dest_doctype, dest_version
+                    )
+                )
+                tree.add(dest_namespace, dest_doctype, dest_version, source)
+
+
+def get_metadata_format(schema: Dict) -> Optional[str]:
+    return schema.get("mozPipelineMetadata", {}).get("bq_metadata_format")
+
+
+def get_metadata_path(metadata_dir, metadata_format: str) -> Path:
+    return (
+        Path(metadata_dir)
+        / f"{metadata_format}-ingestion"
+        / f"{metadata_format}-ingestion.1.schema.json"
+    )
+
+
+def load_metadata(metadata_dir) -> Dict[str, Dict]:
+    """Load the metadata schema of every format in `metadata_dir`."""
+    metadata = {}
+    for path in sorted(
+        Path(metadata_dir).glob("*-ingestion/*-ingestion.1.schema.json")
+    ):
+        metadata_format = path.parent.name[: -len("-ingestion")]
+        metadata[metadata_format] = json.loads(path.read_text())
+    return metadata
+
+
+def merge_metadata(schema: Dict, metadata: Dict) -> Dict:
+    """Merge the properties and required fields of a metadata schema into a schema.
+
+    Returns a new schema, neither of the given schemas is modified.
+    """
+    merged = dict(schema)
+    merged["properties"] = {
+        **schema.get("properties", {}),
+        **metadata.get("properties", {}),
+    }
+    merged["required"] = schema.get("required", []) + metadata.get("required", [])
+    return merged
+
+
+def merge_metadata_files(paths, metadata_dir, metadata=None) -> List[Path]:
+    """Merge the metadata of their format into schema files, see `bin/metadata_merge`.
+
+    Schemas without a `bq_metadata_format` are skipped. `metadata` holds the
+    metadata schemas by format, formats missing from it are loaded from
+    `metadata_dir` once. Returns the paths of the schemas that changed.
+    """
+    metadata = {} if metadata is None else metadata
+    changed = []
+    for path in paths:
+        path = Path(path)
+        schema = json.loads(path.read_text())
+        metadata_format = get_metadata_format(schema)
+        if not metadata_format:
+            logger.debug(f"Skipping metadata merge for schema {path}")
+            continue
+
+        if metadata_format not in metadata:
+            metadata[metadata_format] = json.loads(
+                get_metadata_path(metadata_dir, metadata_format).read_text()
+            )
+
+        merged = merge_metadata(schema, metadata[metadata_format])
+        if write_if_changed(path, json.dumps(merged, **METADATA_DUMP_ARGS)):
+            changed.append(path)
+    return changed
+
+
+def merge_metadata_dir(base_dir, metadata_dir, workers: int = None) -> List[Path]:
+    """Merge metadata into every schema file in `base_dir`.
+
+    Returns the paths of the schemas that changed. With `workers`, the schemas
+    are merged in batches on a process pool.
+    """
+    paths = sorted(Path(base_dir).rglob("*.schema.json"))
+    # The metadata schemas may be in `base_dir` too, so load them before any
+    # schema is merged.
+    metadata = load_metadata(metadata_dir)
+
+    return _run_batches(merge_metadata_files, paths, workers, metadata_dir, metadata)
+
+
+def transpile_dir(
+    base_dir, workers: int = None, exclude=("metadata/sources",)
+) -> List[Path]:
+    """Write the BigQuery schema of every schema file in `base_dir` next to it.
+
+    Returns the paths of the BigQuery schemas that changed. Schemas whose path
+    contains any of `exclude` are skipped. With `workers`, the schemas are
+    converted in batches on a process pool.
+    """
+    base_dir = Path(base_dir)
+    paths = [
+        path
+        for path in sorted(base_dir.rglob("*.schema.json"))
+        if not any(e in path.relative_to(base_dir).as_posix() for e in exclude)
+    ]
+    return _run_batches(bigquery.transpile_files, paths, workers)
+
+
+def _run_batches(func, paths: List[Path], workers: int, *args) -> List[Path]:
+    """Call `func(batch, *args)` for batches of the paths, on a process pool if
+    there is more than one worker. Returns the sorted results."""
+    if workers is None or workers <= 1 or len(paths) < 2:
+        return sorted(func(paths, *args))
+
+    n_batches = min(workers * 4, len(paths))
+    batches = [paths[i::n_batches] for i in range(n_batches)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(profiling.wrap(func), batch, *args) for batch in batches
+        ]
+        return sorted(
+            path for future in futures for path in profiling.unwrap(future.result())
+        )
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Timing of the stages of a generation run.
+
+Stages are marked with `stage`, as a context manager or decorator, and are
+attributed to the app and ping set with `context`. Both do nothing unless a
+`Profiler` is enabled, e.g. by `mozilla-schema-generator --profile`.
+
+The time of a stage excludes the time of the stages nested in it, so the times
+of all stages add up to the time spent in any of them.
+
+Stages and `counters` recorded in worker processes are returned to the parent if
+the function run in the worker is wrapped with `wrap`, and its result passed to
+`unwrap`.
+
+A profiler with `trace` enabled additionally keeps every stage and context as a
+span, which `write_trace` writes in the Chrome trace event format, e.g. to load
+into chrome://tracing or https://ui.perfetto.dev. Worker processes and threads
+are shown as separate lanes.
+
+A profiler with `memory` enabled traces allocations with `tracemalloc`, and
+keeps the peak and retained memory of each stage and app. Since the peak of
+`tracemalloc` is global, stages running at the same time on other threads are
+included in the peak of a stage.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import partial, wraps
+from typing import Dict, List, Optional, Tuple
+
+from . import counters
+
+# The number of frames of the allocation sites in the memory summary
+MEMORY_TRACE_FRAMES = 1
+MIB = 1024 * 1024
+
+# The app and ping of the current thread
+_context = threading.local()
+_profiler: Optional["Profiler"] = None
+
+
+def get_context() -> Tuple[Optional[str], Optional[str]]:
+    return getattr(_context, "app", None), getattr(_context, "ping", None)
+
+
+@contextmanager
+def context(app: str = None, ping: str = None):
+    """Attribute the stages run in this context to `app` and `ping`.
+
+    Unset values are inherited from the enclosing context.
+    """
+    previous = get_context()
+    _context.app = app or previous[0]
+    _context.ping = ping or previous[1]
+    # The span of the app or ping this context changes to, if tracing
+    span = None
+    if _profiler is not None and _profiler.events is not None:
+        if _context.ping != previous[1]:
+            span = (_context.ping, "ping")
+        elif _context.app != previous[0]:
+            span = (_context.app, "app")
+    memory_frame = None
+    if _profiler is not None and _profiler.memory is not None:
+        if _context.app != previous[0]:
+            memory_frame = _profiler.memory_push()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if span is not None and _profiler is not None:
+            _profiler.add_span(*span, start, time.perf_counter(), get_context())
+        if memory_frame is not None and _profiler is not None:
+            _profiler.record_memory(
+                _profiler.app_memory, _context.app, *_profiler.memory_pop(memory_frame)
+            )
+        _context.app, _context.ping = previous
+
+
+def annotate(**args):
+    """Add arguments to the span of the current stage, if tracing."""
+    if _profiler is not None and _profiler.events is not None:
+        stack = _profiler._stack()
+        if stack:
+            stack[-1][6].update(args)
+
+
+class Profiler(object):
+    """Wall and CPU time of each stage, by app and ping.
+
+    With `trace`, every stage and context is also kept as trace event. With
+    `memory`, the peak and retained memory of every stage and app is kept.
+    """
+
+    def __init__(
+        self, trace=False, memory=False, process_name="mozilla-schema-generator"
+    ):
+        self.start = time.perf_counter()
+        # (stage, app, ping) -> [calls, wall time, cpu time]
+        self.stats: Dict[Tuple[str, Optional[str], Optional[str]], List] = {}
+        self.events: Optional[List[Dict]] = None
+        # (stage, app, ping) or app -> [peak, retained] in bytes
+        self.memory: Optional[Dict[Tuple, List]] = None
+        self.app_memory: Dict[str, List] = {}
+        self.top_allocations: List[tracemalloc.Statistic] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._named_threads = set()
+        # The [start, peak] of memory of every stage or app being measured
+        self._memory_frames: List[List[int]] = []
+        if memory:
+            self.memory = {}
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(MEMORY_TRACE_FRAMES)
+        if trace:
+            self.events = [
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "args": {"name": process_name},
+                }
+            ]
+
+    def _stack(self) -> List[List]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def push(self, name: str) -> List:
+        # The stage, its context, its start times, the times of nested stages,
+        # and the arguments of its span
+        frame = [name, get_context(), time.perf_counter(), time.thread_time(), 0, 0, {}]
+        if self.memory is not None:
+            frame.append(self.memory_push())
+        self._stack().append(frame)
+        return frame
+
+    def pop(self, frame: List):
+        end = time.perf_counter()
+        wall = end - frame[2]
+        cpu = time.thread_time() - frame[3]
+        stack = self._stack()
+        stack.remove(frame)
+        if stack:
+            stack[-1][4] += wall
+            stack[-1][5] += cpu
+        self.record((frame[0], *frame[1]), 1, wall - frame[4], cpu - frame[5])
+        if self.events is not None:
+            self.add_span(frame[0], "stage", frame[2], end, frame[1], frame[6])
+        if self.memory is not None:
+            key = (frame[0], *frame[1])
+            self.record_memory(self.memory, key, *self.memory_pop(frame[7]))
+
+    def _update_memory_peaks(self) -> int:
+        # The peak of tracemalloc is reset whenever a measurement starts or ends,
+        # so the peak until then is kept by every ongoing measurement
+        current, peak = tracemalloc.get_traced_memory()
+        for memory_frame in self._memory_frames:
+            memory_frame[1] = max(memory_frame[1], peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def memory_push(self) -> List[int]:
+        """Start measuring memory. Returns the measurement for `memory_pop`."""
+        with self._lock:
+            current = self._update_memory_peaks()
+            memory_frame = [current, current]
+            self._memory_frames.append(memory_frame)
+        return memory_frame
+
+    def memory_pop(self, memory_frame: List[int]) -> Tuple[int, int]:
+        """Get the peak and retained memory since `memory_push`."""
+        with self._lock:
+            current = self._update_memory_peaks()
+            self._memory_frames.remove(memory_frame)
+        return memory_frame[1] - memory_frame[0], current - memory_frame[0]
+
+    def record_memory(self, memory: Dict, key, peak: int, retained: int):
+        with self._lock:
+            stats = memory.setdefault(key, [0, 0])
+            stats[0] = max(stats[0], peak)
+            stats[1] += retained
+
+    def add_span(self, name, category, start, end, context, args=None):
+        """Add a complete trace event. Times are in seconds of `time.perf_counter`,
+        which is the same clock in every process."""
+        app, ping = context
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": thread.native_id,
+            "args": dict(args or {}, app=app, ping=ping),
+        }
+        with self._lock:
+            if thread.native_id not in self._named_threads:
+                self._named_threads.add(thread.native_id)
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": os.getpid(),
+                        "tid": thread.native_id,
+                        "args": {"name": thread.name},
+                    }
+                )
+            self.events.append(event)
+
+    def record(self, key, calls: int, wall: float, cpu: float):
+        with self._lock:
+            stats = self.stats.setdefault(key, [0, 0.0, 0.0])
+            stats[0] += calls
+            stats[1] += wall
+            stats[2] += cpu
+
+    def merge(self, other: "Profiler"):
+        """Add the stats, trace events and memory recorded by another profiler,
+        e.g. in a worker process."""
+        for key, (calls, wall, cpu) in other.stats.items():
+            self.record(key, calls, wall, cpu)
+        if self.events is not None and other.events:
+            with self._lock:
+                self.events += other.events
+        if self.memory is not None and other.memory is not None:
+            for key, (peak, retained) in other.memory.items():
+                self.record_memory(self.memory, key, peak, retained)
+            for app, (peak, retained) in other.app_memory.items():
+                self.record_memory(self.app_memory, app, peak, retained)
+
+    def finish(self, top_allocations: int = 10):
+        """Stop tracing allocations, keeping the `top_allocations` sites of the
+        memory still allocated."""
+        if self.memory is not None and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            self.top_allocations = snapshot.statistics("lineno")[:top_allocations]
+            tracemalloc.stop()
+
+    def write_trace(self, path):
+        """Write the trace events in the Chrome trace event format."""
+        events, seen = [], set()
+        for event in self.events:
+            if event["ph"] == "M":
+                # Workers name their process and threads for every task
+                key = (event["name"], event["pid"], event.get("tid"))
+                if key in seen:
+                    continue
+                seen.add(key)
+            events.append(event)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def get_stage_totals(self) -> Dict[str, List]:
+        totals = {}
+        for (name, _, _), (calls, wall, cpu) in self.stats.items():
+            stats = totals.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += calls
+            stats[1] += wall
+            stats[2] += cpu
+        return totals
+
+    def summary(self, limit: int = 20) -> str:
+        """Get the stage totals and the `limit` slowest stages by app and ping,
+        sorted by wall time."""
+        total_row = "{:<12} {:>8} {:>10} {:>10}"
+        row = "{:<12} {:<40} {:<30} {:>8} {:>10} {:>10}"
+        lines = [
+            "Stage times (excluding nested stages) of a run of "
+            f"{time.perf_counter() - self.start:.3f}s:",
+            total_row.format("stage", "calls", "wall (s)", "cpu (s)"),
+        ]
+        totals = sorted(
+            self.get_stage_totals().items(), key=lambda item: item[1][1], reverse=True
+        )
+        for name, (calls, wall, cpu) in totals:
+            lines.append(total_row.format(name, calls, f"{wall:.3f}", f"{cpu:.3f}"))
+
+        lines += [
+            "",
+            f"Slowest {limit} stages by app and ping:",
+            row.format("stage", "app", "ping", "calls", "wall (s)", "cpu (s)"),
+        ]
+        slowest = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+        for (name, app, ping), (calls, wall, cpu) in slowest[:limit]:
+            lines.append(
+                row.format(
+                    name, app or "-", ping or "-", calls, f"{wall:.3f}", f"{cpu:.3f}"
+                )
+            )
+
+        if self.memory is not None:
+            lines += ["", *self.memory_summary(limit)]
+        return "\n".join(lines)
+
+    def memory_summary(self, limit: int = 20) -> List[str]:
+        row = "{:<40} {:>14} {:>14}"
+        lines = [
+            "Memory by stage (peak of any call, retained by all calls):",
+            row.format("stage", "peak (MiB)", "retained (MiB)"),
+        ]
+        stages = {}
+        for (name, _, _), (peak, retained) in self.memory.items():
+            self.record_memory(stages, name, peak, retained)
+        for name, (peak, retained) in sorted(
+            stages.items(), key=lambda item: item[1][0], reverse=True
+        ):
+            lines.append(row.format(name, f"{peak / MIB:.1f}", f"{retained / MIB:.1f}"))
+
+        lines += [
+            "",
+            f"Memory of the {limit} apps with the highest peak:",
+            row.format("app", "peak (MiB)", "retained (MiB)"),
+        ]
+        apps = sorted(
+            self.app_memory.items(), key=lambda item: item[1][0], reverse=True
+        )
+        for app, (peak, retained) in apps[:limit]:
+            lines.append(row.format(app, f"{peak / MIB:.1f}", f"{retained / MIB:.1f}"))
+
+        lines += ["", "Top allocation sites of the memory retained at the end:"]
+        for statistic in self.top_allocations:
+            frame = statistic.traceback[0]
+            lines.append(
+                f"{frame.filename}:{frame.lineno}: "
+                f"{statistic.size / MIB:.1f} MiB in {statistic.count} blocks"
+            )
+        return lines
+
+
+def enable(trace=False, memory=False, **kwargs) -> Profiler:
+    """Start recording stages in a new profiler."""
+    global _profiler
+    _profiler = Profiler(trace=trace, memory=memory, **kwargs)
+    return _profiler
+
+
+def disable():
+    global _profiler
+    if _profiler is not None:
+        _profiler.finish()
+    _profiler = None
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+class stage(object):
+    """Record the time spent in a stage, as context manager or decorator."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._frame = None
+
+    def __enter__(self):
+        if _profiler is not None:
+            self._frame = _profiler.push(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._frame is not None:
+            _profiler.pop(self._frame)
+            self._frame = None
+
+    def __call__(self, func):
+        name = self.name
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+class _WorkerResult(object):
+    def __init__(self, result, profiler: Optional[Profiler], counts: Dict[str, int]):
+        self.result = result
+        self.profiler = profiler
+        self.counts = counts
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.profiler is not None:
+            # Only what `Profiler.merge` reads is returned to the parent
+            state["profiler"] = Profiler.__new__(Profiler)
+            for attr in ("stats", "events", "memory", "app_memory"):
+                setattr(state["profiler"], attr, getattr(self.profiler, attr))
+        return state
+
+
+def _call_recording(func, flags, *args, **kwargs) -> _WorkerResult:
+    # A forked worker inherits the stats and counts of its parent, which must not
+    # be returned again; other workers, e.g. of forkserver, inherit nothing, so
+    # the profiler is enabled from the flags of the parent
+    counters.reset()
+    profiler = None
+    if flags is not None:
+        trace, memory = flags
+        profiler = enable(trace=trace, memory=memory, process_name="worker")
+    result = func(*args, **kwargs)
+    return _WorkerResult(result, profiler, counters.get_counters())
+
+
+def wrap(func):
+    """Wrap a function to run in a worker process, so that the stages and
+    counts it records are returned together with its result. Use `unwrap` on
+    the result.
+
+    The worker records stages if profiling is enabled when `wrap` is called."""
+    flags = None
+    if _profiler is not None:
+        flags = (_profiler.events is not None, _profiler.memory is not None)
+    return partial(_call_recording, func, flags)
+
+
+def unwrap(result):
+    """Get the result of a function wrapped with `wrap`, and add the stages and
+    counts it recorded to those of this process."""
+    if isinstance(result, _WorkerResult):
+        counters.merge(result.counts)
+        if _profiler is not None and result.profiler is not None:
+            _profiler.merge(result.profiler)
+        return result.result
+    return result
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from typing import Dict, List, Optional
+
+
+class RepositoryCatalog(object):
+    """
+    Index of the Glean repositories and app listings of the probe-info service,
+    to look up apps and libraries without scanning the listings each time.
+    """
+
+    def __init__(self, repositories: List[Dict], app_listings: List[Dict] = None):
+        self.repositories = repositories
+        self.app_listings = app_listings or []
+
+        self._apps = []
+        self._by_app_id = {}
+        self._by_name = {}
+        self._by_library_name = {}
+        for repo in repositories:
+            self._by_name.setdefault(repo["name"], repo)
+            if "library_names" in repo:
+                for library_name in repo["library_names"]:
+                    self._by_library_name[library_name] = repo
+            else:
+                self._apps.append(repo)
+                self._by_app_id.setdefault(repo.get("app_id"), repo)
+
+        # app id in app-listings has "." instead of "-" so using document_namespace
+        self._by_document_namespace = {}
+        for app in self.app_listings:
+            self._by_document_namespace.setdefault(app["document_namespace"], app)
+
+    def get_app_repos(self) -> List[Dict]:
+        """Get all non-library repositories."""
+        return list(self._apps)
+
+    def get_repo(self, app_id: str) -> Optional[Dict]:
+        """Get the non-library repository of an app id."""
+        return self._by_app_id.get(app_id)
+
+    def get_repo_by_name(self, name: str) -> Optional[Dict]:
+        return self._by_name.get(name)
+
+    def get_library_repo_name(self, library_name: str) -> Optional[str]:
+        """Get the name of the repository a library (e.g. glean-core) is defined in."""
+        repo = self._by_library_name.get(library_name)
+        return repo["name"] if repo is not None else None
+
+    def get_app_listing(self, document_namespace: str) -> Optional[Dict]:
+        return self._by_document_namespace.get(document_namespace)
+
+    def get_app_name(self, document_namespace: str) -> Optional[str]:
+        """Get the app name of an app id, e.g. org-mozilla-firefox -> fenix."""
+        app = self.get_app_listing(document_namespace)
+        return app["app_name"] if app is not None else None
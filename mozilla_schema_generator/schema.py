@@ -11,6 +11,7 @@ import copy
 from json import JSONEncoder
 from typing import Any, Iterable
 
+from . import counters
 from .utils import _get
 
 
@@ -29,6 +30,14 @@ class SchemaEncoder(JSONEncoder):
         return JSONEncoder.default(self, obj)
 
 
+def json_dump_args(pretty: bool) -> dict:
+    """Get the arguments to `json.dumps` for writing schema files."""
+    args = {"cls": SchemaEncoder}
+    if pretty:
+        args.update({"indent": 4, "separators": (",", ":"), "sort_keys": True})
+    return args
+
+
 # TODO: s/Schema/JSONSchema
 class Schema(object):
     def __init__(self, schema: dict):
@@ -45,6 +54,8 @@ class Schema(object):
                           If False, and the parent of the key is not in the
                           schema, then the key will not be added.
         """
+        counters.count("schema.set_schema_elem")
+        counters.count("schema.set_schema_elem.steps", len(key))
         new_elem = self.schema
 
         for k in key[:-1]:
@@ -63,9 +74,12 @@ class Schema(object):
         return _get(self.schema, key)
 
     def get_size(self) -> int:
+        counters.count("schema.get_size")
         return self._get_schema_size(self.schema)
 
     def clone(self) -> Schema:
+        counters.count("schema.clone")
+        counters.count("deepcopy")
         return Schema(copy.deepcopy(self.schema))
 
     def _delete_key(self, key: Iterable[str]):
@@ -112,6 +126,7 @@ class Schema(object):
 
     @staticmethod
     def _get_schema_size(schema: dict, key=None) -> int:
+        counters.count("schema.get_size.nodes")
         if key is None:
             key = tuple()
 
@@ -128,6 +143,7 @@ class Schema(object):
         if isinstance(schema["type"], list):
             max_size = 0
             for t in schema["type"]:
+                counters.count("deepcopy")
                 s = copy.deepcopy(schema)
                 s["type"] = t
                 max_size = max(max_size, Schema._get_schema_size(s, key))
@@ -3,7 +3,9 @@ import re
 from collections import defaultdict
 from copy import deepcopy
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Callable, Dict, Optional, Tuple
+
+from . import counters
 
 # most metadata fields are added to the bq schema directly and left out of the json schema, but
 # fields here appear in the json schema and must be explicitly included in all resulting pings
@@ -31,7 +33,11 @@ def _schema_copy(src, pattern, dst=None, delete=True, prefix=()):
     for name, src_subschema in list(src_props.items()):
         path = ".".join((*prefix, name))
         if pattern.fullmatch(path):
-            prop = src_props.pop(name) if delete else deepcopy(src_props[name])
+            if delete:
+                prop = src_props.pop(name)
+            else:
+                counters.count("deepcopy")
+                prop = deepcopy(src_props[name])
         else:
             prop = _schema_copy(
                 src_subschema,
@@ -78,17 +84,27 @@ def _target_as_tuple(target: Dict[str, str]) -> Tuple[str, str, str]:
     )
 
 
-def generate(config_data, out_dir: Path) -> Dict[str, Dict[str, Dict[str, Dict]]]:
+def generate(
+    config_data,
+    out_dir: Path,
+    read_schema: Optional[Callable[[str, str, str], Dict]] = None,
+) -> Dict[str, Dict[str, Dict[str, Dict]]]:
     """Read in pings from disk and split fields into new subset pings.
 
     If configured, also produce a remainder ping with all the fields that weren't moved.
+
+    `read_schema` reads the source pings by namespace, doctype and version instead,
+    and must return a copy that can be modified.
     """
     schemas = defaultdict(lambda: defaultdict(dict))
     # read in pings and split them according to config
     for source in config_data:
         src_namespace, src_doctype, src_version = _target_as_tuple(source)
-        src_path = _get_path(out_dir, src_namespace, src_doctype, src_version)
-        schema = json.loads(src_path.read_text())
+        if read_schema is None:
+            src_path = _get_path(out_dir, src_namespace, src_doctype, src_version)
+            schema = json.loads(src_path.read_text())
+        else:
+            schema = read_schema(src_namespace, src_doctype, src_version)
 
         config = schema["mozPipelineMetadata"].pop("split_config")
         for subset_config in config["subsets"]:
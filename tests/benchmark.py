@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Microbenchmarks of the operations schema generation spends its time in.
+
+Each benchmark runs an operation on inputs of a given size, the number of
+probes, built from a synthetic dataset (see `tests.synthetic`), so they run
+offline. For every size, the throughput in operations per second and the
+memory allocated per operation (the peak of the memory traced by `tracemalloc`
+while running it once) are reported:
+
+    python -m tests.benchmark --sizes 100,1000,10000
+    python -m tests.benchmark schema.clone matcher.matches --json results.json
+
+Constructing probes modifies their definitions, so probes are constructed from
+the same, already modified definitions on every run. This takes the same code
+paths as constructing them from fresh definitions.
+"""
+
+import copy
+import json
+import re
+import time
+import tracemalloc
+from functools import cached_property
+from typing import Callable, Dict, List, Tuple
+
+import click
+import yaml
+
+from mozilla_schema_generator import subset_pings
+from mozilla_schema_generator.common_ping import CommonPing
+from mozilla_schema_generator.config import Config
+from mozilla_schema_generator.generic_ping import GenericPing
+from mozilla_schema_generator.glean_ping import GleanPing
+from mozilla_schema_generator.main_ping import MainPing
+from mozilla_schema_generator.probes import GleanProbe, MainProbe
+from mozilla_schema_generator.schema import Schema, json_dump_args
+
+from . import synthetic
+
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_MIN_TIME = 0.2
+APP = "synthetic-app-0"
+PING = "metrics"
+
+# Benchmarks by name; each returns the function to run and its number of operations
+BENCHMARKS: Dict[str, Callable[["Inputs"], Tuple[Callable, int]]] = {}
+
+
+def benchmark(name: str):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def _with_type_lists(schema):
+    """Make every typed node of a schema nullable, e.g. "string" becomes
+    ["string", "null"]."""
+    if isinstance(schema, dict):
+        schema = {k: _with_type_lists(v) for k, v in schema.items()}
+        if isinstance(schema.get("type"), str):
+            schema["type"] = [schema["type"], "null"]
+    return schema
+
+
+class Inputs(object):
+    """The inputs of the benchmarks for `size` probes, built on first use."""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    @cached_property
+    def documents(self) -> Dict[str, str]:
+        return synthetic.generate(
+            apps=1,
+            metrics=self.size,
+            pings=4,
+            libraries=0,
+            histograms=self.size,
+            scalars=self.size // 2,
+        )
+
+    def _get_json(self, url: str):
+        return json.loads(self.documents[url])
+
+    @cached_property
+    def glean_definitions(self) -> Dict[str, Dict]:
+        return self._get_json(GleanPing.probes_url_template.format(APP))
+
+    @cached_property
+    def main_definitions(self) -> Dict[str, Dict]:
+        return self._get_json(CommonPing.probes_url)
+
+    @cached_property
+    def glean_probes(self) -> List[GleanProbe]:
+        return [GleanProbe(_id, defn) for _id, defn in self.glean_definitions.items()]
+
+    @cached_property
+    def main_probes(self) -> List[MainProbe]:
+        return [MainProbe(_id, defn) for _id, defn in self.main_definitions.items()]
+
+    @cached_property
+    def glean_config(self) -> Config:
+        """The config of a single Glean ping, as used to match its metrics."""
+        with open(synthetic.CONFIGS_DIR / "glean.yaml", "r") as f:
+            config = Config("glean", yaml.safe_load(f))
+        glean = GleanPing({"name": APP, "app_id": APP})
+        return glean.get_ping_config(
+            config, PING, {"bq_dataset_family": APP, "bq_table": f"{PING}_v1"}
+        )
+
+    @cached_property
+    def main_config(self) -> Config:
+        with open(synthetic.CONFIGS_DIR / "main.yaml", "r") as f:
+            return Config("main", yaml.safe_load(f))
+
+    @cached_property
+    def main_template(self) -> Schema:
+        return Schema(self._get_json(MainPing.schema_url.format(branch="main")))
+
+    @cached_property
+    def main_schema(self) -> Schema:
+        """A main ping schema with the probes filled in."""
+        return GenericPing.make_schema(
+            self.main_template,
+            self.main_probes,
+            self.main_config,
+            GenericPing.default_max_size,
+        )
+
+    @cached_property
+    def glean_schema(self) -> Schema:
+        """A Glean ping schema with the metrics filled in."""
+        template = GleanPing.get_template_url("main", "glean", 1)
+        return GenericPing.make_schema(
+            Schema(self._get_json(template)),
+            self.glean_probes,
+            self.glean_config,
+            GenericPing.default_max_size,
+        )
+
+
+@benchmark("schema.clone")
+def bench_clone(inputs: Inputs):
+    return inputs.main_schema.clone, 1
+
+
+@benchmark("schema.set_schema_elem")
+def bench_set_schema_elem(inputs: Inputs):
+    elements = [
+        (key + ("properties", probe.name), probe.get_schema(None))
+        for key, probe in inputs.main_config.get_schema_elements(inputs.main_probes)
+    ]
+    schema = inputs.main_template.clone()
+
+    def run():
+        for key, elem in elements:
+            schema.set_schema_elem(key, elem)
+
+    return run, len(elements)
+
+
+@benchmark("schema.delete_group_from_schema")
+def bench_delete_group_from_schema(inputs: Inputs):
+    keys = [key + ("properties",) for key in inputs.main_config.get_match_keys()]
+
+    def run():
+        # Every run deletes from a copy, which is included in the time
+        schema = Schema(copy.deepcopy(inputs.main_schema.schema))
+        for key in keys:
+            schema.delete_group_from_schema(key, propagate=True)
+
+    return run, len(keys)
+
+
+@benchmark("schema.get_size")
+def bench_get_size(inputs: Inputs):
+    return inputs.main_schema.get_size, 1
+
+
+@benchmark("schema.get_size.type_lists")
+def bench_get_size_type_lists(inputs: Inputs):
+    schema = Schema(_with_type_lists(inputs.glean_schema.schema))
+    return schema.get_size, 1
+
+
+@benchmark("matcher.matches")
+def bench_matches(inputs: Inputs):
+    matcher = inputs.glean_config.matchers[("metrics", "counter")]
+    probes = inputs.glean_probes
+
+    def run():
+        for probe in probes:
+            matcher.matches(probe)
+
+    return run, len(probes)
+
+
+@benchmark("config.get_schema_elements")
+def bench_get_schema_elements(inputs: Inputs):
+    probes = inputs.glean_probes
+    return lambda: inputs.glean_config.get_schema_elements(probes), len(probes)
+
+
+@benchmark("probes.GleanProbe")
+def bench_glean_probe(inputs: Inputs):
+    definitions = list(inputs.glean_definitions.items())
+    pings = ["metrics", "baseline", "events"]
+
+    def run():
+        for _id, defn in definitions:
+            GleanProbe(_id, defn, pings=pings)
+
+    return run, len(definitions)
+
+
+@benchmark("probes.MainProbe")
+def bench_main_probe(inputs: Inputs):
+    definitions = list(inputs.main_definitions.items())
+
+    def run():
+        for _id, defn in definitions:
+            MainProbe(_id, defn)
+
+    return run, len(definitions)
+
+
+@benchmark("subset_pings.schema_copy")
+def bench_schema_copy(inputs: Inputs):
+    pattern = re.compile(r"payload\.processes\.(content|gpu)\..*")
+    schema = inputs.main_schema.schema
+    return lambda: subset_pings._schema_copy(schema, pattern, delete=False), 1
+
+
+@benchmark("schema.encode")
+def bench_encode(inputs: Inputs):
+    dump_args = json_dump_args(False)
+    return lambda: json.dumps(inputs.main_schema, **dump_args), 1
+
+
+@benchmark("schema.encode.pretty")
+def bench_encode_pretty(inputs: Inputs):
+    dump_args = json_dump_args(True)
+    return lambda: json.dumps(inputs.main_schema, **dump_args), 1
+
+
+def measure(run: Callable, ops: int, min_time: float = DEFAULT_MIN_TIME) -> Dict:
+    """Time `run` for at least `min_time` seconds, and trace the memory
+    allocated by a single run."""
+    # Warm up, e.g. caches and lazily built inputs
+    run()
+
+    runs = 0
+    elapsed = 0.0
+    start = time.perf_counter()
+    while runs == 0 or elapsed < min_time:
+        run()
+        runs += 1
+        elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        run()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops": ops,
+        "runs": runs,
+        "ops_per_sec": runs * ops / elapsed,
+        "alloc_bytes_per_op": peak / ops if ops else 0,
+    }
+
+
+def run_benchmarks(
+    names: List[str] = None, sizes=DEFAULT_SIZES, min_time: float = DEFAULT_MIN_TIME
+) -> List[Dict]:
+    """Run benchmarks, by default all of them, at every size."""
+    results = []
+    for size in sizes:
+        inputs = Inputs(size)
+        for name in names or BENCHMARKS:
+            run, ops = BENCHMARKS[name](inputs)
+            results.append(
+                {"benchmark": name, "size": size, **measure(run, ops, min_time)}
+            )
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    row = "{:<34} {:>7} {:>14} {:>14}"
+    lines = [row.format("benchmark", "size", "ops/sec", "alloc/op")]
+    for result in sorted(results, key=lambda r: (r["benchmark"], r["size"])):
+        lines.append(
+            row.format(
+                result["benchmark"],
+                result["size"],
+                f"{result['ops_per_sec']:,.1f}",
+                f"{result['alloc_bytes_per_op']:,.0f} B",
+            )
+        )
+    return "\n".join(lines)
+
+
+@click.command()
+@click.argument("benchmarks", nargs=-1, type=click.Choice(list(BENCHMARKS)))
+@click.option(
+    "--sizes",
+    help="Comma-separated numbers of probes to run the benchmarks at",
+    default=",".join(str(size) for size in DEFAULT_SIZES),
+)
+@click.option(
+    "--min-time",
+    help="The minimum time to run each benchmark for, in seconds",
+    type=float,
+    default=DEFAULT_MIN_TIME,
+)
+@click.option("--json", "json_path", help="Also write the results to this JSON file")
+def main(benchmarks, sizes, min_time, json_path):
+    """Run the BENCHMARKS, by default all of them."""
+    sizes = [int(size) for size in sizes.split(",")]
+    results = run_benchmarks(list(benchmarks), sizes, min_time)
+    click.echo(format_results(results))
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
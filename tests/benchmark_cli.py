@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""End-to-end benchmark of the schema generation commands.
+
+A synthetic dataset (see `tests.synthetic`) is served by a local HTTP server,
+standing in for the probe-info service and mozilla-pipeline-schemas, and the
+commands are pointed at it with `MSG_PROBE_INFO_BASE_URL` and
+`MSG_SCHEMAS_BASE_URL`. Every command runs in a new process, so no state is
+shared between runs:
+
+- a cold run starts with an empty probe cache, so it fetches every document
+  from the server
+- a warm run follows the cold run, and reads every document from the cache
+
+The difference between the two is the cost of fetching; the warm run is the
+cost of reading the cache and generating the schemas. `generate-subset-pings`
+only reads the main ping schema on disk, so its cold and warm runs are alike.
+The counters of each run, e.g. of HTTP requests and cache hits, are reported
+alongside:
+
+    python -m tests.benchmark_cli --apps 30 --metrics 2000 --repeat 3
+"""
+
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+import click
+import yaml
+
+from . import synthetic
+
+# The commands in the order they run; subset pings are split from the main ping
+COMMANDS = [
+    "generate-glean-pings",
+    "generate-main-ping",
+    "generate-common-pings",
+    "generate-subset-pings",
+]
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(object):
+    """Serve the files below `root` over HTTP on a background thread."""
+
+    def __init__(self, root):
+        handler = partial(_QuietHandler, directory=str(root))
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _command_args(command: str, out_dir: Path, work_dir: Path) -> List[str]:
+    if command == "generate-glean-pings":
+        return [command, "--out-dir", str(out_dir / "glean")]
+    if command == "generate-main-ping":
+        return [command, "--out-dir", str(out_dir / "telemetry")]
+    if command == "generate-common-pings":
+        return [
+            command,
+            "--out-dir",
+            str(out_dir / "telemetry"),
+            "--common-pings-config",
+            str(work_dir / "common_pings.json"),
+        ]
+    return [command, str(work_dir / "subset.yaml"), "--out-dir", str(out_dir)]
+
+
+def _parse_counters(stderr: str) -> Dict[str, int]:
+    """Get the counters every command writes as the last line of stderr."""
+    for line in reversed(stderr.splitlines()):
+        if line.startswith('{"counters"'):
+            return json.loads(line)["counters"]
+    return {}
+
+
+def run_command(command: str, out_dir: Path, work_dir: Path, env: Dict) -> Dict:
+    """Run a command in a new process. Returns its wall time and counters."""
+    args = [sys.executable, "-m", "mozilla_schema_generator"]
+    args += _command_args(command, out_dir, work_dir)
+    start = time.perf_counter()
+    result = subprocess.run(args, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise click.ClickException(f"{command} failed:\n{result.stderr}")
+    return {"seconds": seconds, "counters": _parse_counters(result.stderr)}
+
+
+def run_benchmark(work_dir, repeat: int = 1, **dataset) -> List[Dict]:
+    """Run every command cold and warm `repeat` times against a synthetic
+    dataset generated with the arguments `dataset`.
+
+    Returns the wall time and counters of every run.
+    """
+    work_dir = Path(work_dir)
+    documents = synthetic.generate(**dataset)
+    synthetic.write_tree(documents, work_dir / "tree")
+    (work_dir / "common_pings.json").write_text(
+        json.dumps(synthetic.common_pings_config(dataset.get("common_pings", 3)))
+    )
+    (work_dir / "subset.yaml").write_text(yaml.safe_dump(synthetic.subset_config()))
+
+    cache_dir = work_dir / "cache"
+    results = []
+    with StandInServer(work_dir / "tree") as server:
+        env = dict(
+            os.environ,
+            MSG_PROBE_INFO_BASE_URL=server.url + "/probeinfo",
+            MSG_SCHEMAS_BASE_URL=server.url + "/schemas",
+            MSG_PROBE_CACHE_DIR=str(cache_dir),
+        )
+        for i in range(repeat):
+            for command in COMMANDS:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                for kind in ("cold", "warm"):
+                    out_dir = work_dir / "out" / f"{kind}-{i}"
+                    result = run_command(command, out_dir, work_dir, env)
+                    results.append({"command": command, "kind": kind, **result})
+    return results
+
+
+def summarize(results: List[Dict]) -> List[Dict]:
+    """Get the median wall time of the cold and warm runs of every command."""
+    summary = []
+    for command in COMMANDS:
+        runs = {
+            kind: [r for r in results if r["command"] == command and r["kind"] == kind]
+            for kind in ("cold", "warm")
+        }
+        cold = statistics.median(r["seconds"] for r in runs["cold"])
+        warm = statistics.median(r["seconds"] for r in runs["warm"])
+        summary.append(
+            {
+                "command": command,
+                "cold_seconds": cold,
+                "warm_seconds": warm,
+                "fetch_seconds": cold - warm,
+                "http_requests": runs["cold"][0]["counters"].get("http.requests", 0),
+                "cache_hits": runs["warm"][0]["counters"].get("cache.hits", 0),
+            }
+        )
+    return summary
+
+
+def format_summary(summary: List[Dict]) -> str:
+    row = "{:<24} {:>9} {:>9} {:>9} {:>14} {:>11}"
+    lines = [
+        row.format("command", "cold", "warm", "fetch", "http requests", "cache hits")
+    ]
+    for entry in summary:
+        lines.append(
+            row.format(
+                entry["command"],
+                f"{entry['cold_seconds']:.2f}s",
+                f"{entry['warm_seconds']:.2f}s",
+                f"{entry['fetch_seconds']:.2f}s",
+                entry["http_requests"],
+                entry["cache_hits"],
+            )
+        )
+    return "\n".join(lines)
+
+
+@click.command()
+@click.option("--apps", type=click.IntRange(min=1), default=3)
+@click.option("--metrics", help="Metrics per app", type=int, default=200)
+@click.option("--pings", help="Pings per app", type=int, default=4)
+@click.option("--histograms", type=int, default=500)
+@click.option("--scalars", type=int, default=250)
+@click.option(
+    "--repeat",
+    help="The number of cold and warm runs of each command; the median is reported",
+    type=click.IntRange(min=1),
+    default=1,
+)
+@click.option(
+    "--work-dir",
+    help="Keep the dataset, cache and schemas in this directory",
+    type=click.Path(file_okay=False),
+)
+@click.option("--json", "json_path", help="Also write every run to this JSON file")
+def main(apps, metrics, pings, histograms, scalars, repeat, work_dir, json_path):
+    """Time the generation commands cold and warm against a local stand-in."""
+    dataset = dict(
+        apps=apps, metrics=metrics, pings=pings, histograms=histograms, scalars=scalars
+    )
+    if work_dir is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            results = run_benchmark(tmp_dir, repeat, **dataset)
+    else:
+        results = run_benchmark(work_dir, repeat, **dataset)
+
+    click.echo(format_summary(summarize(results)))
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
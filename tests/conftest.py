@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import pytest
+
+from mozilla_schema_generator.common_ping import CommonPing
+from mozilla_schema_generator.generic_ping import GenericPing
+from mozilla_schema_generator.glean_ping import GleanPing
+
+
+def _clear_caches():
+    GleanPing._get_template_json.cache_clear()
+    GleanPing.resolve_dependencies.cache_clear()
+    GleanPing.set_shared_inputs(None, None)
+    CommonPing._env_cache.clear()
+    CommonPing._probes_cache.clear()
+    GenericPing._failed_urls.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Inputs are loaded once per process, so every test starts and ends with
+    empty caches."""
+    _clear_caches()
+    yield
+    _clear_caches()
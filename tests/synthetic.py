@@ -0,0 +1,644 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Generate synthetic probe-info datasets, to measure how generating schemas
+scales with the number of apps, metrics, pings and probes.
+
+The dataset has the shape of the probe-info service: Glean repositories, app
+listings, dependencies, pings and metrics, and the `all_probes` of Firefox
+Desktop. It also contains the mozilla-pipeline-schemas templates the generator
+fills in, so that it is complete without network access:
+
+- a Glean app has `pings` pings and `metrics` metrics, and depends on glean-core
+  and on `dependencies` of `libraries` libraries, each with metrics and pings of
+  their own
+- every metric has `history_depth` history entries, and a `type_changes`
+  fraction of the metrics had a different type in their oldest entry
+- `all_probes` contains `histograms` histograms and `scalars` scalars, each with
+  `history_depth` history entries on the nightly and release channels
+- `common_pings` pings in the common ping format, listed in a common pings config
+
+Documents are written to a directory in the format of the probe cache, so
+pointing `MSG_PROBE_CACHE_DIR` at it serves every document from the cache:
+
+    python -m tests.synthetic /tmp/synthetic --apps 30 --metrics 2000
+    MSG_PROBE_CACHE_DIR=/tmp/synthetic/cache mozilla-schema-generator \\
+        generate-glean-pings --out-dir /tmp/glean-ping
+    MSG_PROBE_CACHE_DIR=/tmp/synthetic/cache mozilla-schema-generator \\
+        generate-common-pings --common-pings-config /tmp/synthetic/common_pings.json
+
+The same arguments and seed always give the same dataset.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import click
+import yaml
+
+from mozilla_schema_generator.common_ping import CommonPing
+from mozilla_schema_generator.config import Config
+from mozilla_schema_generator.generic_ping import DEFAULT_SCHEMAS_BASE_URL, GenericPing
+from mozilla_schema_generator.glean_ping import GleanPing
+from mozilla_schema_generator.main_ping import MainPing
+from mozilla_schema_generator.schema import Schema
+
+CONFIGS_DIR = Path(__file__).parent.parent / "mozilla_schema_generator" / "configs"
+COMMON_PING_URL_TEMPLATE = (
+    DEFAULT_SCHEMAS_BASE_URL + "/{{branch}}/schemas/telemetry/{0}/{0}.4.schema.json"
+)
+GLEAN_CORE_PINGS = ["metrics", "baseline", "events", "deletion-request"]
+START_DATE = datetime(2019, 1, 1)
+
+# Metric types, weighted roughly by how often they are used
+METRIC_TYPES = {
+    "counter": 20,
+    "boolean": 12,
+    "string": 10,
+    "quantity": 8,
+    "labeled_counter": 10,
+    "timing_distribution": 8,
+    "memory_distribution": 3,
+    "custom_distribution": 3,
+    "timespan": 5,
+    "datetime": 3,
+    "uuid": 2,
+    "string_list": 2,
+    "rate": 2,
+    "url": 2,
+    "text": 1,
+    "labeled_string": 2,
+    "labeled_boolean": 2,
+    "object": 1,
+    # Event metrics are not matched into the metrics section
+    "event": 4,
+}
+
+_INTEGER = {"type": "integer"}
+_STRING = {"type": "string"}
+_DISTRIBUTION = {
+    "type": "object",
+    "properties": {
+        "sum": _INTEGER,
+        "values": {"type": "object", "additionalProperties": _INTEGER},
+    },
+}
+# The schemas of metric values in the Glean templates, by metric type
+VALUE_SCHEMAS = {
+    "boolean": {"type": "boolean"},
+    "counter": _INTEGER,
+    "quantity": _INTEGER,
+    "string_list": {"type": "array", "items": _STRING},
+    "timespan": {
+        "type": "object",
+        "properties": {"time_unit": _STRING, "value": _INTEGER},
+    },
+    "rate": {
+        "type": "object",
+        "properties": {"numerator": _INTEGER, "denominator": _INTEGER},
+    },
+    "custom_distribution": _DISTRIBUTION,
+    "memory_distribution": _DISTRIBUTION,
+    "timing_distribution": _DISTRIBUTION,
+}
+
+
+def _value_schema(metric_type: str) -> Dict:
+    if metric_type == "dual_labeled_counter":
+        return {
+            "type": "object",
+            "additionalProperties": {
+                "type": "object",
+                "additionalProperties": _INTEGER,
+            },
+        }
+    if metric_type.startswith("labeled_"):
+        return {
+            "type": "object",
+            "additionalProperties": _value_schema(metric_type.partition("_")[2]),
+        }
+    return VALUE_SCHEMAS.get(metric_type, _STRING)
+
+
+def _glean_template(min_template: bool) -> Dict:
+    """A Glean ping template with a section for every metric type of glean.yaml."""
+    with open(CONFIGS_DIR / "glean.yaml", "r") as f:
+        metric_types = yaml.safe_load(f)["metrics"].keys()
+
+    properties = {
+        "metrics": {
+            "type": "object",
+            "properties": {
+                metric_type: {
+                    "type": "object",
+                    "additionalProperties": _value_schema(metric_type.rstrip("2")),
+                }
+                for metric_type in metric_types
+            },
+        },
+        "ping_info": {
+            "type": "object",
+            "properties": {
+                "seq": _INTEGER,
+                "start_time": _STRING,
+                "end_time": _STRING,
+                "reason": _STRING,
+            },
+        },
+        "events": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "category": _STRING,
+                    "name": _STRING,
+                    "timestamp": _INTEGER,
+                    "extra": {"type": "object", "additionalProperties": _STRING},
+                },
+            },
+        },
+    }
+    if not min_template:
+        properties["client_info"] = {
+            "type": "object",
+            "properties": {
+                "client_id": _STRING,
+                "app_build": _STRING,
+                "app_channel": _STRING,
+                "os": _STRING,
+            },
+        }
+    return {
+        "$schema": "http://json-schema.org/draft-04/schema#",
+        "type": "object",
+        "properties": properties,
+    }
+
+
+def _main_template() -> Dict:
+    """A main ping template with a section for every matcher of main.yaml."""
+    with open(CONFIGS_DIR / "main.yaml", "r") as f:
+        config = Config("main", yaml.safe_load(f))
+
+    schema = Schema(
+        {
+            "$schema": "http://json-schema.org/draft-04/schema#",
+            "type": "object",
+            "properties": {
+                "type": _STRING,
+                "clientId": _STRING,
+                "environment": {"type": "object"},
+            },
+            "mozPipelineMetadata": {
+                "bq_dataset_family": "telemetry",
+                "bq_table": "main_v4",
+                "bq_metadata_format": "structured",
+                # Split the probes of the child processes into a subset ping
+                "split_config": {
+                    "subsets": [
+                        {
+                            "document_namespace": "telemetry",
+                            "document_type": "main-processes",
+                            "document_version": "4",
+                            "pattern": r"payload\.processes\..*",
+                        }
+                    ],
+                    "remainder": {
+                        "document_namespace": "telemetry",
+                        "document_type": "main-remainder",
+                        "document_version": "4",
+                    },
+                },
+            },
+        }
+    )
+    for key in config.get_match_keys():
+        schema.set_schema_elem(key, {"type": "object", "additionalProperties": _STRING})
+    return schema.schema
+
+
+def _common_template(name: str) -> Dict:
+    return {
+        "$schema": "http://json-schema.org/draft-04/schema#",
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "enum": [name]},
+            "clientId": _STRING,
+            "environment": {"type": "object"},
+            "payload": {
+                "type": "object",
+                "properties": {"reason": _STRING, "count": _INTEGER},
+            },
+        },
+    }
+
+
+def _environment() -> str:
+    """The environment include of the common ping templates, which is a list of
+    properties rather than a JSON document."""
+    environment = {
+        "build": {
+            "type": "object",
+            "properties": {"applicationId": _STRING, "buildId": _STRING},
+        },
+        "settings": {
+            "type": "object",
+            "properties": {"locale": _STRING, "userPrefs": {"type": "object"}},
+        },
+        "addons": {
+            "type": "object",
+            "properties": {
+                "activeAddons": {
+                    "type": "object",
+                    "additionalProperties": {
+                        "type": "object",
+                        "properties": {"name": _STRING},
+                    },
+                },
+                "theme": {"type": "object", "properties": {"id": _STRING}},
+                "activeGMPlugins": {
+                    "type": "object",
+                    "additionalProperties": {
+                        "type": "object",
+                        "properties": {"version": _STRING},
+                    },
+                },
+            },
+        },
+    }
+    return json.dumps(environment)[1:-1]
+
+
+def _dates(rng: random.Random, depth: int) -> List[datetime]:
+    """Increasing dates of `depth` history entries."""
+    date = START_DATE + timedelta(days=rng.randrange(365))
+    dates = []
+    for _ in range(depth):
+        dates.append(date)
+        date += timedelta(days=rng.randrange(30, 120))
+    return dates
+
+
+def _glean_metric(
+    rng: random.Random,
+    name: str,
+    metric_type: str,
+    pings: List[str],
+    history_depth: int,
+    type_change: bool,
+) -> Dict:
+    send_in_pings = rng.sample(pings, min(len(pings), rng.choice([1, 1, 1, 2])))
+    dates = _dates(rng, history_depth + 1)
+    history = []
+    for i in range(history_depth):
+        entry_type = metric_type
+        if type_change and i == 0:
+            entry_type = "string" if metric_type != "string" else "counter"
+        history.append(
+            {
+                "type": entry_type,
+                "description": f"Synthetic {entry_type} metric {name}, revision {i}.",
+                "send_in_pings": send_in_pings,
+                "lifetime": "ping",
+                "expires": "never",
+                "bugs": [f"https://bugzilla.mozilla.org/show_bug.cgi?id={i + 1}"],
+                "data_reviews": [],
+                "notification_emails": ["nobody@example.com"],
+                "dates": {
+                    "first": dates[i].isoformat(sep=" "),
+                    "last": (dates[i + 1] - timedelta(days=1)).isoformat(sep=" "),
+                },
+            }
+        )
+    return {
+        "history": history,
+        "in-source": rng.random() > 0.05,
+        "name": name,
+        "type": metric_type,
+    }
+
+
+def _glean_metrics(
+    rng: random.Random,
+    prefix: str,
+    count: int,
+    pings: List[str],
+    history_depth: int,
+    type_changes: float,
+) -> Dict:
+    types, weights = zip(*METRIC_TYPES.items())
+    metrics = {}
+    for i in range(count):
+        name = f"{prefix}.category_{i % 50}.metric_{i}"
+        metrics[name] = _glean_metric(
+            rng,
+            name,
+            rng.choices(types, weights)[0],
+            pings,
+            history_depth,
+            rng.random() < type_changes,
+        )
+    return metrics
+
+
+def _glean_pings(pings: List[str], dataset_family: str) -> Dict:
+    return {
+        ping: {
+            "history": [
+                {
+                    "dates": {
+                        "first": START_DATE.isoformat(sep=" "),
+                        "last": START_DATE.isoformat(sep=" "),
+                    },
+                    "description": f"Synthetic {ping} ping.",
+                    "include_client_id": True,
+                    "include_info_sections": i % 4 != 3,
+                }
+            ],
+            "in-source": True,
+            "moz_pipeline_metadata": {
+                "bq_dataset_family": dataset_family,
+                "bq_table": ping.replace("-", "_") + "_v1",
+                "bq_metadata_format": "structured",
+            },
+            "name": ping,
+        }
+        for i, ping in enumerate(pings)
+    }
+
+
+def _main_probes(
+    rng: random.Random, histograms: int, scalars: int, history_depth: int
+) -> Dict:
+    processes = ["main", "content", "gpu", "all_childs", "all", "socket"]
+    probes = {}
+    for i in range(histograms + scalars):
+        if i < histograms:
+            probe_type, name = "histogram", f"SYNTHETIC_HISTOGRAM_{i}"
+            details = {"kind": rng.choice(["exponential", "linear", "enumerated"])}
+        else:
+            probe_type, name = "scalar", f"synthetic.category_{i % 40}.scalar_{i}"
+            details = {"kind": rng.choice(["uint", "uint", "boolean", "string"])}
+        details["keyed"] = rng.random() < 0.2
+
+        dates = _dates(rng, 2)
+        history = {}
+        for channel, date in zip(["nightly", "release"], dates):
+            version = rng.randrange(40, 100)
+            history[channel] = [
+                {
+                    "versions": {
+                        "first": str(version + 4 * j),
+                        "last": str(version + 4 * j + 3),
+                    },
+                    "details": dict(
+                        details,
+                        record_in_processes=rng.sample(processes, rng.randrange(1, 3)),
+                    ),
+                    "description": f"Synthetic {probe_type} {name}, revision {j}.",
+                    "expiry_version": "never",
+                    "optout": j % 2 == 0,
+                }
+                for j in reversed(range(history_depth))
+            ]
+        probes[f"{probe_type}/{name}"] = {
+            "first_added": {
+                channel: date.isoformat(sep=" ")
+                for channel, date in zip(history, dates)
+            },
+            "history": history,
+            "name": name,
+            "type": probe_type,
+        }
+    return probes
+
+
+def generate(
+    *,
+    apps: int = 3,
+    metrics: int = 200,
+    pings: int = 4,
+    libraries: int = 2,
+    dependencies: int = 2,
+    type_changes: float = 0.05,
+    history_depth: int = 3,
+    histograms: int = 500,
+    scalars: int = 250,
+    common_pings: int = 3,
+    branch: str = "main",
+    seed: int = 0,
+) -> Dict[str, str]:
+    """Generate a synthetic dataset. Returns the documents by their URL."""
+    rng = random.Random(seed)
+    documents = {}
+
+    def add(url, document):
+        documents[url] = document if isinstance(document, str) else json.dumps(document)
+
+    repositories = [
+        {
+            "name": "glean-core",
+            "library_names": ["glean-core"],
+            "description": "The Glean SDK",
+            "notification_emails": ["nobody@example.com"],
+        }
+    ]
+    library_names = []
+    for i in range(libraries):
+        name = f"synthetic-library-{i}"
+        library_names.append(f"org.mozilla.synthetic:{name}")
+        repositories.append(
+            {
+                "name": name,
+                "library_names": [library_names[-1]],
+                "description": f"Synthetic library {i}",
+                "notification_emails": ["nobody@example.com"],
+            }
+        )
+        library_pings = [f"{name}-ping"]
+        add(
+            GleanPing.probes_url_template.format(name),
+            _glean_metrics(
+                rng, f"library_{i}", metrics // 4, library_pings, history_depth, 0
+            ),
+        )
+        add(
+            GleanPing.ping_url_template.format(name),
+            _glean_pings(library_pings, "glean_core"),
+        )
+
+    add(
+        GleanPing.probes_url_template.format("glean-core"),
+        _glean_metrics(rng, "glean", 40, GLEAN_CORE_PINGS, history_depth, 0),
+    )
+    add(
+        GleanPing.ping_url_template.format("glean-core"),
+        _glean_pings(GLEAN_CORE_PINGS, "glean_core"),
+    )
+
+    app_listings = []
+    for i in range(apps):
+        name = f"synthetic-app-{i}"
+        app_id = f"org-mozilla-synthetic-app-{i}"
+        dataset_family = app_id.replace("-", "_")
+        app_dependencies = ["glean-core"] + rng.sample(
+            library_names, min(dependencies, libraries)
+        )
+        repositories.append(
+            {
+                "name": name,
+                "app_id": app_id,
+                "description": f"Synthetic app {i}",
+                "notification_emails": ["nobody@example.com"],
+                "dependencies": app_dependencies,
+                "moz_pipeline_metadata_defaults": {"bq_dataset_family": dataset_family},
+                "moz_pipeline_metadata": {},
+            }
+        )
+        app_listings.append(
+            {
+                "app_name": name,
+                "app_id": app_id.replace("-", "."),
+                "document_namespace": app_id,
+                "bq_dataset_family": dataset_family,
+                "app_channel": "release",
+                "canonical_app_name": f"Synthetic App {i}",
+                "v1_name": name,
+            }
+        )
+
+        app_pings = [f"ping-{j}" for j in range(pings)]
+        add(
+            GleanPing.probes_url_template.format(name),
+            _glean_metrics(
+                rng,
+                f"app_{i}",
+                metrics,
+                app_pings + ["metrics", "baseline", "events"],
+                history_depth,
+                type_changes,
+            ),
+        )
+        add(
+            GleanPing.ping_url_template.format(name),
+            _glean_pings(app_pings, dataset_family),
+        )
+        add(
+            GleanPing.dependencies_url_template.format(name),
+            {
+                dependency: {"name": dependency, "type": "dependency"}
+                for dependency in app_dependencies
+            },
+        )
+
+    add(GleanPing.repos_url, repositories)
+    add(GleanPing.app_listings_url, app_listings)
+
+    for version in (1, 2):
+        for schema_type in ("glean", "glean-min"):
+            add(
+                GleanPing.get_template_url(branch, schema_type, version),
+                _glean_template(schema_type == "glean-min"),
+            )
+
+    add(
+        CommonPing.probes_url,
+        _main_probes(rng, histograms, scalars, history_depth),
+    )
+    add(CommonPing.env_url.format(branch=branch), _environment())
+    add(MainPing.schema_url.format(branch=branch), _main_template())
+    for name in common_ping_names(common_pings):
+        url = COMMON_PING_URL_TEMPLATE.format(name).format(branch=branch)
+        add(CommonPing.with_schemas_base_url(url), _common_template(name))
+
+    return documents
+
+
+def common_ping_names(common_pings: int) -> List[str]:
+    return [f"synthetic-{i}" for i in range(common_pings)]
+
+
+def common_pings_config(common_pings: int) -> List[Dict]:
+    """The common pings config of the common pings of a dataset."""
+    return [
+        {"schema_url": COMMON_PING_URL_TEMPLATE.format(name)}
+        for name in common_ping_names(common_pings)
+    ]
+
+
+def subset_config() -> List[Dict]:
+    """The subset pings config of the main ping of a dataset."""
+    return [
+        {
+            "document_namespace": "telemetry",
+            "document_type": "main",
+            "document_version": 4,
+        }
+    ]
+
+
+def write_cache(documents: Dict[str, str], cache_dir):
+    """Write documents in the format of the probe cache."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for url, document in documents.items():
+        (cache_dir / GenericPing._slugify(url)).write_text(document)
+
+
+def write_tree(documents: Dict[str, str], root):
+    """Write documents to the paths of their URLs, to serve them over HTTP.
+
+    Documents of the probe-info service are written below `root/probeinfo`, and
+    those of mozilla-pipeline-schemas below `root/schemas`.
+    """
+    root = Path(root)
+    bases = {
+        GenericPing.probe_info_base_url: root / "probeinfo",
+        GenericPing.schemas_base_url: root / "schemas",
+    }
+    for url, document in documents.items():
+        base = next(base for base in bases if url.startswith(base + "/"))
+        path = bases[base].joinpath(*url.replace(base + "/", "", 1).split("/"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(document)
+
+
+@click.command()
+@click.argument("out-dir", type=click.Path(file_okay=False))
+@click.option("--apps", type=click.IntRange(min=1), default=3)
+@click.option("--metrics", help="Metrics per app", type=int, default=200)
+@click.option("--pings", help="Pings per app", type=int, default=4)
+@click.option("--libraries", type=int, default=2)
+@click.option("--dependencies", help="Libraries per app", type=int, default=2)
+@click.option(
+    "--type-changes",
+    help="Fraction of app metrics whose type changed",
+    type=float,
+    default=0.05,
+)
+@click.option("--history-depth", help="History entries per probe", type=int, default=3)
+@click.option("--histograms", type=int, default=500)
+@click.option("--scalars", type=int, default=250)
+@click.option("--common-pings", type=int, default=3)
+@click.option("--seed", type=int, default=0)
+def main(out_dir, common_pings, **kwargs):
+    """Write a synthetic dataset to OUT_DIR/cache, and the configs of its common
+    and subset pings to OUT_DIR/common_pings.json and OUT_DIR/subset.yaml."""
+    out_dir = Path(out_dir)
+    documents = generate(common_pings=common_pings, **kwargs)
+    write_cache(documents, out_dir / "cache")
+    (out_dir / "common_pings.json").write_text(
+        json.dumps(common_pings_config(common_pings), indent=2)
+    )
+    (out_dir / "subset.yaml").write_text(yaml.safe_dump(subset_config()))
+    click.echo(f"Wrote {len(documents)} documents to {out_dir / 'cache'}")
+
+
+if __name__ == "__main__":
+    main()
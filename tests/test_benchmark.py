@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+
+from click.testing import CliRunner
+
+from mozilla_schema_generator.schema import Schema
+
+from . import benchmark
+
+
+def test_run_benchmarks():
+    results = benchmark.run_benchmarks(sizes=[5, 10], min_time=0)
+    assert [(r["benchmark"], r["size"]) for r in results] == [
+        (name, size) for size in (5, 10) for name in benchmark.BENCHMARKS
+    ]
+    assert all(r["ops_per_sec"] > 0 for r in results)
+    assert all(r["alloc_bytes_per_op"] >= 0 for r in results)
+
+
+def test_type_lists():
+    inputs = benchmark.Inputs(10)
+    schema = Schema(benchmark._with_type_lists(inputs.glean_schema.schema))
+    assert schema.schema["properties"]["metrics"]["type"] == ["object", "null"]
+    assert schema.get_size() == inputs.glean_schema.get_size()
+
+
+def test_cli(tmp_path):
+    result = CliRunner().invoke(
+        benchmark.main,
+        [
+            "schema.clone",
+            "matcher.matches",
+            "--sizes=5",
+            "--min-time=0",
+            "--json",
+            str(tmp_path / "results.json"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "schema.clone" in result.output
+    results = json.loads((tmp_path / "results.json").read_text())
+    assert [r["benchmark"] for r in results] == ["schema.clone", "matcher.matches"]
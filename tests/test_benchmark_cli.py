@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import urllib.request
+
+from mozilla_schema_generator.glean_ping import GleanPing
+
+from . import benchmark_cli, synthetic
+
+
+def test_stand_in_server(tmp_path):
+    documents = synthetic.generate(apps=1, metrics=5, histograms=5, scalars=5)
+    synthetic.write_tree(documents, tmp_path)
+
+    with benchmark_cli.StandInServer(tmp_path) as server:
+        url = GleanPing.repos_url.replace(
+            GleanPing.probe_info_base_url, server.url + "/probeinfo"
+        )
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode("utf-8") == documents[GleanPing.repos_url]
+
+
+def test_run_benchmark(tmp_path):
+    results = benchmark_cli.run_benchmark(
+        tmp_path, apps=1, metrics=10, pings=1, histograms=10, scalars=10
+    )
+    assert [(r["command"], r["kind"]) for r in results] == [
+        (command, kind)
+        for command in benchmark_cli.COMMANDS
+        for kind in ("cold", "warm")
+    ]
+
+    for result in results:
+        if result["command"] == "generate-subset-pings":
+            continue
+        if result["kind"] == "cold":
+            assert result["counters"]["http.requests"] > 0
+        else:
+            assert "http.requests" not in result["counters"]
+            assert result["counters"]["cache.hits"] > 0
+
+    out_dir = tmp_path / "out" / "warm-0"
+    assert (out_dir / "glean" / "org-mozilla-synthetic-app-0" / "ping-0").is_dir()
+    assert (out_dir / "telemetry" / "main-processes").is_dir()
+    assert (out_dir / "telemetry" / "synthetic-0").is_dir()
+
+    summary = benchmark_cli.summarize(results)
+    assert [entry["command"] for entry in summary] == benchmark_cli.COMMANDS
+    assert "generate-glean-pings" in benchmark_cli.format_summary(summary)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from mozilla_schema_generator import __main__, bigquery, pipeline
+
+RESOURCES_DIR = Path(__file__).parent / "resources" / "bigquery"
+SCHEMAS = sorted(RESOURCES_DIR.glob("*.schema.json"))
+
+# A sample of the schemas of the mozilla-pipeline-schemas submodule
+MPS_SCHEMAS_DIR = (
+    Path(__file__).parent / "resources" / "mozilla-pipeline-schemas" / "schemas"
+)
+MPS_SCHEMAS = sorted(
+    path
+    for pattern in (
+        "telemetry/main/*.schema.json",
+        "telemetry/bhr/*.schema.json",
+        "glean/glean/*.schema.json",
+        "metadata/*/*.schema.json",
+    )
+    for path in MPS_SCHEMAS_DIR.glob(pattern)
+    # This schema is AWS-specific and fails transpilation, see bin/generate_commit
+    if "sources" not in path.parts
+)
+
+TRANSPILER = shutil.which("jsonschema-transpiler")
+TRANSPILER_ARGS = [
+    "--resolve",
+    "drop",
+    "--type",
+    "bigquery",
+    "--normalize-case",
+    "--force-nullable",
+    "--tuple-struct",
+]
+
+
+def _ids(paths):
+    return [path.name for path in paths]
+
+
+@pytest.mark.parametrize("schema_path", SCHEMAS, ids=_ids(SCHEMAS))
+def test_golden(schema_path):
+    schema = json.loads(schema_path.read_text())
+    expected = bigquery.get_bq_path(schema_path).read_text()
+
+    assert bigquery.dumps(bigquery.transpile(schema)) == expected
+
+
+# CI installs jsonschema-transpiler, so the comparison must not be skipped there
+@pytest.mark.skipif(
+    TRANSPILER is None and not os.environ.get("CI"),
+    reason="jsonschema-transpiler is not installed",
+)
+@pytest.mark.parametrize(
+    "schema_path", SCHEMAS + MPS_SCHEMAS, ids=_ids(SCHEMAS + MPS_SCHEMAS)
+)
+def test_transpiler(schema_path):
+    assert TRANSPILER is not None, "jsonschema-transpiler is not installed"
+    result = subprocess.run(
+        [TRANSPILER, *TRANSPILER_ARGS, str(schema_path)],
+        check=True,
+        capture_output=True,
+    )
+    schema = json.loads(schema_path.read_text())
+
+    assert bigquery.dumps(bigquery.transpile(schema)).encode() == result.stdout
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("snake_case", "snake_case"),
+        ("camelCase", "camel_case"),
+        ("PascalCase", "pascal_case"),
+        ("HTTPServer", "http_server"),
+        ("fooBAR", "foo_bar"),
+        ("SCREAMING_SNAKE", "screaming_snake"),
+        ("kebab-case", "kebab_case"),
+        ("dotted.name", "dotted_name"),
+        ("a1Bc", "a1_bc"),
+        ("a1b", "a1b"),
+        ("__leading", "leading"),
+    ],
+)
+def test_to_snake_case(name, expected):
+    assert bigquery.to_snake_case(name) == expected
+
+
+def test_normalize_name():
+    assert bigquery.normalize_name("64bit") == "_64bit"
+    assert bigquery.normalize_name("isWow64") == "is_wow64"
+
+
+def test_transpile_dir(tmp_path):
+    serial_dir = tmp_path / "serial"
+    for path in SCHEMAS:
+        dest = serial_dir / "namespace" / path.name.split(".")[0] / path.name
+        dest.parent.mkdir(parents=True)
+        shutil.copy(path, dest)
+    sources = serial_dir / "metadata" / "sources" / "sources.1.schema.json"
+    sources.parent.mkdir(parents=True)
+    sources.write_text("{}")
+    parallel_dir = tmp_path / "parallel"
+    shutil.copytree(serial_dir, parallel_dir)
+
+    written = pipeline.transpile_dir(serial_dir)
+    assert [p.relative_to(serial_dir).as_posix() for p in written] == [
+        "namespace/atoms/atoms.bq",
+        "namespace/glean/glean.bq",
+        "namespace/nested/nested.bq",
+    ]
+
+    assert len(pipeline.transpile_dir(parallel_dir, workers=2)) == 3
+    for path in written:
+        parallel = parallel_dir / path.relative_to(serial_dir)
+        assert parallel.read_text() == path.read_text()
+
+
+def test_changed_files(tmp_path):
+    schemas_dir = tmp_path / "schemas"
+    for path in SCHEMAS:
+        dest = schemas_dir / "namespace" / path.name.split(".")[0] / path.name
+        dest.parent.mkdir(parents=True)
+        shutil.copy(path, dest)
+    changed_files = tmp_path / "changed.txt"
+    args = ["--schemas-dir", str(schemas_dir), "--changed-files", str(changed_files)]
+
+    result = CliRunner().invoke(__main__.generate_bigquery_schemas, args)
+    assert result.exit_code == 0
+    assert len(changed_files.read_text().splitlines()) == 3
+
+    # unchanged schemas are not written again
+    nested = schemas_dir / "namespace" / "nested" / "nested.schema.json"
+    nested.write_text(json.dumps({"type": "object", "properties": {"a": {}}}))
+    result = CliRunner().invoke(__main__.generate_bigquery_schemas, args)
+    assert result.exit_code == 0
+    assert changed_files.read_text() == f"{bigquery.get_bq_path(nested)}\n"
+
+
+def test_exclude(tmp_path):
+    for path in SCHEMAS:
+        dest = tmp_path / "namespace" / path.name.split(".")[0] / path.name
+        dest.parent.mkdir(parents=True)
+        shutil.copy(path, dest)
+    args = ["--schemas-dir", str(tmp_path), "--exclude", "atoms", "--exclude", "glean"]
+
+    result = CliRunner().invoke(__main__.generate_bigquery_schemas, args)
+    assert result.exit_code == 0
+    assert [p.name for p in tmp_path.rglob("*.bq")] == ["nested.bq"]
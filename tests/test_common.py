@@ -4,10 +4,19 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from unittest.mock import patch
+
 import pytest
+from click.testing import CliRunner
 
-from mozilla_schema_generator import common_ping
+from mozilla_schema_generator import __main__, common_ping, counters
+from mozilla_schema_generator.__main__ import generate_common_pings
 from mozilla_schema_generator.config import Config
+from mozilla_schema_generator.generic_ping import GenericPing
 from mozilla_schema_generator.utils import _get, prepend_properties
 
 
@@ -40,3 +49,144 @@ class TestCommonPing(object):
             "description": "User preferences - limited to an allowlist defined in `toolkit/components/telemetry/app/TelemetryEnvironment.jsm`",  # NOQA
             "additionalProperties": {"type": "string"},
         }
+
+
+@pytest.fixture
+def local_common_pings(tmp_path):
+    """Common pings whose templates, environment and probes are in a local cache."""
+    template_url = (
+        "https://raw.githubusercontent.com/mozilla-services/mozilla-pipeline-schemas"
+        "/main/schemas/telemetry/{0}/{0}.4.schema.json"
+    )
+    documents = {
+        common_ping.CommonPing.env_url.format(branch="main"): (
+            '"build": {"type": "object"}'
+        ),
+        common_ping.CommonPing.probes_url: "{}",
+    }
+    for name in ("first", "second", "third"):
+        documents[template_url.format(name)] = json.dumps(
+            {"type": "object", "properties": {"payload": {"type": "object"}}}
+        )
+
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    for url, document in documents.items():
+        (cache_dir / GenericPing._slugify(url)).write_text(document)
+
+    config = tmp_path / "common_pings.json"
+    config.write_text(
+        json.dumps(
+            [
+                {
+                    "schema_url": template_url.format(name).replace(
+                        "/main/", "/{branch}/"
+                    )
+                }
+                for name in ("first", "second", "third")
+            ]
+        )
+    )
+
+    with patch.object(GenericPing, "cache_dir", cache_dir):
+        yield config
+
+
+class TestCommonPingGeneration(object):
+    def test_shared_inputs(self, local_common_pings):
+        first = common_ping.CommonPing(
+            json.loads(local_common_pings.read_text())[0]["schema_url"]
+        )
+
+        with patch.object(
+            GenericPing, "_get_json_str", wraps=GenericPing._get_json_str
+        ) as mock_get_json_str:
+            for _ in range(2):
+                env = first.get_env()
+                assert first.get_probes() == []
+            env.schema.clear()
+
+            assert first.get_env().get(("properties",)) == {"build": {"type": "object"}}
+            assert mock_get_json_str.call_count == 2
+
+    def test_workers(self, local_common_pings, tmp_path):
+        runner = CliRunner()
+        for workers, out_dir in [("1", "serial"), ("2", "parallel")]:
+            result = runner.invoke(
+                generate_common_pings,
+                [
+                    "--common-pings-config",
+                    str(local_common_pings),
+                    "--out-dir",
+                    str(tmp_path / out_dir),
+                    "--workers",
+                    workers,
+                ],
+                catch_exceptions=False,
+            )
+            assert result.exit_code == 0
+
+        serial = sorted(
+            p.relative_to(tmp_path / "serial")
+            for p in (tmp_path / "serial").rglob("*.json")
+        )
+        parallel = sorted(
+            p.relative_to(tmp_path / "parallel")
+            for p in (tmp_path / "parallel").rglob("*.json")
+        )
+        assert len(serial) == 3
+        assert serial == parallel
+        for path in serial:
+            assert (tmp_path / "serial" / path).read_text() == (
+                tmp_path / "parallel" / path
+            ).read_text()
+
+    def test_workers_shared_inputs(self, local_common_pings, tmp_path, monkeypatch):
+        # Workers that inherit nothing from the parent, as with forkserver, are
+        # handed the environment and probes the parent loaded once
+        pings = json.loads(local_common_pings.read_text())
+        for ping in pings:
+            ping["config"] = "new_profile.yaml"
+        local_common_pings.write_text(json.dumps(pings))
+        monkeypatch.setenv("MSG_PROBE_CACHE_DIR", str(GenericPing.cache_dir))
+        executor = partial(
+            ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")
+        )
+
+        before = counters.get_counters()
+        with patch.object(__main__, "ProcessPoolExecutor", executor):
+            result = CliRunner().invoke(
+                generate_common_pings,
+                [
+                    "--common-pings-config",
+                    str(local_common_pings),
+                    "--out-dir",
+                    str(tmp_path / "out"),
+                    "--workers",
+                    "2",
+                ],
+                catch_exceptions=False,
+            )
+        assert result.exit_code == 0
+        assert len(list((tmp_path / "out").rglob("*.json"))) == 3
+
+        # The three templates, and the environment and probes once
+        reads = counters.get_counters()["cache.hits"] - before.get("cache.hits", 0)
+        assert reads == 5
+
+    def test_ndjson(self, local_common_pings, tmp_path):
+        runner = CliRunner()
+        args = ["--common-pings-config", str(local_common_pings), "--ndjson"]
+        result = runner.invoke(generate_common_pings, args, catch_exceptions=False)
+        assert result.exit_code == 0
+
+        records = [json.loads(line) for line in result.output.splitlines()]
+        assert [(r["app"], r["ping"], r["version"]) for r in records] == [
+            ("telemetry", name, 4) for name in ("first", "second", "third")
+        ]
+        assert all(r["schema"]["type"] == "object" for r in records)
+
+        result = runner.invoke(
+            generate_common_pings, args + ["--out-dir", str(tmp_path / "out")]
+        )
+        assert result.exit_code == 2
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from click.testing import CliRunner
+
+from mozilla_schema_generator import __main__, counters, output, profiling
+from mozilla_schema_generator.config import Config
+from mozilla_schema_generator.generic_ping import GenericPing
+from mozilla_schema_generator.probes import GleanProbe
+from mozilla_schema_generator.schema import Schema
+
+
+@pytest.fixture(autouse=True)
+def reset_counters():
+    counters.reset()
+    yield
+    counters.reset()
+
+
+def glean_probe(name, metric_type):
+    definition = {
+        "history": [
+            {
+                "description": "",
+                "dates": {
+                    "first": "2019-04-12 13:44:13",
+                    "last": "2019-08-08 15:34:03",
+                },
+                "send_in_pings": ["metrics"],
+            },
+        ],
+        "name": name,
+        "type": metric_type,
+        "in-source": False,
+    }
+    return GleanProbe(name, definition, pings=["metrics"])
+
+
+def test_matcher_counters():
+    config = Config(
+        "metrics",
+        {
+            "metrics": {
+                "string": {"match": {"type": "string"}},
+                "counter": {"match": {"type": "counter"}},
+            }
+        },
+    )
+    probes = [glean_probe("a", "string"), glean_probe("b", "string")]
+    probes.append(glean_probe("c", "counter"))
+
+    config.get_schema_elements(probes)
+    config.get_schema_elements_by_variant(
+        probes, {1: {}, 2: {0: glean_probe("a", "counter")}}
+    )
+
+    assert counters.get_counters() == {
+        "matcher.evaluations": 6 + 8,
+        "matcher.matches.metrics.counter": 1 + 2,
+        "matcher.matches.metrics.string": 2 + 2,
+    }
+
+
+def test_schema_counters():
+    schema = Schema(
+        {
+            "type": "object",
+            "properties": {"a": {"type": ["string", "null"]}, "b": {"type": "integer"}},
+        }
+    )
+    assert schema.get_size() == 2
+    schema.clone().set_schema_elem(("properties", "c", "type"), "string")
+
+    assert counters.get_counters() == {
+        "deepcopy": 3,
+        "schema.clone": 1,
+        "schema.get_size": 1,
+        "schema.get_size.nodes": 5,
+        "schema.set_schema_elem": 1,
+        "schema.set_schema_elem.steps": 3,
+    }
+
+
+def test_cache_counters(tmp_path):
+    url = "https://example.com/doc"
+    (tmp_path / GenericPing._slugify(url)).write_text("{}")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(GenericPing, "cache_dir", tmp_path)
+        GenericPing._get_json(url)
+
+    assert counters.get_counters() == {"cache.bytes_read": 2, "cache.hits": 1}
+
+
+def count_twice(name):
+    counters.count(name)
+    counters.count(name)
+    return name
+
+
+def test_workers():
+    counters.count("parent")
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(profiling.wrap(count_twice), "worker") for _ in range(3)
+        ]
+        assert [profiling.unwrap(f.result()) for f in futures] == ["worker"] * 3
+
+    assert counters.get_counters() == {"parent": 1, "worker": 6}
+
+
+def test_cli(tmp_path):
+    archive = tmp_path / "schemas.zip"
+    with output.ArchiveWriter(archive, tmp_path) as writer:
+        writer.write(tmp_path / "a" / "a.1.schema.json", {})
+    counters.count("previous")
+
+    result = CliRunner().invoke(
+        __main__.main,
+        ["extract-archive", str(archive), "--out-dir", str(tmp_path / "out")],
+        catch_exceptions=False,
+    )
+
+    assert result.exit_code == 0
+    assert json.loads(result.output.splitlines()[-1]) == {"counters": {}}
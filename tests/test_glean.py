@@ -3,6 +3,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import copy
 from typing import Dict, List
 from unittest.mock import patch
 
@@ -15,7 +16,7 @@ from mozilla_schema_generator import __main__ as msg_main
 from mozilla_schema_generator import generic_ping, glean_ping
 from mozilla_schema_generator.config import Config
 from mozilla_schema_generator.probes import GleanProbe
-from mozilla_schema_generator.schema import Schema
+from mozilla_schema_generator.repository_catalog import RepositoryCatalog
 from mozilla_schema_generator.utils import _get, prepend_properties
 
 from .test_utils import print_and_test
@@ -266,24 +267,29 @@ class GleanPingWithMetadataOverrides(GleanPingStub):
             },
         }
 
-    def get_repos(self):
-        return [
-            {
-                "app_id": "app1",
-                "moz_pipeline_metadata": {
-                    "dependency_ping2": {
-                        "expiration_policy": {"delete_after_days": 90}
+    def get_repository_catalog(self):
+        return RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "name": "app1",
+                    "moz_pipeline_metadata": {
+                        "dependency_ping2": {
+                            "expiration_policy": {"delete_after_days": 90}
+                        },
+                        "dependency_ping3": {
+                            "expiration_policy": {"delete_after_days": 100},
+                            "override_attributes": [
+                                {"name": "geo_city", "value": None}
+                            ],
+                        },
                     },
-                    "dependency_ping3": {
-                        "expiration_policy": {"delete_after_days": 100},
-                        "override_attributes": [{"name": "geo_city", "value": None}],
+                    "moz_pipeline_metadata_defaults": {
+                        "expiration_policy": {"delete_after_days": 80}
                     },
-                },
-                "moz_pipeline_metadata_defaults": {
-                    "expiration_policy": {"delete_after_days": 80}
-                },
-            }
-        ]
+                }
+            ]
+        )
 
 
 class GleanPingWithProbes(GleanPingStub):
@@ -369,11 +375,15 @@ class TestGleanPing(object):
     def test_pings(self, glean):
         # FIXME: this only tests the case where a repo has no dependencies-- ideally
         # we would test the dependency resolution algorithm as well
-        RETURN_VALUES = [{"foo": {"history": [{"description": "baz"}]}}, {}, {}, {}]
+        PING_URL = glean_ping.GleanPing.ping_url_template.format(glean.repo_name)
         with patch.object(
             glean_ping.GleanPing,
             "_get_json",
-            side_effect=RETURN_VALUES + RETURN_VALUES,
+            side_effect=lambda url: (
+                {"foo": {"history": [{"description": "baz"}]}}
+                if url == PING_URL
+                else {}
+            ),
         ):
             assert set(glean.get_pings()) == {
                 "foo",
@@ -428,14 +438,45 @@ class TestGleanPing(object):
     def test_dependencies(self, glean):
         RETURN_VALUES = {"glean-core": {"name": "glean-core", "type": "dependency"}}
         with patch.object(
-            glean,
+            glean_ping.GleanPing,
             "_get_json",
-            return_value=RETURN_VALUES,
+            side_effect=lambda url: (RETURN_VALUES if "dependencies" in url else []),
         ):
             assert set(glean.get_dependencies()) == {
                 "glean-core",
             }
 
+    def test_resolve_dependencies(self):
+        documents = {
+            glean_ping.GleanPing.repos_url: [
+                {"name": "app"},
+                {"name": "glean-core", "library_names": ["glean-core"]},
+                {"name": "lib", "library_names": ["org.mozilla:lib"]},
+            ],
+            glean_ping.GleanPing.app_listings_url: [],
+            glean_ping.GleanPing.dependencies_url_template.format("app"): {
+                "org.mozilla:lib": {},
+                "unknown": {},
+            },
+        }
+
+        def get_json(url):
+            if url not in documents:
+                raise requests.HTTPError("404")
+            return documents[url]
+
+        with patch.object(
+            glean_ping.GleanPing, "_get_json", side_effect=get_json
+        ) as mock_get_json:
+            for _ in range(2):
+                assert glean_ping.GleanPing.resolve_dependencies("app") == ["lib"]
+                assert glean_ping.GleanPing.resolve_dependencies("missing") == [
+                    "glean-core"
+                ]
+
+        # the catalog and each app's dependencies are only fetched once
+        assert mock_get_json.call_count == 4
+
     def test_probes(self, glean):
         RETURN_VALUES = {
             "test.probe": {
@@ -549,24 +590,26 @@ class TestGleanPing(object):
     # also a ping specific expiration_policy.  The ping specific expiration_policy is applied to the
     # ping schema and the repository default expiration_policy is applied to the dependency ping
     # schema.
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_expiration_policy(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": ["glean-base"],
-                "moz_pipeline_metadata": {},
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                    "expiration_policy": {
-                        "delete_after_days": 20,
-                        "collect_through_date": "2022-06-16",
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_expiration_policy(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": ["glean-base"],
+                    "moz_pipeline_metadata": {},
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                        "expiration_policy": {
+                            "delete_after_days": 20,
+                            "collect_through_date": "2022-06-16",
+                        },
                     },
-                },
-                "name": "app1",
-            }
-        ]
+                    "name": "app1",
+                }
+            ]
+        )
         glean = GleanPingWithExpirationPolicy({"name": "app1", "app_id": "app1"})
         schemas = glean.generate_schema(config, generic_schema=True)
 
@@ -602,23 +645,28 @@ class TestGleanPing(object):
 
     # Unit test covering the case where the repository has a default jwe_mappings and confirming
     # it is applied to all pings
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_jwe_mappings(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": ["glean-base"],
-                "moz_pipeline_metadata": {},
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                    "jwe_mappings": [
-                        {"decrypted_field_path": "", "source_field_path": "/payload"}
-                    ],
-                },
-                "name": "app1",
-            }
-        ]
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_jwe_mappings(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": ["glean-base"],
+                    "moz_pipeline_metadata": {},
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                        "jwe_mappings": [
+                            {
+                                "decrypted_field_path": "",
+                                "source_field_path": "/payload",
+                            }
+                        ],
+                    },
+                    "name": "app1",
+                }
+            ]
+        )
         glean = GleanPingWithEncryption({"name": "app1", "app_id": "app1"})
         schemas = glean.generate_schema(config, generic_schema=True)
 
@@ -645,20 +693,22 @@ class TestGleanPing(object):
 
     # Note that even when the repo has no metadata defaults specified the glean/repositories
     # endpoint will add both bq_dataset_family and bq_metadata_format
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_no_metadata_defaults(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": ["glean-base"],
-                "moz_pipeline_metadata": {},
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                },
-                "name": "app1",
-            }
-        ]
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_no_metadata_defaults(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": ["glean-base"],
+                    "moz_pipeline_metadata": {},
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                    },
+                    "name": "app1",
+                }
+            ]
+        )
 
         glean = GleanPingNoMetadata({"name": "app1", "app_id": "app1"})
         schemas = glean.generate_schema(config, generic_schema=True)
@@ -681,21 +731,23 @@ class TestGleanPing(object):
 
     # Unit test covering the case where the repository has a default override_attributes
     # and confirming it is applied to all pings
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_override_attributes(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": ["glean-base"],
-                "moz_pipeline_metadata": {},
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                    "override_attributes": [{"name": "geo_city", "value": None}],
-                },
-                "name": "app1",
-            }
-        ]
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_override_attributes(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": ["glean-base"],
+                    "moz_pipeline_metadata": {},
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                        "override_attributes": [{"name": "geo_city", "value": None}],
+                    },
+                    "name": "app1",
+                }
+            ]
+        )
         glean = GleanPingWithOverrideAttributes({"name": "app1", "app_id": "app1"})
         schemas = glean.generate_schema(config, generic_schema=True)
         final_schemas = {k: schemas[k].schema for k in schemas}
@@ -725,21 +777,23 @@ class TestGleanPing(object):
 
     # Unit test covering the case where the repository has a default
     # submission_timestamp_granularity and confirming it is applied to all pings
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_submission_timestamp_granularity(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": ["glean-base"],
-                "moz_pipeline_metadata": {},
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                    "submission_timestamp_granularity": "seconds",
-                },
-                "name": "app1",
-            }
-        ]
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_submission_timestamp_granularity(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": ["glean-base"],
+                    "moz_pipeline_metadata": {},
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                        "submission_timestamp_granularity": "seconds",
+                    },
+                    "name": "app1",
+                }
+            ]
+        )
 
         glean = GleanPingWithGranularity({"name": "app1", "app_id": "app1"})
         schemas = glean.generate_schema(config, generic_schema=True)
@@ -768,21 +822,23 @@ class TestGleanPing(object):
 
     # Can reuse any other test class as long as the repo indicates there is no dependency (local
     # test config).
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_metadata_no_dependency(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": [],
-                "moz_pipeline_metadata": {},
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                    "submission_timestamp_granularity": "seconds",
-                },
-                "name": "app1",
-            }
-        ]
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_metadata_no_dependency(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": [],
+                    "moz_pipeline_metadata": {},
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                        "submission_timestamp_granularity": "seconds",
+                    },
+                    "name": "app1",
+                }
+            ]
+        )
 
         glean = GleanPingWithGranularity({"name": "app1", "app_id": "app1"})
         schemas = glean.generate_schema(config, generic_schema=True)
@@ -796,20 +852,22 @@ class TestGleanPing(object):
                     == GleanPingWithGranularity.ping_metadata
                 )
 
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_ping_no_info_sections(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": [],
-                "moz_pipeline_metadata": {},
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                },
-                "name": "app1",
-            }
-        ]
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_ping_no_info_sections(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": [],
+                    "moz_pipeline_metadata": {},
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                    },
+                    "name": "app1",
+                }
+            ]
+        )
 
         glean = GleanPingNoInfoSection(
             {"name": "app1", "app_id": "app1"},
@@ -826,20 +884,22 @@ class TestGleanPing(object):
                     == GleanPingNoInfoSection.ping_metadata
                 )
 
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_ping_no_info_sections_history(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": [],
-                "moz_pipeline_metadata": {},
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                },
-                "name": "app1",
-            }
-        ]
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_ping_no_info_sections_history(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": [],
+                    "moz_pipeline_metadata": {},
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                    },
+                    "name": "app1",
+                }
+            ]
+        )
 
         glean = GleanPingNoInfoSectionWithHistory(
             {"name": "app1", "app_id": "app1"},
@@ -858,27 +918,29 @@ class TestGleanPing(object):
 
     # Unit test covering case where 2 pings have specific metadata and default metadata is applied
     # to the dependency ping
-    @patch.object(glean_ping.GleanPing, "get_repos")
-    def test_metadata_multiple_pings(self, mock_get_repos, config):
-        mock_get_repos.return_value = [
-            {
-                "app_id": "app1",
-                "dependencies": ["glean-base"],
-                "moz_pipeline_metadata": {
-                    "ping1": GleanPingWithMultiplePings.ping1_metadata,
-                    "ping2": GleanPingWithMultiplePings.ping2_metadata,
-                },
-                "moz_pipeline_metadata_defaults": {
-                    "bq_dataset_family": "app1",
-                    "bq_metadata_format": "structured",
-                    "expiration_policy": {
-                        "delete_after_days": 21,
+    @patch.object(glean_ping.GleanPing, "get_repository_catalog")
+    def test_metadata_multiple_pings(self, mock_catalog, config):
+        mock_catalog.return_value = RepositoryCatalog(
+            [
+                {
+                    "app_id": "app1",
+                    "dependencies": ["glean-base"],
+                    "moz_pipeline_metadata": {
+                        "ping1": GleanPingWithMultiplePings.ping1_metadata,
+                        "ping2": GleanPingWithMultiplePings.ping2_metadata,
                     },
-                    "submission_timestamp_granularity": "seconds",
-                },
-                "name": "app1",
-            }
-        ]
+                    "moz_pipeline_metadata_defaults": {
+                        "bq_dataset_family": "app1",
+                        "bq_metadata_format": "structured",
+                        "expiration_policy": {
+                            "delete_after_days": 21,
+                        },
+                        "submission_timestamp_granularity": "seconds",
+                    },
+                    "name": "app1",
+                }
+            ]
+        )
         glean = GleanPingWithMultiplePings({"name": "app1", "app_id": "app1"})
         schemas = glean.generate_schema(config, generic_schema=True)
         final_schemas = {k: schemas[k].schema for k in schemas}
@@ -941,6 +1003,33 @@ class TestGleanPing(object):
             "properties"
         ].keys() == {"boolean", "counter"}
 
+    def test_parallel_schemas(self, config):
+        """Generating pings on worker processes should not change the result."""
+        glean = GleanPingWithProbes({"name": "app", "app_id": "app1"})
+        serial = glean.generate_schema(config)
+        parallel = glean.generate_schema(config, workers=2)
+
+        assert parallel == serial
+        assert list(parallel) == list(serial)
+
+    def test_blocked_distribution_metrics(self, config):
+        glean = GleanPingWithProbes(
+            {
+                "name": "app",
+                "in-source": True,
+                "app_id": "app1",
+            }
+        )
+
+        assert glean.get_blocked_distribution_metrics(config) == {
+            "baseline": ["label_custom_dist", "timing_dist"],
+            "events": ["label_custom_dist", "timing_dist"],
+        }
+        assert glean.get_blocked_distribution_metrics(config, ("metrics",)) == {
+            "metrics": ["label_custom_dist", "timing_dist"],
+        }
+        assert glean.get_blocked_distribution_metrics(config, ("other",)) == {}
+
     # Integration test relies on ping, repositories and dependencies endpoints.
     def test_bug_1737656_unaffected(self, config):
         glean = glean_ping.GleanPing(
@@ -977,6 +1066,36 @@ class TestGleanPing(object):
             (schema["properties"]["metrics"]["properties"]["url2"]["properties"].keys())
         ) == ["my_url"]
 
+    def test_template_cache(self):
+        template = {
+            "properties": {
+                "metrics": {
+                    "properties": {
+                        name: {"type": "object"}
+                        for name in ["labeled_rate", "jwe", "url", "text"]
+                    }
+                }
+            }
+        }
+        glean = glean_ping.GleanPing({"name": "app", "app_id": "app"})
+        with patch.object(
+            glean_ping.GleanPing,
+            "_get_json",
+            side_effect=lambda url: copy.deepcopy(template),
+        ) as mock_get_json:
+            schema = glean.get_schema(schema_type="glean-min", version=2)
+            assert "url2" in schema.get(("properties", "metrics", "properties"))
+            schema.schema.clear()
+
+            assert glean.get_schema(schema_type="glean-min", version=2) != schema
+            mock_get_json.assert_called_once_with(
+                glean_ping.GleanPing.get_template_url("main", "glean-min", 2)
+            )
+
+            generic = glean.get_schema(generic_schema=True)
+            assert "url2" not in generic.get(("properties", "metrics", "properties"))
+            assert mock_get_json.call_count == 2
+
     def test_override_nested_defaults(self, config):
         """
         We want to test that any defaults set in the schema
@@ -986,13 +1105,13 @@ class TestGleanPing(object):
         Notably we now set `json_object_path_regex` for all Glean schemas.
         """
 
-        # Patching GenericPing.get_schema to return the schema
+        # Patching the template to return the schema
         # that will contain the configuration soon.
         # This should continue to work
         # even if the upstream schema actually gains those fields.
-        json = generic_ping.GenericPing._get_json(
-            glean_ping.DEFAULT_SCHEMA_URL.format(branch="main")
-        )
+        schema_url = glean_ping.DEFAULT_SCHEMA_URL.format(branch="main")
+        get_json = generic_ping.GenericPing._get_json
+        json = get_json(schema_url)
         json.update(
             {
                 "mozPipelineMetadata": {
@@ -1001,7 +1120,11 @@ class TestGleanPing(object):
             }
         )
         with patch.object(
-            generic_ping.GenericPing, "get_schema", return_value=Schema(json)
+            glean_ping.GleanPing,
+            "_get_json",
+            side_effect=lambda url: copy.deepcopy(json)
+            if url == schema_url
+            else get_json(url),
         ):
             glean = glean_ping.GleanPing(
                 {"name": "glean-core", "app_id": "org-mozilla-glean"}
@@ -1082,7 +1205,9 @@ class TestGleanPing(object):
         self, mock_get_json, mock_app_name, mock_metric_blocklist, mock_get_dependencies
     ):
         """No probes should be removed if blocklist is empty."""
-        mock_metric_blocklist.return_value = {"fenix": {"metrics": []}}
+        mock_metric_blocklist.return_value = (
+            glean_ping.GleanPing.index_metric_blocklist({"fenix": {"metrics": []}})
+        )
 
         glean = glean_ping.GleanPing(
             repo={
@@ -1123,17 +1248,21 @@ class TestGleanPing(object):
         self, mock_get_json, mock_app_name, mock_metric_blocklist, mock_get_dependencies
     ):
         """Only old blocklisted and removed probes should be removed."""
-        mock_metric_blocklist.return_value = {
-            "fenix": {
-                "metrics": [
-                    "active",
-                    "expired_in_source_new",
-                    "expired_removed_new",
-                    "expired_in_source_old",
-                    "expired_in_source_old_2",
-                ]
-            }
-        }
+        mock_metric_blocklist.return_value = (
+            glean_ping.GleanPing.index_metric_blocklist(
+                {
+                    "fenix": {
+                        "metrics": [
+                            "active",
+                            "expired_in_source_new",
+                            "expired_removed_new",
+                            "expired_in_source_old",
+                            "expired_in_source_old_2",
+                        ]
+                    }
+                }
+            )
+        )
         glean = glean_ping.GleanPing(
             repo={
                 "name": "firefox-android-release",
@@ -1172,18 +1301,22 @@ class TestGleanPing(object):
         self, mock_get_json, mock_app_name, mock_metric_blocklist, mock_get_dependencies
     ):
         """Blocklisted probes should not be removed if they are still in a dependency."""
-        mock_metric_blocklist.return_value = {
-            "fenix": {
-                "metrics": [
-                    "expired_old",
-                ]
-            },
-            "glean-core": {
-                "metrics": [
-                    "expired_old_2",
-                ]
-            },
-        }
+        mock_metric_blocklist.return_value = (
+            glean_ping.GleanPing.index_metric_blocklist(
+                {
+                    "fenix": {
+                        "metrics": [
+                            "expired_old",
+                        ]
+                    },
+                    "glean-core": {
+                        "metrics": [
+                            "expired_old_2",
+                        ]
+                    },
+                }
+            )
+        )
         glean = glean_ping.GleanPing(
             repo={
                 "name": "firefox-android-release",
@@ -1223,6 +1356,81 @@ class TestGleanPing(object):
             "expired_old_2",
         }
 
+    def test_index_metric_blocklist(self):
+        assert glean_ping.GleanPing.index_metric_blocklist(
+            {"fenix": {"metrics": ["a", "b"], "baseline": ["a"]}, "glean-core": {}}
+        ) == {
+            "fenix": {"a": ["metrics", "baseline"], "b": ["metrics"]},
+            "glean-core": {},
+        }
+
+    @patch.object(glean_ping.GleanPing, "get_dependencies", return_value=[])
+    @patch.object(glean_ping.GleanPing, "get_app_name", return_value="fenix")
+    @patch.object(glean_ping.GleanPing, "_get_json")
+    def test_probes_with_blocklist(
+        self, mock_get_json, mock_app_name, mock_get_dependencies
+    ):
+        """Only probes changed by the blocklist should be constructed again."""
+        metrics = {
+            **self.metric_def("active", "2024-01-01", "2026-01-01", True),
+            **self.metric_def(
+                "expired_in_source_old", "2024-01-01", "2024-01-01", False
+            ),
+        }
+        mock_get_json.side_effect = lambda url: (
+            copy.deepcopy(metrics) if url.endswith("/metrics") else {}
+        )
+        glean = glean_ping.GleanPing(
+            repo={
+                "name": "firefox-android-release",
+                "app_id": "org-mozilla-firefox",
+            },
+        )
+
+        probes, replacements = glean.get_probes_with_blocklist(
+            {"fenix": {"active": ["metrics"], "expired_in_source_old": ["metrics"]}}
+        )
+
+        assert [probe.id for probe in probes] == ["active", "expired_in_source_old"]
+        assert list(replacements.keys()) == [1]
+        assert probes[1].definition["send_in_pings"] == {"metrics"}
+        assert replacements[1].definition["send_in_pings"] == set()
+
+    def test_versioned_schemas(self, config):
+        """Versions generated in one pass should match separately generated ones,
+        except for the probes replaced by the blocklist."""
+        glean = GleanPingWithProbes({"name": "app", "app_id": "app1"})
+        probes = glean.get_probes()
+        blocked_bool = GleanProbe(
+            "bool",
+            {
+                "history": [
+                    {
+                        "dates": {
+                            "first": "2026-01-01 10:00:00",
+                            "last": "2026-02-01 10:00:00",
+                        },
+                        "send_in_pings": [],
+                    }
+                ],
+                "in-source": False,
+                "name": "bool",
+                "type": "boolean",
+            },
+        )
+        with patch.object(
+            glean_ping.GleanPing,
+            "get_probes_with_blocklist",
+            return_value=(probes, {0: blocked_bool}),
+        ):
+            versioned = glean.generate_versioned_schemas(config, {1: False, 2: True})
+
+        assert versioned[1] == glean.generate_schema(config)
+        for name, schema in versioned[2].items():
+            metrics = schema.schema["properties"]["metrics"]["properties"]
+            assert "boolean" not in metrics
+            assert "counter" in metrics
+
 
 class TestGleanGeneration:
     @pytest.fixture
@@ -1269,12 +1477,9 @@ class TestGleanGeneration:
             v1_overwrite_allowlist=glean_v1_overwrite_allowlist,
         )
 
-        assert mock_glean_ping.call_count == 2
-        mock_glean_ping.assert_any_call(
-            repo, mps_branch="", version=1, use_metrics_blocklist=False
-        )
-        mock_glean_ping.assert_any_call(
-            repo, mps_branch="", version=2, use_metrics_blocklist=True
+        mock_glean_ping.assert_called_once_with(repo, mps_branch="")
+        mock_glean_ping.return_value.generate_versioned_schemas.assert_called_once_with(
+            config, {1: False, 2: True}, generic_schema=False, workers=None
         )
 
     @patch("mozilla_schema_generator.__main__.dump_schema")
@@ -1300,9 +1505,9 @@ class TestGleanGeneration:
             v1_overwrite_allowlist=glean_v1_overwrite_allowlist,
         )
 
-        assert mock_glean_ping.call_count == 1
-        mock_glean_ping.assert_any_call(
-            repo, mps_branch="", version=1, use_metrics_blocklist=True
+        mock_glean_ping.assert_called_once_with(repo, mps_branch="")
+        mock_glean_ping.return_value.generate_versioned_schemas.assert_called_once_with(
+            config, {1: True}, generic_schema=False, workers=None
         )
 
     @patch("mozilla_schema_generator.__main__.dump_schema")
@@ -1328,9 +1533,9 @@ class TestGleanGeneration:
             v1_overwrite_allowlist=glean_v1_overwrite_allowlist,
         )
 
-        assert mock_glean_ping.call_count == 1
-        mock_glean_ping.assert_any_call(
-            repo, mps_branch="", version=1, use_metrics_blocklist=False
+        mock_glean_ping.assert_called_once_with(repo, mps_branch="")
+        mock_glean_ping.return_value.generate_versioned_schemas.assert_called_once_with(
+            config, {1: False}, generic_schema=False, workers=None
         )
 
     def test_check_blocked_distribution_metrics(self):
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import copy
+from typing import Dict
+
+import pytest
+import yaml
+
+from mozilla_schema_generator import glean_ping
+from mozilla_schema_generator.config import Config
+from mozilla_schema_generator.incremental import IncrementalGleanPing
+
+PING_METADATA = {
+    "bq_dataset_family": "app1",
+    "bq_metadata_format": "structured",
+    "bq_table": "ping_v1",
+    "include_info_sections": True,
+    "include_client_id": True,
+}
+
+
+def metric(
+    name: str,
+    metric_type: str,
+    first: str = "2026-01-01 10:00:00",
+    pings=None,
+    last: str = "2026-02-01 10:00:00",
+    in_source: bool = True,
+):
+    return {
+        "history": [
+            {
+                "dates": {"first": first, "last": last},
+                "description": f"A {metric_type}",
+                "send_in_pings": pings or ["metrics"],
+                "type": metric_type,
+            }
+        ],
+        "in-source": in_source,
+        "name": name,
+        "type": metric_type,
+    }
+
+
+def quantities(schema) -> Dict:
+    """Get the quantity metrics of a Glean ping schema."""
+    return schema.get(("properties", "metrics", "properties", "quantity", "properties"))
+
+
+class GleanPingWithDefinitions(glean_ping.GleanPing):
+    def __init__(self, repo, definitions: Dict[str, Dict], metric_blocklist=None):
+        super().__init__(repo)
+        self.definitions = definitions
+        self.blocklist = metric_blocklist or {}
+
+    def _get_metric_definitions(self):
+        return [
+            (self.get_app_name(), name, copy.deepcopy(defn))
+            for name, defn in self.definitions.items()
+        ]
+
+    def get_probes(self):
+        probes, _ = self.get_probes_with_blocklist({})
+        return probes
+
+    def get_app_name(self):
+        return "app"
+
+    def get_metric_blocklist(self):
+        return self.blocklist
+
+    def get_pings(self):
+        return {"metrics", "baseline"}
+
+    def get_pings_and_pipeline_metadata(self) -> Dict[str, Dict]:
+        return {"metrics": PING_METADATA, "baseline": PING_METADATA}
+
+
+@pytest.fixture
+def config():
+    config_file = "./mozilla_schema_generator/configs/glean.yaml"
+    with open(config_file) as f:
+        return Config("glean", yaml.safe_load(f))
+
+
+@pytest.fixture
+def definitions():
+    return {
+        "app.bool": metric("app.bool", "boolean"),
+        "app.other_bool": metric("app.other_bool", "boolean"),
+        "app.counter": metric("app.counter", "counter", pings=["metrics", "baseline"]),
+        "app.timing": metric("app.timing", "timing_distribution"),
+    }
+
+
+class TestIncrementalGleanPing(object):
+    versions = {1: False, 2: True}
+
+    def generate(self, state_path, config, definitions, metric_blocklist=None):
+        glean = GleanPingWithDefinitions(
+            {"name": "app", "app_id": "app1"}, definitions, metric_blocklist
+        )
+        incremental = IncrementalGleanPing(glean, state_path)
+        schemas = incremental.generate_versioned_schemas(config, self.versions)
+        incremental.save()
+
+        assert schemas == glean.generate_versioned_schemas(config, self.versions)
+        return incremental
+
+    def test_first_run(self, tmp_path, config, definitions):
+        incremental = self.generate(tmp_path / "app1.json", config, definitions)
+
+        assert incremental.patched == []
+        assert len(incremental.rebuilt) == 4
+
+    def test_unchanged(self, tmp_path, config, definitions):
+        self.generate(tmp_path / "app1.json", config, definitions)
+        incremental = self.generate(tmp_path / "app1.json", config, definitions)
+
+        assert incremental.rebuilt == []
+        assert len(incremental.patched) == 4
+
+    def test_added_and_removed(self, tmp_path, config, definitions):
+        self.generate(tmp_path / "app1.json", config, definitions)
+
+        definitions["app.late_counter"] = metric(
+            "app.late_counter", "counter", "2026-01-02 10:00:00", ["baseline"]
+        )
+        del definitions["app.other_bool"]
+        incremental = self.generate(tmp_path / "app1.json", config, definitions)
+
+        assert incremental.rebuilt == []
+        assert len(incremental.patched) == 4
+
+    def test_changed_in_place(self, tmp_path, config, definitions):
+        self.generate(tmp_path / "app1.json", config, definitions)
+
+        definitions["app.counter"]["history"][0]["description"] = "Changed"
+        incremental = self.generate(tmp_path / "app1.json", config, definitions)
+
+        assert incremental.rebuilt == []
+
+    def test_reordered(self, tmp_path, config, definitions):
+        self.generate(tmp_path / "app1.json", config, definitions)
+
+        # Sorts before the existing counter, so cannot be appended
+        definitions["app.early_counter"] = metric(
+            "app.early_counter", "counter", "2025-01-01 10:00:00"
+        )
+        incremental = self.generate(tmp_path / "app1.json", config, definitions)
+
+        assert sorted(incremental.rebuilt) == [(1, "metrics"), (2, "metrics")]
+        assert sorted(incremental.patched) == [(1, "baseline"), (2, "baseline")]
+
+    def test_removed_group(self, tmp_path, config, definitions):
+        self.generate(tmp_path / "app1.json", config, definitions)
+
+        del definitions["app.timing"]
+        incremental = self.generate(tmp_path / "app1.json", config, definitions)
+
+        assert sorted(incremental.rebuilt) == [(1, "metrics"), (2, "metrics")]
+
+    def test_new_group(self, tmp_path, config, definitions):
+        self.generate(tmp_path / "app1.json", config, definitions)
+
+        definitions["app.string"] = metric(
+            "app.string", "string", "2026-01-02 10:00:00"
+        )
+        incremental = self.generate(tmp_path / "app1.json", config, definitions)
+
+        assert sorted(incremental.rebuilt) == [(1, "metrics"), (2, "metrics")]
+
+    def test_blocklist(self, tmp_path, config, definitions):
+        # Only version 2 uses the blocklist, which applies to metrics removed from
+        # the source before 2025
+        blocklist = glean_ping.GleanPing.index_metric_blocklist(
+            {"app": {"metrics": ["app.blocked", "app.old_blocked"]}}
+        )
+        removed = dict(last="2024-06-01 10:00:00", in_source=False)
+        definitions["app.quantity"] = metric(
+            "app.quantity", "quantity", "2023-01-01 10:00:00", ["metrics", "baseline"]
+        )
+        definitions["app.old_blocked"] = metric(
+            "app.old_blocked", "quantity", "2023-06-01 10:00:00", **removed
+        )
+        incremental = self.generate(
+            tmp_path / "app1.json", config, definitions, blocklist
+        )
+        schemas = incremental.generate_versioned_schemas(config, self.versions)
+        assert "app.old_blocked" in quantities(schemas[1]["metrics"])
+        assert "app.old_blocked" not in quantities(schemas[2]["metrics"])
+
+        # A blocked metric is added, and a previously blocked one removed
+        definitions["app.blocked"] = metric(
+            "app.blocked",
+            "quantity",
+            "2024-01-01 10:00:00",
+            ["metrics", "baseline"],
+            **removed,
+        )
+        del definitions["app.old_blocked"]
+        incremental = self.generate(
+            tmp_path / "app1.json", config, definitions, blocklist
+        )
+        assert incremental.rebuilt == []
+        assert len(incremental.patched) == 4
+
+        schemas = incremental.generate_versioned_schemas(config, self.versions)
+        assert set(quantities(schemas[1]["metrics"])) == {"app.quantity", "app.blocked"}
+        assert set(quantities(schemas[2]["metrics"])) == {"app.quantity"}
+        for version in self.versions:
+            assert "app.blocked" in quantities(schemas[version]["baseline"])
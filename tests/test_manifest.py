@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from unittest.mock import patch
+
+from requests import HTTPError
+
+from mozilla_schema_generator.generic_ping import GenericPing
+from mozilla_schema_generator.manifest import InputManifest, fingerprint
+
+
+class TestFingerprint(object):
+    def test_urls(self):
+        documents = {"a": "{}", "b": "[]"}
+        with patch.object(
+            GenericPing, "_get_json_str", side_effect=lambda url: documents[url]
+        ):
+            before = fingerprint(urls=["a", "b"])
+            assert fingerprint(urls=["a", "b"]) == before
+
+            documents["b"] = "[1]"
+            assert fingerprint(urls=["a", "b"]) != before
+
+    def test_missing_url(self):
+        with patch.object(GenericPing, "_get_json_str", side_effect=HTTPError("404")):
+            assert fingerprint(urls=["a"]) == fingerprint(urls=["a"])
+
+    def test_files_and_values(self, tmp_path):
+        config = tmp_path / "config.yaml"
+        config.write_text("a: 1")
+        before = fingerprint(files=[config], values=[True])
+
+        assert fingerprint(files=[config], values=[False]) != before
+
+        config.write_text("a: 2")
+        assert fingerprint(files=[config], values=[True]) != before
+
+
+class TestInputManifest(object):
+    def test_roundtrip(self, tmp_path):
+        output = tmp_path / "out" / "ping" / "ping.1.schema.json"
+        output.parent.mkdir(parents=True)
+        output.write_text("{}")
+
+        manifest = InputManifest(tmp_path / "manifest.json")
+        assert not manifest.is_current("ping", "abc")
+
+        manifest.update("ping", "abc", [output])
+        manifest.save()
+
+        manifest = InputManifest(tmp_path / "manifest.json")
+        assert manifest.entries["ping"]["outputs"] == ["out/ping/ping.1.schema.json"]
+        assert manifest.is_current("ping", "abc")
+        assert not manifest.is_current("ping", "def")
+
+    def test_missing_output(self, tmp_path):
+        output = tmp_path / "ping.1.schema.json"
+        manifest = InputManifest(tmp_path / "manifest.json")
+        manifest.update("ping", "abc", [output])
+
+        assert not manifest.is_current("ping", "abc")
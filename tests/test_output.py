@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from mozilla_schema_generator import __main__, output
+
+
+def test_write_if_changed(tmp_path):
+    path = tmp_path / "schema.json"
+
+    assert output.write_if_changed(path, "{}")
+    assert path.read_text() == "{}"
+
+    os.utime(path, ns=(0, 0))
+    assert not output.write_if_changed(path, "{}")
+    assert path.stat().st_mtime_ns == 0
+
+    # same size, different content
+    assert output.write_if_changed(path, "[]")
+    assert path.read_text() == "[]"
+
+
+def test_write_changed_files(tmp_path):
+    changed_files = tmp_path / "changed.txt"
+    output.write_changed_files(str(changed_files), [tmp_path / "a", tmp_path / "b"])
+    assert changed_files.read_text() == f"{tmp_path / 'a'}\n{tmp_path / 'b'}\n"
+
+    output.write_changed_files(None, [tmp_path / "c"])
+    assert changed_files.read_text() == f"{tmp_path / 'a'}\n{tmp_path / 'b'}\n"
+
+
+class TestSchemaWriter(object):
+    def test_write(self, tmp_path):
+        paths = [
+            tmp_path / f"ping-{i % 3}" / f"ping.{i}.schema.json" for i in range(70)
+        ]
+        paths[0].parent.mkdir()
+        paths[0].write_text('{"version": 0}')
+
+        with output.SchemaWriter({"sort_keys": True}, workers=2) as writer:
+            for i, path in enumerate(paths):
+                writer.write(path, {"version": i})
+
+        assert writer.changed == paths[1:]
+        for i, path in enumerate(paths):
+            assert json.loads(path.read_text()) == {"version": i}
+        # no temporary files are left behind
+        assert sorted(tmp_path.rglob("*")) == sorted(
+            paths + [tmp_path / f"ping-{i}" for i in range(3)]
+        )
+        assert paths[1].stat().st_mode & 0o777 == 0o666 & ~output._UMASK
+
+    def test_error(self, tmp_path):
+        path = tmp_path / "schema.json"
+        with pytest.raises(TypeError):
+            with output.SchemaWriter() as writer:
+                writer.write(path, {"unserializable": object()})
+
+        assert not path.exists()
+        assert list(tmp_path.iterdir()) == []
+
+
+def test_archive(tmp_path):
+    base_dir = tmp_path / "schemas"
+    archive = tmp_path / "schemas.zip"
+    paths = [
+        base_dir / "app" / f"ping-{i}" / f"ping-{i}.1.schema.json" for i in range(3)
+    ]
+    with output.ArchiveWriter(archive, base_dir) as writer:
+        for i, path in enumerate(paths):
+            writer.write(path, {"version": i})
+    assert writer.changed == paths
+    assert not base_dir.exists()
+
+    assert output.extract_archive(archive, base_dir) == paths
+    for i, path in enumerate(paths):
+        assert json.loads(path.read_text()) == {"version": i}
+
+    # only changed files are written
+    os.utime(paths[0], ns=(0, 0))
+    paths[1].write_text("{}")
+    assert output.extract_archive(archive, base_dir) == [paths[1]]
+    assert paths[0].stat().st_mtime_ns == 0
+    assert json.loads(paths[1].read_text()) == {"version": 1}
+
+
+def test_extract_archive_command(tmp_path):
+    archive = tmp_path / "schemas.zip"
+    with output.ArchiveWriter(archive, tmp_path) as writer:
+        writer.write(tmp_path / "a" / "a.1.schema.json", {})
+    changed_files = tmp_path / "changed.txt"
+    args = [
+        str(archive),
+        "--out-dir",
+        str(tmp_path / "out"),
+        "--changed-files",
+        str(changed_files),
+    ]
+
+    result = CliRunner().invoke(__main__.extract_archive, args)
+    assert result.exit_code == 0
+    assert (
+        changed_files.read_text() == f"{tmp_path / 'out' / 'a' / 'a.1.schema.json'}\n"
+    )
+
+    result = CliRunner().invoke(__main__.extract_archive, args)
+    assert result.exit_code == 0
+    assert changed_files.read_text() == ""
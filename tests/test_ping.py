@@ -4,10 +4,15 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from unittest.mock import MagicMock, patch
+
 import pytest
+import requests
 import yaml
 
+from mozilla_schema_generator import generic_ping
 from mozilla_schema_generator.config import Config
+from mozilla_schema_generator.generic_ping import GenericPing
 from mozilla_schema_generator.main_ping import MainPing
 from mozilla_schema_generator.schema import SchemaException
 
@@ -33,3 +38,44 @@ class TestPing(object):
 
             with pytest.raises(SchemaException):
                 ping.generate_schema(config, max_size=max_size - 1)
+
+    @pytest.mark.parametrize(
+        "status_code,requests_made", [(404, 1), (503, 2), (429, 2)]
+    )
+    def test_failed_url_not_retried(self, tmp_path, status_code, requests_made):
+        # Only URLs that were not found are not requested again
+        url = "https://example.com/missing"
+        response = MagicMock(status_code=status_code)
+        response.raise_for_status.side_effect = requests.HTTPError(str(status_code))
+
+        with patch.object(GenericPing, "cache_dir", tmp_path), patch.object(
+            generic_ping._http_session, "get", return_value=response
+        ) as mock_get:
+            for _ in range(2):
+                with pytest.raises(requests.HTTPError):
+                    GenericPing._get_json_str(url)
+
+        assert mock_get.call_count == requests_made
+
+    def test_with_schemas_base_url(self):
+        url = generic_ping.DEFAULT_SCHEMAS_BASE_URL + "/main/schemas/a/a.1.schema.json"
+        with patch.object(GenericPing, "schemas_base_url", "http://localhost:8000"):
+            assert (
+                GenericPing.with_schemas_base_url(url)
+                == "http://localhost:8000/main/schemas/a/a.1.schema.json"
+            )
+            other = "https://example.com/a.1.schema.json"
+            assert GenericPing.with_schemas_base_url(other) == other
+
+    def test_no_matchers_no_probes(self, schema, env, probes):  # noqa F811
+        ping = LocalMainPing(schema, env, probes)
+        ping.schema_url, ping.env_url, ping.probes_url = "schema", "env", "probes"
+        config = Config("default", {})
+
+        with patch.object(
+            ping, "get_probes", side_effect=AssertionError("probes were loaded")
+        ):
+            ping.generate_schema(config)
+
+        assert ping.get_input_urls(config) == ["schema", "env"]
+        assert ping.get_input_urls() == ["schema", "env", "probes"]
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import multiprocessing
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+from mozilla_schema_generator import __main__, output, pipeline
+from mozilla_schema_generator.common_ping import CommonPing
+from mozilla_schema_generator.generic_ping import GenericPing
+from mozilla_schema_generator.glean_ping import GleanPing
+from mozilla_schema_generator.main_ping import MainPing
+from mozilla_schema_generator.schema import Schema, SchemaException
+
+from . import synthetic
+
+
+def ping_schema(namespace, doctype, version, **properties):
+    return {
+        "type": "object",
+        "mozPipelineMetadata": {
+            "bq_dataset_family": namespace,
+            "bq_metadata_format": "structured",
+            "bq_table": f"{doctype}_v{version}",
+        },
+        "properties": properties,
+    }
+
+
+@pytest.fixture
+def tree(tmp_path):
+    existing = tmp_path / "telemetry" / "event" / "event.4.schema.json"
+    existing.parent.mkdir(parents=True)
+    existing.write_text(json.dumps(ping_schema("telemetry", "event", 4)))
+    return pipeline.SchemaTree(tmp_path)
+
+
+class TestSchemaTree(object):
+    def test_overlay(self, tree):
+        assert tree.get("telemetry", "event", 4) == ping_schema("telemetry", "event", 4)
+        assert tree.get("telemetry", "main", 4) is None
+
+        tree.add_schemas(
+            "telemetry", {"main": Schema(ping_schema("telemetry", "main", 4))}, 4
+        )
+        schema = tree.get("telemetry", "main", "4")
+        assert schema == ping_schema("telemetry", "main", 4)
+
+        schema["properties"]["added"] = {"type": "string"}
+        assert tree.get("telemetry", "main", 4) == ping_schema("telemetry", "main", 4)
+
+    def test_write(self, tree):
+        tree.add_schemas("app", {"snake_case": ping_schema("app", "snake_case", 1)}, 1)
+
+        path = tree.base_dir / "app" / "snake-case" / "snake-case.1.schema.json"
+        assert tree.write() == [path]
+        assert json.loads(path.read_text()) == ping_schema("app", "snake_case", 1)
+
+        # unchanged files are not written again
+        assert tree.write() == []
+
+    def test_write_archive(self, tree, tmp_path):
+        tree.add_schemas("app", {"metrics": ping_schema("app", "metrics", 1)}, 1)
+        archive = tmp_path / "schemas.zip"
+        path = tree.base_dir / "app" / "metrics" / "metrics.1.schema.json"
+
+        assert tree.write(archive=archive) == [path]
+        assert not path.exists()
+        assert output.extract_archive(archive, tree.base_dir) == [path]
+        assert json.loads(path.read_text()) == ping_schema("app", "metrics", 1)
+
+
+class TestAliasSchemas(object):
+    def alias(self, namespace, doctype, version):
+        return {
+            "source-namespace": namespace,
+            "source-doctype": doctype,
+            "source-version": version,
+        }
+
+    def test_new_alias(self, tree):
+        pipeline.alias_schemas(
+            {"other": {"other-event": {"2": self.alias("telemetry", "event", "4")}}},
+            tree,
+        )
+
+        assert tree.get("other", "other-event", 2) == ping_schema(
+            "other", "other_event", 2
+        )
+        # the source is unchanged
+        assert tree.get("telemetry", "event", 4) == ping_schema("telemetry", "event", 4)
+
+    def test_existing_metadata(self, tree):
+        tree.add("telemetry", "main", 4, ping_schema("telemetry", "main", 4, a={}))
+        tree.add("telemetry", "main", 5, ping_schema("custom", "table", 1))
+        pipeline.alias_schemas(
+            {"telemetry": {"main": {"5": self.alias("telemetry", "main", "4")}}}, tree
+        )
+
+        assert tree.get("telemetry", "main", 5) == ping_schema(
+            "custom", "table", 1, a={}
+        )
+
+    def test_missing_source(self, tree):
+        with pytest.raises(SchemaException):
+            pipeline.alias_schemas(
+                {"other": {"event": {"1": self.alias("missing", "event", "4")}}}, tree
+            )
+
+
+@pytest.fixture
+def config_dir(tmp_path):
+    config_dir = tmp_path / "configs"
+    config_dir.mkdir()
+    (config_dir / "main.yaml").write_text("{}")
+    (config_dir / "glean.yaml").write_text("metrics: {}")
+    (config_dir / "subset.yaml").write_text(
+        yaml.dump(
+            [
+                {
+                    "document_namespace": "telemetry",
+                    "document_type": "main",
+                    "document_version": "5",
+                }
+            ]
+        )
+    )
+    return config_dir
+
+
+class TestGenerateAll(object):
+    def test_generate_all(self, tmp_path, config_dir):
+        main_schema = ping_schema("telemetry", "main", 4, a={}, b={})
+        main_schema["mozPipelineMetadata"]["split_config"] = {
+            "subsets": [
+                {
+                    "document_namespace": "telemetry",
+                    "document_type": "main-subset",
+                    "document_version": "1",
+                    "pattern": "b",
+                }
+            ]
+        }
+
+        common_pings = tmp_path / "common_pings.json"
+        common_pings.write_text(
+            json.dumps(
+                [{"schema_url": "https://example.com/event/event.4.schema.json"}]
+            )
+        )
+        aliases = tmp_path / "aliases.json"
+        aliases.write_text(
+            json.dumps(
+                {
+                    "telemetry": {
+                        "main": {
+                            "5": {
+                                "source-namespace": "telemetry",
+                                "source-doctype": "main",
+                                "source-version": "4",
+                            }
+                        }
+                    }
+                }
+            )
+        )
+
+        with patch.object(
+            __main__, "_generate_main_ping", return_value={"main": Schema(main_schema)}
+        ), patch.object(
+            __main__,
+            "_generate_bhr_ping",
+            return_value={"bhr": ping_schema("telemetry", "bhr", 4)},
+        ), patch.object(
+            __main__,
+            "_generate_common_ping",
+            return_value={"event": ping_schema("telemetry", "event", 4)},
+        ) as mock_common_ping, patch.object(
+            __main__,
+            "generate_glean_schemas",
+            return_value={1: {"metrics": ping_schema("app", "metrics", 1)}},
+        ), patch.object(
+            __main__, "_check_glean_config"
+        ), patch.object(
+            GleanPing, "get_repos", return_value=[{"name": "app", "app_id": "app"}]
+        ):
+            result = CliRunner().invoke(
+                __main__.generate_all,
+                [
+                    "--out-dir",
+                    str(tmp_path / "schemas"),
+                    "--config-dir",
+                    str(config_dir),
+                    "--common-pings-config",
+                    str(common_pings),
+                    "--aliases",
+                    str(aliases),
+                ],
+                catch_exceptions=False,
+            )
+
+        assert result.exit_code == 0
+        assert mock_common_ping.call_args.args[1] == "event"
+
+        written = sorted(
+            p.relative_to(tmp_path / "schemas").as_posix()
+            for p in (tmp_path / "schemas").rglob("*.json")
+        )
+        assert written == [
+            "app/metrics/metrics.1.schema.json",
+            "telemetry/bhr/bhr.4.schema.json",
+            "telemetry/event/event.4.schema.json",
+            "telemetry/main-subset/main-subset.1.schema.json",
+            "telemetry/main/main.4.schema.json",
+            "telemetry/main/main.5.schema.json",
+        ]
+
+        subset = json.loads(
+            (
+                tmp_path
+                / "schemas"
+                / "telemetry"
+                / "main-subset"
+                / "main-subset.1.schema.json"
+            ).read_text()
+        )
+        assert subset["properties"] == {"b": {}}
+        assert subset["mozPipelineMetadata"]["bq_table"] == "main_subset_v1"
+
+    def test_missing_subset_source(self, tree):
+        with pytest.raises(SchemaException, match="telemetry/main/main.4.schema.json"):
+            __main__._read_subset_source(tree, "telemetry", "main", "4")
+
+    def test_worker_shared_inputs(self, tmp_path):
+        # Workers that inherit nothing from the parent, as with forkserver, are
+        # handed the inputs the parent loaded
+        documents = synthetic.generate(apps=2, metrics=5, histograms=5, scalars=5)
+        synthetic.write_cache(documents, tmp_path / "cache")
+        with open(__main__.CONFIGS_DIR / "main.yaml", "r") as f:
+            main_config_data = yaml.safe_load(f)
+        with patch.object(GenericPing, "cache_dir", tmp_path / "cache"):
+            shared_inputs = (
+                __main__._preload_common_pings(
+                    [(MainPing.schema_url, "main", main_config_data)], "main"
+                ),
+                GleanPing.get_shared_inputs(),
+            )
+            expected = _load_shared_inputs()
+
+        with ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=__main__._init_generate_all_worker,
+            initargs=shared_inputs,
+        ) as executor:
+            assert executor.submit(_load_shared_inputs).result() == expected
+        assert expected[1] and len(expected[2]) == 2
+
+
+def _load_shared_inputs():
+    with patch.object(
+        GenericPing, "_get_json_str", side_effect=AssertionError("input was loaded")
+    ):
+        common_ping = CommonPing(MainPing.schema_url)
+        return (
+            common_ping.get_env().schema,
+            [p.get_name() for p in common_ping.get_probes()],
+            [repo["app_id"] for repo in GleanPing.get_repos()],
+            GleanPing.get_metric_blocklist(),
+        )
+
+
+@pytest.fixture
+def schemas_dir(tmp_path):
+    schemas_dir = tmp_path / "schemas"
+    metadata = {
+        "structured": {
+            "properties": {"client_id": {"type": "string"}, "a": {"type": "integer"}},
+            "required": ["client_id"],
+        },
+        "telemetry": {"properties": {"submission": {"type": "string"}}},
+    }
+    for metadata_format, schema in metadata.items():
+        path = schemas_dir / "metadata" / f"{metadata_format}-ingestion"
+        path.mkdir(parents=True)
+        path /= f"{metadata_format}-ingestion.1.schema.json"
+        path.write_text(json.dumps(schema))
+
+    tree = pipeline.SchemaTree(schemas_dir)
+    for i in range(6):
+        tree.add("app", f"ping-{i}", 1, ping_schema("app", f"ping_{i}", 1, a={}))
+    telemetry = ping_schema("telemetry", "main", 4, b={})
+    telemetry["mozPipelineMetadata"]["bq_metadata_format"] = "telemetry"
+    telemetry["required"] = ["b"]
+    tree.add("telemetry", "main", 4, telemetry)
+    tree.add("telemetry", "unstructured", 1, {"type": "object"})
+    tree.write()
+    return schemas_dir
+
+
+class TestMergeMetadata(object):
+    def read(self, schemas_dir):
+        return {
+            p.relative_to(schemas_dir): p.read_text()
+            for p in sorted(schemas_dir.rglob("*.schema.json"))
+        }
+
+    def test_same_as_script(self, tmp_path, schemas_dir):
+        expected_dir = tmp_path / "expected"
+        shutil.copytree(schemas_dir, expected_dir)
+        for path in sorted(expected_dir.rglob("*.schema.json")):
+            subprocess.run(
+                ("./bin/metadata_merge", expected_dir / "metadata", path),
+                check=True,
+                capture_output=True,
+            )
+
+        merged = pipeline.merge_metadata_dir(schemas_dir, schemas_dir / "metadata")
+
+        assert len(merged) == 7
+        assert self.read(schemas_dir) == self.read(expected_dir)
+
+        main = json.loads(
+            (schemas_dir / "telemetry" / "main" / "main.4.schema.json").read_text()
+        )
+        assert main["properties"] == {"b": {}, "submission": {"type": "string"}}
+        assert main["required"] == ["b"]
+
+    def test_workers(self, tmp_path, schemas_dir):
+        serial_dir = tmp_path / "serial"
+        shutil.copytree(schemas_dir, serial_dir)
+        pipeline.merge_metadata_dir(serial_dir, serial_dir / "metadata")
+
+        merged = pipeline.merge_metadata_dir(
+            schemas_dir, schemas_dir / "metadata", workers=2
+        )
+
+        assert merged == sorted(merged)
+        assert len(merged) == 7
+        assert self.read(schemas_dir) == self.read(serial_dir)
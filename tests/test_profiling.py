@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from click.testing import CliRunner
+
+from mozilla_schema_generator import __main__, output, profiling
+
+
+@pytest.fixture
+def profiler():
+    yield profiling.enable()
+    profiling.disable()
+
+
+@profiling.stage("inner")
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def test_disabled():
+    assert profiling.get_profiler() is None
+    with profiling.stage("outer"):
+        assert sleep(0) == 0
+
+
+def test_nested_stages(profiler):
+    with profiling.context(app="app"):
+        with profiling.stage("outer"), profiling.context(ping="ping"):
+            sleep(0.05)
+            sleep(0.05)
+
+    inner_calls, inner_wall, _ = profiler.stats[("inner", "app", "ping")]
+    outer_calls, outer_wall, _ = profiler.stats[("outer", "app", None)]
+    assert (inner_calls, outer_calls) == (2, 1)
+    assert inner_wall >= 0.1
+    # nested stages are not counted twice
+    assert outer_wall < 0.05
+    assert profiling.get_context() == (None, None)
+
+    summary = profiler.summary()
+    assert summary.index("inner") < summary.index("outer")
+
+
+def test_workers(profiler):
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(profiling.wrap(sleep), 0.01) for _ in range(4)]
+        assert [profiling.unwrap(f.result()) for f in futures] == [0.01] * 4
+
+    assert profiler.stats[("inner", None, None)][0] == 4
+
+
+def test_workers_forkserver():
+    # Workers of forkserver do not inherit the profiler of the parent
+    profiler = profiling.enable(trace=True, memory=True)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=2, mp_context=multiprocessing.get_context("forkserver")
+        ) as executor:
+            futures = [
+                executor.submit(profiling.wrap(retain), 1024 * 1024, [])
+                for _ in range(4)
+            ]
+            [profiling.unwrap(f.result()) for f in futures]
+    finally:
+        profiling.disable()
+
+    assert profiler.stats[("allocate", "app-1048576", None)][0] == 4
+    assert profiler.memory[("allocate", "app-1048576", None)][0] >= 2 * 1024 * 1024
+    assert len([e for e in profiler.events if e["name"] == "allocate"]) == 4
+
+
+def traced(seconds):
+    with profiling.context(ping="ping"), profiling.stage("fetch"):
+        profiling.annotate(cache="hit")
+        return sleep(seconds)
+
+
+def test_trace(tmp_path):
+    profiler = profiling.enable(trace=True)
+    try:
+        with profiling.context(app="app"):
+            traced(0)
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                futures = [
+                    executor.submit(profiling.wrap(traced), 0.01) for _ in range(4)
+                ]
+                [profiling.unwrap(f.result()) for f in futures]
+        profiler.write_trace(tmp_path / "trace.json")
+    finally:
+        profiling.disable()
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    assert {(e["cat"], e["name"]) for e in spans} == {
+        ("app", "app"),
+        ("ping", "ping"),
+        ("stage", "fetch"),
+        ("stage", "inner"),
+    }
+    fetch = [e for e in spans if e["name"] == "fetch"]
+    assert len(fetch) == 5
+    assert all(
+        e["args"] == {"app": "app", "ping": "ping", "cache": "hit"} for e in fetch
+    )
+    # workers are shown as separate processes
+    assert len({e["pid"] for e in fetch}) > 1
+    process_names = {
+        e["pid"]: e["args"]["name"] for e in events if e["name"] == "process_name"
+    }
+    assert process_names[os.getpid()] == "mozilla-schema-generator"
+    assert set(process_names.values()) == {"mozilla-schema-generator", "worker"}
+    assert len(process_names) == len({e["pid"] for e in spans})
+
+
+@profiling.stage("allocate")
+def allocate(size):
+    data = bytearray(size)
+    return len(data)
+
+
+def retain(size, retained):
+    with profiling.context(app=f"app-{size}"), profiling.stage("retain"):
+        retained.append(bytearray(size))
+        return allocate(size * 2)
+
+
+def test_memory():
+    profiler = profiling.enable(memory=True)
+    retained = []
+    try:
+        retain(1024 * 1024, retained)
+        retain(4 * 1024 * 1024, retained)
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(profiling.wrap(retain), 8 * 1024 * 1024, [])
+            profiling.unwrap(future.result())
+    finally:
+        profiling.disable()
+
+    mib = 1024 * 1024
+    allocate_peak, allocate_retained = profiler.memory[
+        ("allocate", "app-4194304", None)
+    ]
+    assert 8 * mib <= allocate_peak < 9 * mib
+    assert allocate_retained < mib
+    # the peak of nested stages is included
+    retain_peak, retain_retained = profiler.memory[("retain", "app-4194304", None)]
+    assert 12 * mib <= retain_peak < 13 * mib
+    assert 4 * mib <= retain_retained < 5 * mib
+    assert profiler.app_memory["app-1048576"][0] < 4 * mib
+    # worker processes
+    assert 24 * mib <= profiler.app_memory["app-8388608"][0] < 25 * mib
+
+    summary = profiler.summary()
+    assert "Memory by stage" in summary
+    assert summary.index("app-8388608") < summary.index("app-1048576")
+    assert profiler.top_allocations
+    assert "test_profiling.py" in summary
+
+
+def test_profile_option(tmp_path):
+    archive = tmp_path / "schemas.zip"
+    with output.ArchiveWriter(archive, tmp_path) as writer:
+        writer.write(tmp_path / "a" / "a.1.schema.json", {})
+
+    result = CliRunner().invoke(
+        __main__.main,
+        [
+            "--memory",
+            "--profile-dir",
+            str(tmp_path / "profile"),
+            "--trace-file",
+            str(tmp_path / "trace.json"),
+            "extract-archive",
+            str(archive),
+            "--out-dir",
+            str(tmp_path / "out"),
+        ],
+        catch_exceptions=False,
+    )
+
+    assert result.exit_code == 0
+    assert "Stage times" in result.output
+    assert "Memory by stage" in result.output
+    assert "write" in result.output
+    assert (tmp_path / "profile" / "extract-archive.prof").exists()
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    assert "write" in {event["name"] for event in trace["traceEvents"]}
+    assert profiling.get_profiler() is None
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import pytest
+
+from mozilla_schema_generator.repository_catalog import RepositoryCatalog
+
+
+@pytest.fixture
+def catalog():
+    return RepositoryCatalog(
+        [
+            {"name": "fenix", "app_id": "org-mozilla-fenix"},
+            {"name": "glean-core", "library_names": ["glean-core", "glean"]},
+            {"name": "firefox-desktop", "app_id": "firefox-desktop"},
+        ],
+        [
+            {"app_name": "fenix", "document_namespace": "org-mozilla-fenix"},
+            {"app_name": "fenix", "document_namespace": "org-mozilla-firefox"},
+        ],
+    )
+
+
+class TestRepositoryCatalog(object):
+    def test_app_repos(self, catalog):
+        assert [r["name"] for r in catalog.get_app_repos()] == [
+            "fenix",
+            "firefox-desktop",
+        ]
+
+    def test_lookups(self, catalog):
+        assert catalog.get_repo("firefox-desktop")["name"] == "firefox-desktop"
+        assert catalog.get_repo("glean-core") is None
+        assert catalog.get_repo_by_name("glean-core")["library_names"] == [
+            "glean-core",
+            "glean",
+        ]
+        assert catalog.get_library_repo_name("glean") == "glean-core"
+        assert catalog.get_library_repo_name("fenix") is None
+
+    def test_app_name(self, catalog):
+        assert catalog.get_app_name("org-mozilla-firefox") == "fenix"
+        assert catalog.get_app_name("firefox-desktop") is None
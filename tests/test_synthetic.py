@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+
+from mozilla_schema_generator import __main__
+from mozilla_schema_generator.common_ping import CommonPing
+from mozilla_schema_generator.generic_ping import GenericPing
+from mozilla_schema_generator.glean_ping import GleanPing
+
+from . import synthetic
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    runner = CliRunner()
+    result = runner.invoke(
+        synthetic.main,
+        [
+            str(tmp_path / "synthetic"),
+            "--apps=2",
+            "--metrics=50",
+            "--pings=2",
+            "--type-changes=0.5",
+            "--histograms=40",
+            "--scalars=20",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    with patch.object(GenericPing, "cache_dir", tmp_path / "synthetic" / "cache"):
+        yield tmp_path / "synthetic"
+
+
+def test_generate_deterministic():
+    kwargs = dict(apps=2, metrics=10, histograms=10, scalars=5)
+    assert synthetic.generate(**kwargs) == synthetic.generate(**kwargs)
+    assert synthetic.generate(**kwargs) != synthetic.generate(seed=1, **kwargs)
+
+
+def test_generate_scale():
+    documents = synthetic.generate(
+        apps=3, metrics=20, pings=5, libraries=4, dependencies=2, histograms=30
+    )
+    repos = json.loads(documents[GleanPing.repos_url])
+    assert len([repo for repo in repos if "app_id" in repo]) == 3
+    assert len([repo for repo in repos if "library_names" in repo]) == 5
+
+    app_metrics = json.loads(
+        documents[GleanPing.probes_url_template.format("synthetic-app-0")]
+    )
+    assert len(app_metrics) == 20
+    assert all(len(metric["history"]) == 3 for metric in app_metrics.values())
+    pings = json.loads(documents[GleanPing.ping_url_template.format("synthetic-app-0")])
+    assert len(pings) == 5
+    dependencies = json.loads(
+        documents[GleanPing.dependencies_url_template.format("synthetic-app-0")]
+    )
+    assert len(dependencies) == 3
+
+    all_probes = json.loads(documents[CommonPing.probes_url])
+    assert len([p for p in all_probes.values() if p["type"] == "histogram"]) == 30
+
+
+def test_glean_pings(dataset, tmp_path):
+    out_dir = tmp_path / "out"
+    result = CliRunner().invoke(
+        __main__.main,
+        ["generate-glean-pings", "--out-dir", str(out_dir)],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+
+    app_dir = out_dir / "org-mozilla-synthetic-app-0"
+    pings = {path.name for path in app_dir.iterdir()}
+    assert {"ping-0", "ping-1", "metrics", "baseline", "events"} <= pings
+    schema = json.loads((app_dir / "metrics" / "metrics.1.schema.json").read_text())
+    metrics = schema["properties"]["metrics"]["properties"]
+    assert any(metric_type["properties"] for metric_type in metrics.values())
+
+    # metrics whose type changed are in the sections of both types
+    url = GleanPing.probes_url_template.format("synthetic-app-0")
+    app_metrics = json.loads(
+        (dataset / "cache" / GenericPing._slugify(url)).read_text()
+    )
+    changed = [
+        name
+        for name, metric in app_metrics.items()
+        if "metrics" in metric["history"][0]["send_in_pings"]
+        and metric["history"][0]["type"] != metric["type"]
+        and metric["type"] in metrics
+    ]
+    assert changed
+    name = changed[0]
+    old_type = app_metrics[name]["history"][0]["type"]
+    assert name in metrics[app_metrics[name]["type"]]["properties"]
+    assert name in metrics[old_type]["properties"]
+
+
+def test_main_and_common_pings(dataset, tmp_path):
+    out_dir = tmp_path / "out"
+    runner = CliRunner()
+    result = runner.invoke(
+        __main__.main,
+        ["generate-main-ping", "--out-dir", str(out_dir)],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    schema = json.loads((out_dir / "main" / "main.4.schema.json").read_text())
+    assert schema["properties"]["payload"]["properties"]["histograms"]["properties"]
+
+    result = runner.invoke(
+        __main__.main,
+        [
+            "generate-common-pings",
+            "--out-dir",
+            str(out_dir),
+            "--common-pings-config",
+            str(dataset / "common_pings.json"),
+        ],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    for name in synthetic.common_ping_names(3):
+        assert (out_dir / name / f"{name}.4.schema.json").exists()
+
+
+def test_glean_manifest(dataset, tmp_path):
+    # Changes to the repository or app listing of one app leave the others current
+    out_dir = tmp_path / "out"
+    manifest = tmp_path / "manifest.json"
+    args = [
+        "generate-glean-pings",
+        "--out-dir",
+        str(out_dir),
+        "--manifest",
+        str(manifest),
+    ]
+
+    def run():
+        result = CliRunner().invoke(__main__.main, args, catch_exceptions=False)
+        assert result.exit_code == 0
+        entries = json.loads(manifest.read_text())
+        return {key: entry["fingerprint"] for key, entry in entries.items()}
+
+    before = run()
+    listings_cache = (
+        dataset / "cache" / GenericPing._slugify(GleanPing.app_listings_url)
+    )
+    listings = json.loads(listings_cache.read_text())
+    listings[1]["canonical_app_name"] = "Renamed"
+    listings_cache.write_text(json.dumps(listings))
+    GleanPing.set_shared_inputs(None, None)
+    after = run()
+
+    app_0 = "glean/org-mozilla-synthetic-app-0"
+    app_1 = "glean/org-mozilla-synthetic-app-1"
+    assert after[app_0] == before[app_0]
+    assert after[app_1] != before[app_1]